@@ -1,14 +1,17 @@
 import os
 import sqlite3
 import json
-import tempfile
+import base64
 import traceback
 import asyncio
 import inspect
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_EXCEPTION, wait as wait_futures
 from pathlib import Path
-from fastapi import APIRouter, File as FastAPIFile, HTTPException, UploadFile, Form, Query, Depends, Request
+from fastapi import APIRouter, HTTPException, Form, Query, Depends, Request
 from pydantic import BaseModel
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, selectinload
 from sqlalchemy import text
 
 import hashlib
@@ -17,17 +20,45 @@ import secrets
 from datetime import datetime
 
 import pandas as pd
-from fastapi.responses import JSONResponse, PlainTextResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse, Response
 from fastapi import Request
 
 try:
-    from app.database import get_db, User, Prompt, Project, File, FileTable, engine, SessionLocal
+    from app.database import get_db, User, Prompt, Project, File, FileTable, IngestCheckpoint, FileStat, engine, SessionLocal
     from app.databasemanager import DatabaseManager
     from app.auth import create_access_token, decode_access_token
     from app.config import settings
-
-    from scripts.import_db import stream_zst_to_postgres
-    from scripts.filter_db import filter_posts_with_ai, filter_comments_with_ai
+    from app.jobs import IngestJob, submit_job, get_job, list_jobs
+    from app.catalog import schema_tables, table_exists, table_columns, invalidate_schema
+    from app.metadata_versions import metadata_version
+    from app.responses import FastJSONResponse, stream_json_rows, JSON_STREAM_ROWS
+    from app.uploads import receive_form_to_disk, discard_uploads
+
+    from scripts.import_db import (
+        stream_zst_to_postgres,
+        create_file_tables,
+        finalize_file_tables,
+        index_sql,
+        THREAD_INDEX_COLUMNS,
+        REPLY_INDEX_COLUMNS,
+        create_search_indexes,
+        search_index_sql,
+        search_vector_sql,
+        SEARCH_CONFIG,
+        SEARCH_TEXT_COLUMNS,
+        detect_data_type,
+        sniff_input_format,
+        UnsupportedInputFormat,
+        IngestCancelled,
+        LOADERS as IMPORT_LOADERS,
+    )
+    from scripts.ingest_parse import parse_filter_spec
+    from scripts.export_db import stream_table_export, EXPORT_FORMATS
+    from scripts.sample_db import parse_sample_spec, sample_query, materialize_sample
+    from scripts.llm_cache import cache_stats as llm_cache_stats
+    from scripts.lexical_prefilter import query_terms, select_candidates
+    from scripts.filter_verdicts import discard_verdicts
+    from scripts.filter_db import filter_rows_incremental, format_post, format_comment, FILTER_CONCURRENCY
     from scripts.codebook_generator import (
         generate_codebook as generate_codebook_function,
         compare_agreement as compare_agreement_function,
@@ -38,16 +69,44 @@ try:
     )
     from scripts.codebook_apply import classify_posts
     from scripts.display_codebook import parse_codebook_to_json
-    from app.services import migrate_sqlite_file
+    from app.services import migrate_sqlite_file, refresh_file_stats, discount_file_stats
 except:
     try:
-        from backend.app.database import get_db, User, Prompt, Project, File, FileTable, engine, SessionLocal
+        from backend.app.database import get_db, User, Prompt, Project, File, FileTable, IngestCheckpoint, FileStat, engine, SessionLocal
         from backend.app.databasemanager import DatabaseManager
         from backend.app.auth import create_access_token, decode_access_token
         from backend.app.config import settings
-
-        from backend.scripts.import_db import stream_zst_to_postgres
-        from backend.scripts.filter_db import filter_posts_with_ai, filter_comments_with_ai
+        from backend.app.jobs import IngestJob, submit_job, get_job, list_jobs
+        from backend.app.catalog import schema_tables, table_exists, table_columns, invalidate_schema
+        from backend.app.metadata_versions import metadata_version
+        from backend.app.responses import FastJSONResponse, stream_json_rows, JSON_STREAM_ROWS
+        from backend.app.uploads import receive_form_to_disk, discard_uploads
+
+        from backend.scripts.import_db import (
+            stream_zst_to_postgres,
+            create_file_tables,
+            finalize_file_tables,
+            index_sql,
+            THREAD_INDEX_COLUMNS,
+            REPLY_INDEX_COLUMNS,
+            create_search_indexes,
+            search_index_sql,
+            search_vector_sql,
+            SEARCH_CONFIG,
+            SEARCH_TEXT_COLUMNS,
+            detect_data_type,
+            sniff_input_format,
+            UnsupportedInputFormat,
+            IngestCancelled,
+            LOADERS as IMPORT_LOADERS,
+        )
+        from backend.scripts.ingest_parse import parse_filter_spec
+        from backend.scripts.export_db import stream_table_export, EXPORT_FORMATS
+        from backend.scripts.sample_db import parse_sample_spec, sample_query, materialize_sample
+        from backend.scripts.llm_cache import cache_stats as llm_cache_stats
+        from backend.scripts.lexical_prefilter import query_terms, select_candidates
+        from backend.scripts.filter_verdicts import discard_verdicts
+        from backend.scripts.filter_db import filter_rows_incremental, format_post, format_comment, FILTER_CONCURRENCY
         from backend.scripts.codebook_generator import (
             generate_codebook as generate_codebook_function,
             compare_agreement as compare_agreement_function,
@@ -58,13 +117,18 @@ except:
         )
         from backend.scripts.codebook_apply import classify_posts
         from backend.scripts.display_codebook import parse_codebook_to_json
-        from backend.app.services import migrate_sqlite_file
+        from backend.app.services import migrate_sqlite_file, refresh_file_stats, discount_file_stats
     except Exception as exc:
         print("Failed", exc)
         raise exc
 
 router = APIRouter()
 
+# Dumps of one /upload-dumps/ job that are loaded at the same time
+MULTI_DUMP_CONCURRENCY = 4
+# Stripped from uploaded dump names to derive the default display name
+DUMP_EXTENSIONS = ('.zst', '.gz', '.bz2', '.xz', '.ndjson', '.jsonl', '.json')
+
 
 def get_user_id_from_request(request: Request):
     """Extract access token from cookie or Authorization header and decode it.
@@ -92,19 +156,29 @@ def get_user_id_from_request(request: Request):
 
     return payload.get("sub")
 
-@router.post("/upload-zst/")
-async def upload_zst_file(
-    request: Request,
-    file: UploadFile = FastAPIFile(...), 
-    subreddits: str = Form(None),
-    data_type: str = Form(...),
-    name: str = Form(None),
-    description: str = Form(None),
-    project_id: int = Form(None),
-):
+def strip_dump_extensions(filename: str) -> str:
+    """Drop trailing dump extensions, e.g. 'RC_2023-01.ndjson.gz' -> 'RC_2023-01'."""
+    base = filename
+    while True:
+        stem, ext = os.path.splitext(base)
+        if not stem or ext.lower() not in DUMP_EXTENSIONS:
+            return base
+        base = stem
+
 
-    if not file.filename.endswith('.zst'):
-        raise HTTPException(status_code=400, detail="File must be a .zst file")
+def parse_ingest_options(form) -> dict:
+    """Validate the import options shared by /upload-zst/ and /upload-dumps/.
+
+    Reads `subreddits` (JSON list), `name`, `description`, `project_id`,
+    `loader`, `workers`, `deferred` (load unindexed UNLOGGED tables, then
+    build the key and indexes) and `filters` (JSON row filter spec, see
+    scripts.ingest_parse.parse_filter_spec) from the multipart form; raises
+    HTTPException(400) on invalid values.
+    """
+    subreddits = form.get("subreddits")
+    project_id = form.get("project_id")
+    loader = form.get("loader") or "insert"
+    workers = form.get("workers")
 
     subreddit_list = None
     if subreddits:
@@ -113,137 +187,568 @@ async def upload_zst_file(
         except json.JSONDecodeError:
             raise HTTPException(status_code=400, detail="Invalid subreddits format")
 
-    allowed = ("comments", "posts")
-    if data_type not in allowed:
-        raise HTTPException(status_code=400, detail="data_type must be 'posts' or 'comments'")
-    import_data_type = "submissions" if data_type == "posts" else data_type
+    if loader not in IMPORT_LOADERS:
+        raise HTTPException(status_code=400, detail=f"loader must be one of: {', '.join(IMPORT_LOADERS)}")
 
-    # Save upload to a temporary .zst file
     try:
-        content = await file.read()
-        with tempfile.NamedTemporaryFile(suffix='.zst', delete=False) as tmp:
-            tmp.write(content)
-            tmp_path = tmp.name
-    except Exception as exc:
-        raise HTTPException(status_code=500, detail=f"Failed to save uploaded file: {exc}")
-
-    # Resolve authenticated user from token
-    user_id = get_user_id_from_request(request)
+        workers = int(workers) if workers not in (None, "") else 0
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="workers must be an integer")
+    if workers < 0 or workers > (os.cpu_count() or 1):
+        raise HTTPException(status_code=400, detail=f"workers must be between 0 and {os.cpu_count() or 1}")
+    if workers > 1 and loader != "copy":
+        raise HTTPException(status_code=400, detail="workers > 1 requires loader 'copy'")
+
+    if project_id in (None, ""):
+        project_id = None
+    else:
+        try:
+            project_id = int(project_id)
+        except (TypeError, ValueError):
+            raise HTTPException(status_code=400, detail="project_id must be an integer")
 
-    response_data = {
-        "status": "processing",
-        "file_name": file.filename,
-        "authenticated": bool(user_id),
+    filters = form.get("filters")
+    try:
+        filter_spec = parse_filter_spec(json.loads(filters)) if filters else {}
+    except json.JSONDecodeError:
+        raise HTTPException(status_code=400, detail="Invalid filters format")
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+    return {
+        "subreddit_list": subreddit_list,
+        "name": form.get("name"),
+        "description": form.get("description"),
+        "project_id": project_id,
+        "loader": loader,
+        "workers": workers,
+        "deferred": str(form.get("deferred") or "").lower() in ("1", "true", "yes", "on"),
+        "filters": filter_spec,
     }
 
-    # If unauthenticated, reject the request
+
+def check_target_project(project_id, user_id: int):
+    """Raise 404/403 unless `project_id` is None or a project owned by the user."""
+    if project_id is None:
+        return
+    with DatabaseManager() as dm:
+        proj = dm.session.query(Project).filter(Project.id == int(project_id)).first()
+        if proj is None:
+            raise HTTPException(status_code=404, detail="Project not found")
+        if proj.user_id != user_id:
+            raise HTTPException(status_code=403, detail="Forbidden: project does not belong to user")
+
+
+@router.post("/upload-zst/")
+async def upload_zst_file(request: Request):
+    """Import a Pushshift dump into a new file schema as a background job.
+
+    The dump may be zstd, gzip, bz2 or xz compressed NDJSON, or plain NDJSON;
+    the format is detected from its leading bytes, not its extension. Expects
+    multipart/form-data with `file`, `data_type` ('posts' or 'comments') and
+    optional `subreddits` (JSON list), `name`, `description`, `project_id`,
+    `loader`, `workers` (parse processes for the pipelined copy loader),
+    `deferred` and `filters` (see parse_ingest_options). The caller is authenticated before the body is read, and the dump
+    is streamed once, straight into settings.upload_dir (see app.uploads).
+
+    Responds 202 with a `job_id` to poll at /ingest-jobs/{job_id}. Progress is
+    checkpointed, so an interrupted import can be continued through
+    /ingest-checkpoints/{schema_name}/resume.
+    """
+    # Resolve authenticated user from token before touching the request body
+    user_id = get_user_id_from_request(request)
     if not user_id:
+        raise HTTPException(status_code=401, detail="Unauthenticated")
+
+    # Keep the upload until its import completes so the import can be resumed
+    form = await receive_form_to_disk(request, settings.upload_dir)
+    try:
+        file = form.get("file")
+        data_type = form.get("data_type")
+
+        if file is None or isinstance(file, str) or not file.filename:
+            raise HTTPException(status_code=400, detail="A dump file is required")
+
+        allowed = ("comments", "posts")
+        if data_type not in allowed:
+            raise HTTPException(status_code=400, detail="data_type must be 'posts' or 'comments'")
+        import_data_type = "submissions" if data_type == "posts" else data_type
+
+        options = parse_ingest_options(form)
+        subreddit_list = options["subreddit_list"]
+        name = options["name"]
+        description = options["description"]
+        project_id = options["project_id"]
+        loader = options["loader"]
+        workers = options["workers"]
+        deferred = options["deferred"]
+        tmp_path = file.path
+        # Only the dump is kept; stray file parts are dropped with the form
+        discard_uploads(upload for _, upload in form.multi_items() if upload is not file)
+    except BaseException:
+        discard_uploads(form)
+        raise
+    finally:
+        await form.close()
+
+    # Only the first few bytes are read here; the import itself reads the data once
+    try:
+        input_format = sniff_input_format(tmp_path)
+    except UnsupportedInputFormat as exc:
         try:
             os.unlink(tmp_path)
         except Exception:
             pass
-        raise HTTPException(status_code=401, detail="Unauthenticated")
+        raise HTTPException(status_code=400, detail=str(exc))
 
-    # Authenticated path: create Postgres schema, tables and stream-insert rows
-    base_name = name if name is not None else file.filename.replace('.zst', '')
+    # Authenticated path: validate the target project now, then create the
+    # Postgres schema, tables and stream-insert rows in a background job
+    base_name = name if name is not None else strip_dump_extensions(file.filename)
     unique_id = secrets.token_hex(6)
     schema_name = f"proj_{unique_id}"
-    inserted_counts = {"submissions": 0, "comments": 0}
+    uid = int(user_id)
 
     try:
-        with DatabaseManager() as dm:
-            # Create a File record instead of a Project; files back a Postgres schema
-            file_rec = File(user_id=int(user_id), filename=base_name, schemaname=schema_name, file_type="raw_data", description=(description or None))
-            dm.session.add(file_rec)
-            try:
+        check_target_project(project_id, uid)
+    except HTTPException:
+        try:
+            os.unlink(tmp_path)
+        except Exception:
+            pass
+        raise
+
+    # The checkpoint row carries everything needed to run (or resume) the import
+    with DatabaseManager() as dm:
+        dm.session.add(IngestCheckpoint(
+            schemaname=schema_name,
+            user_id=uid,
+            file_path=tmp_path,
+            data_type=import_data_type,
+            subreddit_filter=json.dumps(subreddit_list) if subreddit_list else None,
+            params=json.dumps({
+                "file_name": file.filename,
+                "display_name": base_name,
+                "description": description or None,
+                "project_id": project_id,
+                "loader": loader,
+                "workers": workers,
+                "deferred": deferred,
+                "filters": options["filters"],
+            }),
+            status="queued",
+        ))
+
+    job = start_ingest_job(uid, schema_name, file.filename, tmp_path)
+
+    return JSONResponse({
+        "status": "processing",
+        "job_id": job.id,
+        "file_name": file.filename,
+        "input_format": input_format,
+        "display_name": base_name,
+        "schema_name": schema_name,
+        "authenticated": True,
+    }, status_code=202)
+
+
+def register_ingested_file(dm, user_id: int, schema_name: str, display_name: str, description, project_id, row_counts: dict):
+    """Create the File record of an imported schema, link it to `project_id`
+    and record its table row counts. Returns the (flushed) File."""
+    # Create a File record instead of a Project; files back a Postgres schema
+    file_rec = File(user_id=user_id, filename=display_name, schemaname=schema_name, file_type="raw_data", description=(description or None))
+    dm.session.add(file_rec)
+    dm.session.flush()
+    if project_id is not None:
+        try:
+            proj = dm.session.query(Project).filter(Project.id == int(project_id), Project.user_id == user_id).first()
+            if proj is not None:
+                file_rec.projects.append(proj)
                 dm.session.flush()
+        except Exception:
+            # If anything goes wrong with linking, continue without linking
+            print(f"[ingest] Failed to link {schema_name} to project {project_id}")
+
+    # add file_tables metadata
+    for table_name in ('submissions', 'comments'):
+        if row_counts.get(table_name, 0) > 0:
+            dm.file_tables.add_table_metadata(
+                file_id=file_rec.id,
+                table_name=table_name,
+                row_count=row_counts.get(table_name, 0)
+            )
+    return file_rec
+
+
+def start_ingest_job(user_id: int, schema_name: str, file_name: str, file_path: str, resume: bool = False) -> IngestJob:
+    """Submit the checkpointed import of `schema_name` to the ingest pool."""
+    try:
+        total_bytes = os.path.getsize(file_path)
+    except OSError:
+        total_bytes = 0
+    job = IngestJob(user_id, schema_name, file_name=file_name, total_bytes=total_bytes)
+    # Failed imports keep their schema, upload and checkpoint so they can be resumed
+    submit_job(job, lambda job: run_file_ingest(job, resume=resume), on_cancel=lambda job: discard_ingest(job.schema_name))
+    return job
+
+
+def update_file_stats(schema_name: str):
+    """Recompute a file schema's facet aggregates; failures are logged, not raised."""
+    try:
+        refresh_file_stats(schema_name)
+    except Exception as exc:
+        print(f"Warning: could not refresh facet stats for {schema_name}: {exc}")
+
+
+def run_file_ingest(job, resume: bool = False) -> dict:
+    """Job target: import the upload recorded in the job schema's checkpoint, then
+    register the File, its project link and its table metadata."""
+    schema_name = job.schema_name
+    with DatabaseManager() as dm:
+        checkpoint = dm.session.get(IngestCheckpoint, schema_name)
+        if checkpoint is None:
+            raise RuntimeError(f"No ingest checkpoint for {schema_name}")
+        file_path = checkpoint.file_path
+        data_type = checkpoint.data_type
+        subreddit_list = json.loads(checkpoint.subreddit_filter) if checkpoint.subreddit_filter else None
+        params = json.loads(checkpoint.params or "{}")
+
+    base_name = params.get("display_name") or schema_name
+    description = params.get("description")
+    project_id = params.get("project_id")
+    uid = job.user_id
+
+    inserted_counts = stream_zst_to_postgres(
+        file_path, schema_name, data_type,
+        subreddit_filter=subreddit_list,
+        loader=params.get("loader") or "insert",
+        progress=job,
+        workers=params.get("workers") or 0,
+        checkpoint=True,
+        resume=resume,
+        deferred=bool(params.get("deferred")),
+        filter_spec=params.get("filters"),
+    )
+    create_search_indexes(schema_name)
+    update_file_stats(schema_name)
+
+    with DatabaseManager() as dm:
+        file_rec = register_ingested_file(dm, uid, schema_name, base_name, description, project_id, inserted_counts)
+        # The import is registered; its checkpoint goes in the same commit
+        dm.session.query(IngestCheckpoint).filter(IngestCheckpoint.schemaname == schema_name).delete()
+
+    try:
+        os.unlink(file_path)
+    except Exception:
+        pass
+
+    return {
+        'file': {"id": str(file_rec.id), "schema_name": schema_name, "display_name": base_name},
+        'display_name': base_name,
+        'description': (description or None),
+        'schema_name': schema_name,
+        'inserted_counts': inserted_counts,
+    }
+
+
+def discard_ingest(schema_name: str):
+    """Drop the schema, checkpoint and stored upload of a cancelled or abandoned import."""
+    with engine.begin() as conn:
+        conn.execute(text(f'DROP SCHEMA IF EXISTS "{schema_name}" CASCADE'))
+    invalidate_schema(schema_name)
+    with DatabaseManager() as dm:
+        checkpoint = dm.session.get(IngestCheckpoint, schema_name)
+        if checkpoint is not None:
+            try:
+                os.unlink(checkpoint.file_path)
             except Exception:
-                dm.session.rollback()
-                raise
-            # If a project_id was provided, ensure ownership and link the file to the project
-            if project_id is not None:
+                pass
+            dm.session.delete(checkpoint)
+    print(f"[ingest] Discarded schema {schema_name}")
+
+
+def remove_files(paths):
+    for path in paths:
+        try:
+            os.unlink(path)
+        except Exception:
+            pass
+
+
+@router.post("/upload-dumps/")
+async def upload_dumps(request: Request):
+    """Import several Pushshift dumps, e.g. a month's RS_ and RC_ files, into one file schema.
+
+    Expects multipart/form-data with one or more `files` and the optional
+    options of /upload-zst/ (see parse_ingest_options). Each dump's data type
+    comes from its RS_/RC_ name or, failing that, from the keys of its first
+    records. The dumps are loaded concurrently in one background job, and the
+    File and its table row counts are registered once all of them have loaded.
+
+    Responds 202 with a `job_id`. These imports are not checkpointed; a failed
+    or cancelled job drops its schema.
+    """
+    user_id = get_user_id_from_request(request)
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Unauthenticated")
+    uid = int(user_id)
+
+    form = await receive_form_to_disk(request, settings.upload_dir)
+    saved = []
+    try:
+        try:
+            uploads = [f for f in form.getlist("files") if not isinstance(f, str) and f.filename]
+            if not uploads:
+                raise HTTPException(status_code=400, detail="At least one dump file is required")
+            options = parse_ingest_options(form)
+            saved = [(upload.filename, upload.path) for upload in uploads]
+            discard_uploads(upload for _, upload in form.multi_items() if not any(upload is u for u in uploads))
+        except BaseException:
+            discard_uploads(form)
+            raise
+        finally:
+            await form.close()
+
+        dumps = []
+        for file_name, path in saved:
+            try:
+                input_format = sniff_input_format(path)
+            except UnsupportedInputFormat as exc:
+                raise HTTPException(status_code=400, detail=f"{file_name}: {exc}")
+            data_type = detect_data_type(path, file_name)
+            if data_type is None:
+                raise HTTPException(status_code=400, detail=f"{file_name}: could not tell whether it holds submissions or comments")
+            dumps.append({"file_name": file_name, "path": path, "format": input_format, "data_type": data_type})
+
+        check_target_project(options["project_id"], uid)
+    except HTTPException:
+        remove_files(path for _, path in saved)
+        raise
+
+    schema_name = f"proj_{secrets.token_hex(6)}"
+    if options["name"] is not None:
+        base_name = options["name"]
+    else:
+        base_name = " + ".join(strip_dump_extensions(d["file_name"]) for d in dumps)
+
+    def run_multi_import(job):
+        try:
+            # Create the tables once up front so the concurrent loads never race on DDL
+            with engine.begin() as conn:
+                create_file_tables(conn, schema_name, deferred=options["deferred"])
+            invalidate_schema(schema_name)
+
+            # A failing load stops its siblings instead of letting them run to the end
+            stop = threading.Event()
+
+            def load(index, dump):
                 try:
-                    proj = dm.session.query(Project).filter(Project.id == int(project_id)).first()
-                    if proj is None:
-                        raise HTTPException(status_code=404, detail="Project not found")
-                    # ensure the project belongs to the authenticated user
-                    try:
-                        uid = int(user_id)
-                    except Exception:
-                        uid = None
-                    if proj.user_id != uid:
-                        raise HTTPException(status_code=403, detail="Forbidden: project does not belong to user")
-                    # create association
-                    file_rec.projects.append(proj)
-                    dm.session.flush()
-                except HTTPException:
-                    raise
+                    return stream_zst_to_postgres(
+                        dump["path"], schema_name, dump["data_type"],
+                        subreddit_filter=options["subreddit_list"],
+                        loader=options["loader"],
+                        progress=job.part(index, stop=stop),
+                        workers=options["workers"],
+                        deferred=options["deferred"],
+                        finalize=False,
+                        filter_spec=options["filters"],
+                    )
                 except Exception:
-                    # If anything goes wrong with linking, roll back and continue without linking
-                    dm.session.rollback()
-            # create schema and tables
-            with engine.begin() as conn:
-                conn.execute(text(f'CREATE SCHEMA IF NOT EXISTS "{schema_name}"'))
-                conn.execute(text(f'''
-                CREATE TABLE IF NOT EXISTS "{schema_name}"."submissions" (
-                    id TEXT PRIMARY KEY,
-                    subreddit TEXT,
-                    title TEXT,
-                    selftext TEXT,
-                    author TEXT,
-                    created_utc BIGINT,
-                    score INTEGER,
-                    num_comments INTEGER
-                )
-                '''))
-                conn.execute(text(f'''
-                CREATE TABLE IF NOT EXISTS "{schema_name}"."comments" (
-                    id TEXT PRIMARY KEY,
-                    subreddit TEXT,
-                    body TEXT,
-                    author TEXT,
-                    created_utc BIGINT,
-                    score INTEGER,
-                    link_id TEXT,
-                    parent_id TEXT
-                )
-                '''))
-
-            inserted_counts = stream_zst_to_postgres(tmp_path, schema_name, import_data_type, subreddit_filter=subreddit_list, batch_size=1000)
-
-            # add file_tables metadata
-            if inserted_counts.get('submissions', 0) > 0:
-                dm.file_tables.add_table_metadata(
-                    file_id=file_rec.id,
-                    table_name='submissions',
-                    row_count=inserted_counts.get('submissions', 0)
-                )
-            if inserted_counts.get('comments', 0) > 0:
-                dm.file_tables.add_table_metadata(
-                    file_id=file_rec.id,
-                    table_name='comments',
-                    row_count=inserted_counts.get('comments', 0)
-                )
-
-            response_data.update({
-                'status': 'completed',
+                    stop.set()
+                    raise
+
+            with ThreadPoolExecutor(max_workers=min(len(dumps), MULTI_DUMP_CONCURRENCY), thread_name_prefix="ingest-dump") as pool:
+                futures = [pool.submit(load, index, dump) for index, dump in enumerate(dumps)]
+                wait_futures(futures, return_when=FIRST_EXCEPTION)
+            failures = [f.exception() for f in futures if f.exception() is not None]
+            if failures:
+                # Report the load that failed first, not the siblings it stopped
+                raise next((e for e in failures if not isinstance(e, IngestCancelled)), failures[0])
+            results = [f.result() for f in futures]
+
+            # Dumps may share ids (later occurrences win), so count the merged tables
+            if options["deferred"]:
+                finalized = finalize_file_tables(schema_name)
+                totals = {table_name: finalized[table_name] for table_name in ('submissions', 'comments')}
+            else:
+                totals = {}
+                with engine.connect() as conn:
+                    for table_name in ('submissions', 'comments'):
+                        totals[table_name] = int(conn.execute(text(f'SELECT count(*) FROM "{schema_name}"."{table_name}"')).scalar() or 0)
+            create_search_indexes(schema_name)
+            update_file_stats(schema_name)
+
+            with DatabaseManager() as dm:
+                file_rec = register_ingested_file(dm, uid, schema_name, base_name, options["description"], options["project_id"], totals)
+
+            return {
+                'file': {"id": str(file_rec.id), "schema_name": schema_name, "display_name": base_name},
                 'display_name': base_name,
-                'description': (description or None),
+                'description': (options["description"] or None),
                 'schema_name': schema_name,
-                'inserted_counts': inserted_counts,
-            })
-            return JSONResponse(response_data)
-
-    except Exception as exc:
-        import traceback
-        traceback.print_exc()
-        return JSONResponse({"error": str(exc)}, status_code=500)
+                'inserted_counts': totals,
+                'dumps': [
+                    {
+                        "file_name": dump["file_name"],
+                        "data_type": dump["data_type"],
+                        "format": dump["format"],
+                        "rows": result.get(dump["data_type"], 0),
+                        "stats": result.get("stats"),
+                    }
+                    for dump, result in zip(dumps, results)
+                ],
+            }
+        finally:
+            remove_files(dump["path"] for dump in dumps)
 
-    finally:
+    total_bytes = 0
+    for dump in dumps:
         try:
-            os.unlink(tmp_path)
-        except Exception:
+            total_bytes += os.path.getsize(dump["path"])
+        except OSError:
             pass
+    job = IngestJob(uid, schema_name, file_name=", ".join(d["file_name"] for d in dumps), total_bytes=total_bytes)
+    submit_job(job, run_multi_import,
+               on_cancel=lambda job: discard_ingest(job.schema_name),
+               on_failure=lambda job: discard_ingest(job.schema_name))
+
+    return JSONResponse({
+        "status": "processing",
+        "job_id": job.id,
+        "display_name": base_name,
+        "schema_name": schema_name,
+        "dumps": [{"file_name": d["file_name"], "data_type": d["data_type"], "format": d["format"]} for d in dumps],
+        "authenticated": True,
+    }, status_code=202)
+
+
+def get_owned_job(request: Request, job_id: str):
+    """Return the ingest job `job_id` if it belongs to the authenticated user."""
+    user_id = get_user_id_from_request(request)
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    job = get_job(job_id)
+    if job is None or job.user_id != int(user_id):
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@router.get("/ingest-jobs/")
+def list_ingest_jobs(request: Request):
+    """List the authenticated user's ingest jobs, newest first."""
+    user_id = get_user_id_from_request(request)
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    return JSONResponse({"jobs": [job.snapshot() for job in list_jobs(int(user_id))]})
+
+
+@router.get("/ingest-jobs/{job_id}")
+def get_ingest_job(job_id: str, request: Request):
+    """Report progress for an ingest job: compressed bytes consumed, lines parsed,
+    rows kept by the subreddit filter, rows inserted, current rows/sec and ETA."""
+    job = get_owned_job(request, job_id)
+    return JSONResponse(job.snapshot())
+
+
+@router.post("/ingest-jobs/{job_id}/cancel")
+def cancel_ingest_job(job_id: str, request: Request):
+    """Cancel a queued or running ingest job; its schema is dropped once it stops."""
+    job = get_owned_job(request, job_id)
+    if job.finished:
+        return JSONResponse({"error": f"Job already {job.status}", **job.snapshot()}, status_code=409)
+    job.cancel()
+    return JSONResponse(job.snapshot())
+
+
+def active_ingest_job(user_id: int, schema_name: str):
+    """Return the user's unfinished ingest job for `schema_name`, if any."""
+    for job in list_jobs(user_id):
+        if job.schema_name == schema_name and not job.finished:
+            return job
+    return None
+
+
+def get_owned_checkpoint(request: Request, schema_name: str):
+    """Return (user_id, checkpoint) for an ingest checkpoint owned by the caller."""
+    user_id = get_user_id_from_request(request)
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    uid = int(user_id)
+    with DatabaseManager() as dm:
+        checkpoint = dm.session.get(IngestCheckpoint, schema_name)
+    if checkpoint is None or checkpoint.user_id != uid:
+        raise HTTPException(status_code=404, detail="Checkpoint not found")
+    return uid, checkpoint
+
+
+def checkpoint_summary(checkpoint, user_id: int) -> dict:
+    params = json.loads(checkpoint.params or "{}")
+    job = active_ingest_job(user_id, checkpoint.schemaname)
+    return {
+        "schema_name": checkpoint.schemaname,
+        "file_name": params.get("file_name"),
+        "display_name": params.get("display_name"),
+        "data_type": checkpoint.data_type,
+        "status": checkpoint.status,
+        "error": checkpoint.error,
+        "lines_committed": checkpoint.lines_committed,
+        "bytes_committed": checkpoint.bytes_committed,
+        "batches_committed": checkpoint.batches_committed,
+        "rows_committed": checkpoint.rows_committed,
+        "updated_at": checkpoint.updated_at.isoformat() if checkpoint.updated_at else None,
+        "upload_available": os.path.exists(checkpoint.file_path),
+        "active_job_id": job.id if job is not None else None,
+    }
+
+
+@router.get("/ingest-checkpoints/")
+def list_ingest_checkpoints(request: Request):
+    """List the caller's unfinished imports, with their last committed checkpoint."""
+    user_id = get_user_id_from_request(request)
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    uid = int(user_id)
+    with DatabaseManager() as dm:
+        checkpoints = (
+            dm.session.query(IngestCheckpoint)
+            .filter(IngestCheckpoint.user_id == uid)
+            .order_by(IngestCheckpoint.created_at.desc())
+            .all()
+        )
+    return JSONResponse({"checkpoints": [checkpoint_summary(cp, uid) for cp in checkpoints]})
+
+
+@router.post("/ingest-checkpoints/{schema_name}/resume")
+def resume_ingest(schema_name: str, request: Request):
+    """Continue an interrupted import from its last committed batch, into the same schema."""
+    uid, checkpoint = get_owned_checkpoint(request, schema_name)
+    if active_ingest_job(uid, schema_name) is not None:
+        raise HTTPException(status_code=409, detail="An import for this schema is already running")
+    if not os.path.exists(checkpoint.file_path):
+        raise HTTPException(status_code=410, detail="The uploaded file is no longer available; discard this import instead")
+
+    params = json.loads(checkpoint.params or "{}")
+    job = start_ingest_job(uid, schema_name, params.get("file_name"), checkpoint.file_path, resume=True)
+    return JSONResponse({
+        "status": "processing",
+        "job_id": job.id,
+        "schema_name": schema_name,
+        "display_name": params.get("display_name"),
+        "resumed_from": {
+            "lines_committed": checkpoint.lines_committed,
+            "bytes_committed": checkpoint.bytes_committed,
+            "rows_committed": checkpoint.rows_committed,
+        },
+    }, status_code=202)
+
+
+@router.delete("/ingest-checkpoints/{schema_name}")
+def discard_ingest_checkpoint(schema_name: str, request: Request):
+    """Abandon an interrupted import: drop its partial schema and stored upload."""
+    uid, _ = get_owned_checkpoint(request, schema_name)
+    if active_ingest_job(uid, schema_name) is not None:
+        raise HTTPException(status_code=409, detail="Cancel the running import first")
+    discard_ingest(schema_name)
+    return JSONResponse({"status": "discarded", "schema_name": schema_name})
 
 
 def get_database_metadata(db_path):
@@ -447,6 +952,8 @@ async def merge_databases(request: Request):
             print(f"Skipping non-Postgres source {db_name}; only proj_... schema names are supported")
             continue
 
+        invalidate_schema(schema_name)
+
         # After writing all tables, compute final per-table row counts from the new schema
         final_table_counts = {}
         try:
@@ -470,6 +977,7 @@ async def merge_databases(request: Request):
             try:
                 with engine.begin() as conn:
                     conn.execute(text(f'DROP SCHEMA IF EXISTS "{schema_name}" CASCADE'))
+                invalidate_schema(schema_name)
             except Exception:
                 pass
             return JSONResponse({"message": "No rows found in selected databases; nothing migrated", "database": name, "total_submissions": 0, "total_comments": 0, "file_migrated": False})
@@ -505,6 +1013,7 @@ async def merge_databases(request: Request):
                     raise
                 except Exception:
                     dm.session.rollback()
+        update_file_stats(schema_name)
 
         return JSONResponse({
                 "message": f"Merged into file schema '{schema_name}'",
@@ -519,6 +1028,7 @@ async def merge_databases(request: Request):
         try:
             with engine.begin() as conn:
                 conn.execute(text(f'DROP SCHEMA IF EXISTS "{schema_name}" CASCADE'))
+            invalidate_schema(schema_name)
         except Exception:
             pass
         raise HTTPException(status_code=500, detail=str(exc))
@@ -616,6 +1126,27 @@ def me(request: Request, db: Session = Depends(get_db)):
     return JSONResponse({"id": str(user.id), "email": user.email})
 
 
+def listing_etag(user_id: int) -> str:
+    """Weak ETag for a user's file/project listings, from their metadata version.
+
+    The version is stored in the database, so every worker issues the same
+    ETag. Read it before querying: a change committed meanwhile then yields
+    a newer version on the next request rather than a stale match.
+    """
+    return f'W/"{int(user_id)}-{metadata_version(user_id)}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = [tag.strip() for tag in header.split(",")]
+    return "*" in candidates or etag in candidates or etag[2:] in candidates
+
+
+LISTING_CACHE_HEADERS = {"Cache-Control": "private, no-cache"}
+
+
 @router.get("/my-files/")
 def my_projects(request: Request, file_type: str = Query("raw_data"), db: Session = Depends(get_db)):
     # Resolve authenticated user from token
@@ -623,18 +1154,23 @@ def my_projects(request: Request, file_type: str = Query("raw_data"), db: Sessio
     if not user_id:
         raise HTTPException(status_code=401, detail="Not authenticated")
 
-    # Use File table instead of Project; `file_type` query param maps to `file_type` on File
-    files = db.query(File).filter(File.user_id == int(user_id), File.file_type == file_type).all()
+    # Unchanged listings are answered from the version alone (one primary key lookup)
+    etag = listing_etag(user_id)
+    headers = dict(LISTING_CACHE_HEADERS, ETag=etag)
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+
+    # Use File table instead of Project; `file_type` query param maps to `file_type` on File.
+    # Table metadata for all files comes from one selectin query.
+    files = (
+        db.query(File)
+        .options(selectinload(File.tables))
+        .filter(File.user_id == int(user_id), File.file_type == file_type)
+        .all()
+    )
     result = []
     for p in files:
-        tables = []
-        try:
-            # Query file-backed table metadata
-            rows = db.query(FileTable).filter(FileTable.file_id == p.id).all()
-            for r in rows:
-                tables.append({"table_name": r.tablename, "row_count": r.row_count})
-        except Exception:
-            tables = []
+        tables = [{"table_name": r.tablename, "row_count": r.row_count} for r in p.tables]
 
         result.append({
             "id": str(p.id),
@@ -648,7 +1184,7 @@ def my_projects(request: Request, file_type: str = Query("raw_data"), db: Sessio
 
     # Return under the legacy "projects" key so frontend code expecting
     # `data.projects` continues to work.
-    return JSONResponse({"projects": result})
+    return JSONResponse({"projects": result}, headers=headers)
 
 
 @router.post("/create-project/")
@@ -729,8 +1265,13 @@ def list_projects(request: Request):
     except Exception:
         raise HTTPException(status_code=401, detail="Invalid user id in token")
 
+    etag = listing_etag(uid)
+    headers = dict(LISTING_CACHE_HEADERS, ETag=etag)
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=headers)
+
     with DatabaseManager() as dm:
-        rows = dm.projects.get_all_for_user(uid)
+        rows = dm.projects.get_all_for_user(uid, with_files=True)
         result = []
         for r in rows:
             # Include associated files (databases) for each project
@@ -756,7 +1297,7 @@ def list_projects(request: Request):
                 "files": files,
             })
 
-    return JSONResponse({"projects": result})
+    return JSONResponse({"projects": result}, headers=headers)
 
 
 @router.get("/prompts/")
@@ -979,7 +1520,10 @@ async def delete_database(db_name: str, request: Request, db: Session = Depends(
     try:
         with engine.begin() as conn:
             conn.execute(text(f'DROP SCHEMA IF EXISTS "{schema}" CASCADE'))
+            discard_verdicts(schema, conn)
+        invalidate_schema(schema)
 
+        db.query(FileStat).filter(FileStat.schemaname == schema).delete()
         db.delete(file_rec)
         db.commit()
         return JSONResponse({"message": f"File '{file_rec.filename}' and schema '{schema}' deleted"})
@@ -1014,11 +1558,16 @@ async def delete_row(request: Request, schema: str = Form(...), table: str = For
             return JSONResponse({"error": "File not found or not owned by user"}, status_code=403)
 
         with engine.begin() as conn:
-            res = conn.execute(text(f'DELETE FROM "{schema}"."{table}" WHERE id = :id'), {"id": row_id})
-            try:
-                deleted = int(res.rowcount or 0)
-            except Exception:
-                deleted = 0
+            res = conn.execute(text(f'DELETE FROM "{schema}"."{table}" WHERE id = :id RETURNING *'), {"id": row_id})
+            removed_rows = [dict(r._mapping) for r in res.fetchall()]
+            deleted = len(removed_rows)
+
+        # Keep the facet aggregates current without rescanning the table
+        try:
+            if not discount_file_stats(schema, table, removed_rows):
+                update_file_stats(schema)
+        except Exception as e:
+            print(f"Warning: could not update facet stats for {schema}: {e}")
 
         # Update file_tables metadata: recount rows and persist
         try:
@@ -1137,6 +1686,13 @@ async def move_rows(request: Request, db: Session = Depends(get_db)):
             # Delete from source
             conn.execute(text(f'DELETE FROM "{source}"."{table}" WHERE id = ANY(:ids)'), {"ids": row_ids})
 
+        try:
+            if not discount_file_stats(source, table, [r._mapping for r in rows]):
+                update_file_stats(source)
+        except Exception as e:
+            print(f"Warning: could not update facet stats for {source}: {e}")
+        update_file_stats(target)
+
         # Update metadata counts for both projects (best-effort)
         try:
             with engine.connect() as conn:
@@ -1325,6 +1881,7 @@ async def save_project_codebook(request: Request, schema_name: str = Form(...),
             # Remove existing rows and insert the new content (single-row store)
             conn.execute(text(f'TRUNCATE TABLE "{schema}".content_store'))
             conn.execute(text(f'INSERT INTO "{schema}".content_store (file_text) VALUES (:file_text)'), {"file_text": content})
+        invalidate_schema(schema)
 
         # If a display_name was provided, update the file record
         if display_name:
@@ -1364,20 +1921,19 @@ async def get_coded_data_query(coded_id: str = Query(None), db: Session = Depend
         schema = file_rec.schemaname
         try:
             with engine.connect() as conn:
-                tbl_exists = conn.execute(text("SELECT to_regclass(:tbl)"), {"tbl": f"{schema}.content_store"}).scalar()
-                if not tbl_exists:
-                    return JSONResponse({"error": f"content_store table not found in schema {schema}"}, status_code=404)
+                if not table_exists(schema, "content_store", conn):
+                    return FastJSONResponse({"error": f"content_store table not found in schema {schema}"}, status_code=404)
                 res = conn.execute(text(f'SELECT file_text FROM "{schema}".content_store LIMIT 1'))
                 row = res.fetchone()
                 if row:
-                    return JSONResponse({"coded_data": row[0]})
+                    return FastJSONResponse({"coded_data": row[0]})
                 else:
-                    return JSONResponse({"error": "Coded data content not found in file"}, status_code=404)
+                    return FastJSONResponse({"error": "Coded data content not found in file"}, status_code=404)
         except Exception as e:
             print(f"Error reading coded data from schema {schema}: {e}")
-            return JSONResponse({"error": f"Error reading coded data: {e}"}, status_code=500)
+            return FastJSONResponse({"error": f"Error reading coded data: {e}"}, status_code=500)
 
-    return JSONResponse({"error": "No coded data file found"}, status_code=404)
+    return FastJSONResponse({"error": "No coded data file found"}, status_code=404)
 
 
 @router.post("/save-file-coded-data/")
@@ -1422,6 +1978,7 @@ async def save_project_coded_data(request: Request, schema_name: str = Form(None
             conn.execute(text(f'CREATE TABLE IF NOT EXISTS "{schema}".content_store (file_text text)'))
             conn.execute(text(f'TRUNCATE TABLE "{schema}".content_store'))
             conn.execute(text(f'INSERT INTO "{schema}".content_store (file_text) VALUES (:file_text)'), {"file_text": content})
+        invalidate_schema(schema)
 
         if display_name:
             file_rec.filename = display_name
@@ -1437,8 +1994,82 @@ async def save_project_coded_data(request: Request, schema_name: str = Form(None
         return JSONResponse({"error": str(e)}, status_code=500)
 
 
+ENTRY_TABLES = ("submissions", "comments")
+# (schema, index key) pairs known to exist, so on-demand builds run once
+_ensured_indexes = set()
+
+
+def ensure_schema_index(conn, schema: str, key: str, create_sql: str) -> bool:
+    """Run an idempotent CREATE INDEX for schemas created before that index existed.
+
+    Commits on `conn`. Returns False when the build failed, e.g. because
+    another request is building it concurrently; queries still work without it.
+    """
+    if (schema, key) in _ensured_indexes:
+        return True
+    try:
+        conn.execute(text(create_sql))
+        conn.commit()
+    except Exception as exc:
+        conn.rollback()
+        print(f"Could not create {key} index in schema {schema}: {exc}")
+        return False
+    _ensured_indexes.add((schema, key))
+    return True
+
+
+def encode_page_token(cursors: dict) -> str:
+    """Encode per-table keyset cursors as an opaque, URL-safe `after` token.
+
+    `cursors` maps a table name to the last id already returned, or to None
+    once that table has no more rows.
+    """
+    payload = json.dumps(cursors, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(payload).decode("ascii").rstrip("=")
+
+
+def decode_page_token(token: str, is_cursor=None) -> dict:
+    """Inverse of encode_page_token; raises HTTPException(400) for bad tokens.
+
+    `is_cursor` validates each non-null cursor and defaults to accepting ids.
+    """
+    if is_cursor is None:
+        is_cursor = lambda value: isinstance(value, str)
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        cursors = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid page token")
+    if not isinstance(cursors, dict) or set(cursors) - set(ENTRY_TABLES) or not all(
+        value is None or is_cursor(value) for value in cursors.values()
+    ):
+        raise HTTPException(status_code=400, detail="Invalid page token")
+    return cursors
+
+
+def cached_row_counts(schema: str):
+    """Return {table: row_count} from the File/FileTable metadata, or None.
+
+    The counts are maintained by ingest, merge, filter and row edits, so
+    listings never need a COUNT(*) over the data tables. Tables without a
+    metadata row are empty. None means the schema has no File record.
+    """
+    with DatabaseManager() as dm:
+        file_rec = dm.session.query(File).filter(File.schemaname == schema).first()
+        if not file_rec:
+            return None
+        rows = dm.session.query(FileTable.tablename, FileTable.row_count).filter(FileTable.file_id == file_rec.id).all()
+        return {tablename: int(row_count or 0) for tablename, row_count in rows}
+
+
 @router.get("/file-entries/")
-def project_entries(schema: str = Query(..., description="File schema name"), limit: int = 10, offset: int = 0):
+def project_entries(schema: str = Query(..., description="File schema name"), limit: int = 10, offset: int = 0, after: str = None):
+    """Page through a file schema's submissions and comments, ordered by id.
+
+    Pass the returned `next_after` token as `after` to fetch the next page;
+    `next_after` is null on the last page. `offset` is only honoured when no
+    `after` token is given and remains as a fallback for older clients.
+    """
     # Allow optional .db suffix (frontend may supply schema.db); validate and strip it.
     import re
     if not schema:
@@ -1451,34 +2082,49 @@ def project_entries(schema: str = Query(..., description="File schema name"), li
     if not re.match(r"^[A-Za-z][A-Za-z0-9_]*$", schema):
         raise HTTPException(status_code=400, detail="Invalid schema name")
 
-    # Build queries for submissions and comments inside the provided schema
-    submissions = []
-    comments = []
-    sub_count = 0
-    com_count = 0
+    limit = max(1, limit)
+    cursors = decode_page_token(after) if after else None
+
+    entries = {table: [] for table in ENTRY_TABLES}
+    next_cursors = {}
 
     try:
+        totals = cached_row_counts(schema)
         with engine.connect() as conn:
-            # Check if submissions table exists in schema
-            q = text("SELECT to_regclass(:tbl)")
-            subs_tbl = f"{schema}.submissions"
-            comments_tbl = f"{schema}.comments"
-
-            subs_exists = conn.execute(text(f"SELECT to_regclass(:tbl)"), {"tbl": subs_tbl}).scalar()
-            comm_exists = conn.execute(text(f"SELECT to_regclass(:tbl)"), {"tbl": comments_tbl}).scalar()
-
-            if subs_exists:
-                sub_count = conn.execute(text(f"SELECT COUNT(*) FROM {schema}.submissions")).scalar() or 0
-                rows = conn.execute(text(f"SELECT * FROM {schema}.submissions ORDER BY id LIMIT :lim OFFSET :off"), {"lim": limit, "off": max(0, offset)}).fetchall()
-                submissions = [dict(r._mapping) for r in rows]
-
-            if comm_exists:
-                com_count = conn.execute(text(f"SELECT COUNT(*) FROM {schema}.comments")).scalar() or 0
-                rows = conn.execute(text(f"SELECT * FROM {schema}.comments ORDER BY id LIMIT :lim OFFSET :off"), {"lim": limit, "off": max(0, offset)}).fetchall()
-                comments = [dict(r._mapping) for r in rows]
+            existing = schema_tables(schema, conn)
+            if totals is None:
+                # Schemas without File metadata (e.g. created outside the app)
+                totals = {
+                    table: conn.execute(text(f'SELECT COUNT(*) FROM "{schema}"."{table}"')).scalar() or 0
+                    for table in ENTRY_TABLES if table in existing
+                }
+
+            for table in ENTRY_TABLES:
+                if table not in existing:
+                    next_cursors[table] = None
+                    continue
+                # One extra row tells whether another page exists
+                if cursors is None:
+                    rows = conn.execute(
+                        text(f'SELECT * FROM "{schema}"."{table}" ORDER BY id LIMIT :lim OFFSET :off'),
+                        {"lim": limit + 1, "off": max(0, offset)},
+                    ).fetchall()
+                elif table in cursors and cursors[table] is None:
+                    rows = []
+                else:
+                    # Keyset: seek past the last id through the primary key index
+                    # instead of scanning and discarding `offset` rows.
+                    rows = conn.execute(
+                        text(f'SELECT * FROM "{schema}"."{table}" WHERE id > :after ORDER BY id LIMIT :lim'),
+                        {"after": cursors.get(table) or "", "lim": limit + 1},
+                    ).fetchall()
+                entries[table] = [dict(r._mapping) for r in rows[:limit]]
+                next_cursors[table] = entries[table][-1]["id"] if len(rows) > limit else None
 
+    except HTTPException:
+        raise
     except Exception as exc:
-        return JSONResponse({
+        return FastJSONResponse({
             "submissions": [],
             "comments": [],
             "total_submissions": 0,
@@ -1486,148 +2132,379 @@ def project_entries(schema: str = Query(..., description="File schema name"), li
             "message": f"Error reading file schema: {exc}"
         }, status_code=500)
 
-    return JSONResponse({
-        "submissions": submissions,
-        "comments": comments,
-        "total_submissions": sub_count,
-        "total_comments": com_count,
+    has_more = any(cursor is not None for cursor in next_cursors.values())
+    return FastJSONResponse({
+        "submissions": entries["submissions"],
+        "comments": entries["comments"],
+        "total_submissions": totals.get("submissions", 0),
+        "total_comments": totals.get("comments", 0),
+        "next_after": encode_page_token(next_cursors) if has_more else None,
         "database": schema,
         "date_created": None,
     })
 
 
-@router.post("/filter-data/")
-async def filter_data(request: Request, api_key: str = Form(...), prompt: str = Form(...), database: str = Form(None), name: str = Form(...)):
-    """Read a Postgres file schema (provided in `database`), assemble submissions and comments,
-    merge into a single string and print it to the server stdout.
+SEARCH_MAX_LIMIT = 100
+SEARCH_HEADLINE_OPTIONS = "StartSel=<mark>, StopSel=</mark>, MaxWords=35, MinWords=15, MaxFragments=2"
+
+
+def _is_search_cursor(value) -> bool:
+    return (
+        isinstance(value, list) and len(value) == 2
+        and isinstance(value[0], (int, float)) and not isinstance(value[0], bool)
+        and isinstance(value[1], str)
+    )
+
+
+@router.get("/file-search/")
+def search_file_entries(
+    schema: str = Query(..., description="File schema name"),
+    q: str = Query(..., description="Search terms (web search syntax)"),
+    table: str = Query("all", description="submissions, comments or all"),
+    limit: int = 20,
+    after: str = None,
+):
+    """Full-text search over submission titles/selftext and comment bodies.
+
+    `q` accepts web search syntax ("quoted phrases", OR, -excluded). Matches
+    are ranked with ts_rank, best first, and carry a `highlight` snippet with
+    the matched terms wrapped in <mark> tags (the surrounding text is not
+    HTML-escaped). Page with the returned `next_after` token as for
+    /file-entries/. Searches use a GIN expression index built after ingest,
+    or on the first search of schemas imported before it existed.
     """
-    schema = (database or "").strip()
+    import re
+    schema = (schema or "").strip()
+    if schema.endswith(".db"):
+        schema = schema[:-3]
+    if not re.match(r"^[A-Za-z][A-Za-z0-9_]*$", schema):
+        raise HTTPException(status_code=400, detail="Invalid schema name")
+    q = (q or "").strip()
+    if not q:
+        raise HTTPException(status_code=400, detail="Missing search terms")
+    if table not in ("all",) + ENTRY_TABLES:
+        raise HTTPException(status_code=400, detail="table must be submissions, comments or all")
 
-    if not schema or not schema.startswith('proj_'):
-        return JSONResponse({"error": "This endpoint expects a proj_<id> schema name in 'database'"}, status_code=400)
+    limit = min(max(1, limit), SEARCH_MAX_LIMIT)
+    cursors = decode_page_token(after, is_cursor=_is_search_cursor) if after else None
+    tables = ENTRY_TABLES if table == "all" else (table,)
+
+    results = {name: [] for name in ENTRY_TABLES}
+    next_cursors = {name: None for name in ENTRY_TABLES}
 
-    submissions_text = ""
-    comments_text = ""
     try:
         with engine.connect() as conn:
-            # Submissions: id, title, selftext
-            subs_tbl = f"{schema}.submissions"
-            subs_exists = conn.execute(text("SELECT to_regclass(:tbl)"), {"tbl": subs_tbl}).scalar()
-            if subs_exists:
-                rows = conn.execute(text(f'SELECT * FROM "{schema}"."submissions"')).fetchall()
-                for r in rows:
-                    try:
-                        rid = r._mapping.get('id')
-                        title = r._mapping.get('title')
-                        selftext = r._mapping.get('selftext')
-                    except Exception:
-                        rid = r[0] if len(r) > 0 else ""
-                        title = r[1] if len(r) > 1 else ""
-                        selftext = r[2] if len(r) > 2 else ""
-                    submissions_text += f"ID: {rid or ''}\nTitle: {title or ''}\n{selftext or ''}\n\n"
-
-            # Comments: id, body
-            comm_tbl = f"{schema}.comments"
-            comm_exists = conn.execute(text("SELECT to_regclass(:tbl)"), {"tbl": comm_tbl}).scalar()
-            if comm_exists:
-                rows = conn.execute(text(f'SELECT * FROM "{schema}"."comments"')).fetchall()
-                for r in rows:
-                    try:
-                        cid = r._mapping.get('id')
-                        body = r._mapping.get('body')
-                    except Exception:
-                        cid = r[0] if len(r) > 0 else ""
-                        body = r[1] if len(r) > 1 else ""
-                    comments_text += f"CommentID: {cid or ''}\n{body or ''}\n\n"
+            for name in tables:
+                if not set(SEARCH_TEXT_COLUMNS[name]) <= table_columns(schema, name, conn):
+                    continue
+                if cursors is not None and cursors.get(name) is None:
+                    continue
+                ensure_schema_index(conn, schema, f"search_{name}", search_index_sql(schema, name))
+
+                vector = search_vector_sql(name, alias="t")
+                document = " || ' ' || ".join(f"coalesce(page.{c}, '')" for c in SEARCH_TEXT_COLUMNS[name])
+                params = {"q": q, "lim": limit + 1}
+                seek = ""
+                if cursors is not None:
+                    # Keyset on (rank, id), matching the ORDER BY below
+                    seek = "WHERE (rank, id) < (CAST(:after_rank AS real), :after_id)"
+                    params["after_rank"], params["after_id"] = cursors[name]
+                # Only the page's rows get a headline; ts_headline reparses the text
+                rows = conn.execute(text(f'''
+                    WITH query AS (SELECT websearch_to_tsquery('{SEARCH_CONFIG}'::regconfig, :q) AS tsq),
+                    matches AS (
+                        SELECT t.*, ts_rank({vector}, query.tsq) AS rank
+                        FROM "{schema}"."{name}" t, query
+                        WHERE {vector} @@ query.tsq
+                    )
+                    SELECT page.*, ts_headline('{SEARCH_CONFIG}'::regconfig, {document}, query.tsq, :opts) AS highlight
+                    FROM (
+                        SELECT * FROM matches {seek}
+                        ORDER BY rank DESC, id DESC
+                        LIMIT :lim
+                    ) page, query
+                    ORDER BY page.rank DESC, page.id DESC
+                '''), dict(params, opts=SEARCH_HEADLINE_OPTIONS)).fetchall()
+                results[name] = [dict(r._mapping) for r in rows[:limit]]
+                if len(rows) > limit:
+                    last = results[name][-1]
+                    next_cursors[name] = [last["rank"], last["id"]]
 
-        # Print only lengths
-        try:
-            print(f"[filter-data] submissions length: {len(submissions_text)}")
-            print(f"[filter-data] comments length: {len(comments_text)}")
-        except Exception as e:
-            print(f"[filter-data] Error printing lengths: {e}")
+    except HTTPException:
+        raise
+    except Exception as exc:
+        print(f"Error searching schema {schema}: {exc}")
+        return FastJSONResponse({"error": f"Error searching file schema: {exc}"}, status_code=500)
+
+    has_more = any(cursor is not None for cursor in next_cursors.values())
+    return FastJSONResponse({
+        "submissions": results["submissions"],
+        "comments": results["comments"],
+        "next_after": encode_page_token(next_cursors) if has_more else None,
+        "query": q,
+        "database": schema,
+    })
 
-        # Call AI filter functions and print their responses
-        posts_filtered = None
-        comments_filtered = None
-        try:
-            if submissions_text and submissions_text.strip():
-                posts_filtered = filter_posts_with_ai(prompt or "", submissions_text, api_key)
-                print(f"[filter-data] posts_filtered: {posts_filtered}")
-            else:
-                posts_filtered = '[]'
 
-            if comments_text and comments_text.strip():
-                comments_filtered = filter_comments_with_ai(prompt or "", comments_text, api_key)
-                print(f"[filter-data] comments_filtered: {comments_filtered}")
-            else:
-                comments_filtered = '[]'
-        except Exception as e:
-            print(f"[filter-data] Error calling filter functions: {e}")
-            traceback.print_exc()
-            posts_filtered = f'[{{"error": "Filtering failed: {e}"}}]'
-            comments_filtered = f'[{{"error": "Filtering failed: {e}"}}]'
+@router.get("/file-stats/")
+def file_stats(schema: str = Query(..., description="File schema name")):
+    """Facet aggregates of a file: row counts, top subreddits and authors, and
+    posts per week for each table.
 
-        posts_list = posts_filtered if isinstance(posts_filtered, list) else []
-        comments_list = comments_filtered if isinstance(comments_filtered, list) else []
-        print(len(posts_list), len(comments_list))
-        try:
-            selected_posts = []
-            selected_comments = []
-            with engine.connect() as conn:
-                # posts_list is expected to be a list of id strings; fetch records for each id
-                if isinstance(posts_list, list):
-                    for item in posts_list:
-                        if not item:
-                            continue
-                        try:
-                            row = conn.execute(text(f'SELECT * FROM "{schema}"."submissions" WHERE id = :id'), {"id": item}).fetchone()
-                            if row:
-                                try:
-                                    sid = row._mapping.get('id')
-                                    title = row._mapping.get('title')
-                                    selftext = row._mapping.get('selftext')
-                                except Exception:
-                                    sid = row[0] if len(row) > 0 else None
-                                    title = row[1] if len(row) > 1 else None
-                                    selftext = row[2] if len(row) > 2 else None
-                                selected_posts.append({"id": sid, "title": title, "selftext": selftext})
-                        except Exception:
-                            pass
+    Served from the FileStat row maintained after ingest, merges and row
+    edits; files imported before it existed get theirs computed on first read.
+    """
+    import re
+    schema = (schema or "").strip()
+    if schema.endswith(".db"):
+        schema = schema[:-3]
+    if not re.match(r"^[A-Za-z][A-Za-z0-9_]*$", schema):
+        raise HTTPException(status_code=400, detail="Invalid schema name")
 
-                # comments_list is expected to be a list of id strings; fetch records for each id
-                if isinstance(comments_list, list):
-                    for item in comments_list:
-                        if not item:
-                            continue
-                        try:
-                            row = conn.execute(text(f'SELECT * FROM "{schema}"."comments" WHERE id = :id'), {"id": item}).fetchone()
-                            if row:
-                                try:
-                                    cid = row._mapping.get('id')
-                                    body = row._mapping.get('body')
-                                except Exception:
-                                    cid = row[0] if len(row) > 0 else None
-                                    body = row[1] if len(row) > 1 else None
-                                selected_comments.append({"id": cid, "body": body})
-                        except Exception:
-                            pass
+    try:
+        with DatabaseManager() as dm:
+            stat = dm.session.get(FileStat, schema)
+            if stat is not None:
+                return FastJSONResponse({
+                    "database": schema,
+                    "computed_at": stat.computed_at.isoformat() if stat.computed_at else None,
+                    "facets": json.loads(stat.facets),
+                })
 
-            # Use the fetched records (may be empty lists)
-            posts_list = selected_posts
-            comments_list = selected_comments
+        with engine.connect() as conn:
+            exists = conn.execute(text("SELECT 1 FROM pg_namespace WHERE nspname = :schema"), {"schema": schema}).scalar()
+        if not exists:
+            return FastJSONResponse({"error": f"File schema {schema} not found"}, status_code=404)
+        facets = refresh_file_stats(schema)
+        return FastJSONResponse({"database": schema, "computed_at": datetime.utcnow().isoformat(), "facets": facets})
+    except Exception as exc:
+        print(f"Error reading facet stats for schema {schema}: {exc}")
+        return FastJSONResponse({"error": str(exc)}, status_code=500)
 
-            try:
-                print(f"[filter-data] Parsed posts_list length: {len(posts_list)}")
-                print(f"[filter-data] Parsed comments_list length: {len(comments_list)}")
-            except Exception:
-                pass
-        except Exception as e:
-            print(f"[filter-data] Error normalizing parsed results: {e}")
-            try:
-                print(f"[filter-data] Raw posts_list type: {type(posts_list)}, comments_list type: {type(comments_list)}")
-            except Exception:
-                pass
+
+@router.get("/export/{schema}/{table}")
+def export_table(schema: str, table: str, request: Request, format: str = Query("ndjson", description="ndjson, csv or zst")):
+    """Download a whole file table as NDJSON, CSV or zstd-compressed NDJSON.
+
+    The body is streamed from Postgres `COPY ... TO STDOUT` in chunks, so
+    server memory does not grow with the table. Requires file ownership.
+    """
+    schema = (schema or "").strip()
+    if schema.endswith(".db"):
+        schema = schema[:-3]
+    if not schema.startswith('proj_'):
+        raise HTTPException(status_code=400, detail="Invalid file schema identifier")
+    if table not in ENTRY_TABLES:
+        raise HTTPException(status_code=400, detail="table must be submissions or comments")
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of: {', '.join(EXPORT_FORMATS)}")
+
+    user_id = get_user_id_from_request(request)
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    with DatabaseManager() as dm:
+        file_rec = dm.session.query(File).filter(File.schemaname == schema, File.user_id == int(user_id)).first()
+        if not file_rec:
+            raise HTTPException(status_code=404, detail="File not found or you do not have permission")
+        base_name = file_rec.filename or schema
+
+    if not table_exists(schema, table):
+        raise HTTPException(status_code=404, detail=f"Table {table} not found in schema {schema}")
+
+    media_type, extension = EXPORT_FORMATS[format]
+    safe_name = "".join(ch if ch.isalnum() or ch in "-_." else "_" for ch in base_name).strip("._") or schema
+    return StreamingResponse(
+        stream_table_export(schema, table, format),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{safe_name}_{table}.{extension}"'},
+    )
+
+
+def parse_sample_form(sample):
+    """Decode the optional `sample` form field (JSON sample spec, see
+    scripts.sample_db.parse_sample_spec); raises HTTPException(400)."""
+    if not sample:
+        return None
+    try:
+        return parse_sample_spec(json.loads(sample))
+    except json.JSONDecodeError:
+        raise HTTPException(status_code=400, detail="Invalid sample format")
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+
+def read_file_table(conn, schema: str, table: str, sample: dict = None):
+    """All rows of a file table, or only its sample when a sample spec is given."""
+    if sample is None:
+        return conn.execute(text(f'SELECT * FROM "{schema}"."{table}"')).fetchall()
+    if table not in sample["tables"]:
+        return []
+    return conn.execute(*sample_query(conn, schema, table, sample)).fetchall()
+
+
+class SampleRequest(BaseModel):
+    database: str
+    name: str
+    sample: dict
+    description: str = None
+    project_id: int = None
+
+
+@router.post("/sample-data/")
+def sample_data(payload: SampleRequest, request: Request):
+    """Save a reproducible random sample of a file as a new filtered_data file.
+
+    `sample` is a sample spec (see scripts.sample_db.parse_sample_spec):
+    `size` rows per table, optionally stratified by subreddit and/or time
+    bucket, drawn with a fixed `seed`. Requires ownership of the source file.
+    """
+    schema = (payload.database or "").strip()
+    if schema.endswith(".db"):
+        schema = schema[:-3]
+    if not schema.startswith('proj_'):
+        raise HTTPException(status_code=400, detail="This endpoint expects a proj_<id> schema name in 'database'")
+    try:
+        spec = parse_sample_spec(payload.sample)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+    user_id = get_user_id_from_request(request)
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    user_id = int(user_id)
+    with DatabaseManager() as dm:
+        source = dm.session.query(File).filter(File.schemaname == schema, File.user_id == user_id).first()
+        if not source:
+            raise HTTPException(status_code=404, detail="File not found or you do not have permission")
+    check_target_project(payload.project_id, user_id)
+
+    new_schema = f"proj_{secrets.token_hex(6)}"
+    try:
+        counts = materialize_sample(schema, new_schema, spec)
+    except Exception as exc:
+        print(f"[sample-data] Failed to sample {schema}: {exc}")
+        traceback.print_exc()
+        return JSONResponse({"error": str(exc)}, status_code=500)
+    invalidate_schema(new_schema)
+
+    with DatabaseManager() as dm:
+        file_rec = File(user_id=user_id, filename=payload.name or new_schema, schemaname=new_schema, file_type='filtered_data', description=(payload.description or None))
+        dm.session.add(file_rec)
+        dm.session.flush()
+        for table, count in counts.items():
+            dm.file_tables.add_table_metadata(file_id=file_rec.id, table_name=table, row_count=count)
+        if payload.project_id is not None:
+            proj = dm.session.query(Project).filter(Project.id == int(payload.project_id)).first()
+            file_rec.projects.append(proj)
+        file_info = {"id": str(file_rec.id), "schema_name": new_schema, "filename": file_rec.filename}
+    update_file_stats(new_schema)
+
+    return JSONResponse({"message": "Sample saved", "sample": spec, "row_counts": counts, "file": file_info})
+
+
+def load_filter_entries(schema: str):
+    """(id, text) entries of a file schema's submissions and comments, for LLM filtering."""
+    post_entries = []
+    comment_entries = []
+    with engine.connect() as conn:
+        # Submissions: id, title, selftext
+        if table_exists(schema, "submissions", conn):
+            rows = conn.execute(text(f'SELECT * FROM "{schema}"."submissions"')).fetchall()
+            post_entries = [(r._mapping.get('id'), format_post(r._mapping)) for r in rows]
+
+        # Comments: id, body
+        if table_exists(schema, "comments", conn):
+            rows = conn.execute(text(f'SELECT * FROM "{schema}"."comments"')).fetchall()
+            comment_entries = [(r._mapping.get('id'), format_comment(r._mapping)) for r in rows]
+    return post_entries, comment_entries
+
+
+def fetch_filtered_rows(schema: str, post_ids, comment_ids):
+    """The matched submissions (id, title, selftext) and comments (id, body) as dicts."""
+    posts_list = []
+    comments_list = []
+    with engine.connect() as conn:
+        if post_ids:
+            rows = conn.execute(
+                text(f'SELECT id, title, selftext FROM "{schema}"."submissions" WHERE id = ANY(:ids) ORDER BY id'),
+                {"ids": post_ids},
+            ).fetchall()
+            posts_list = [dict(r._mapping) for r in rows]
+        if comment_ids:
+            rows = conn.execute(
+                text(f'SELECT id, body FROM "{schema}"."comments" WHERE id = ANY(:ids) ORDER BY id'),
+                {"ids": comment_ids},
+            ).fetchall()
+            comments_list = [dict(r._mapping) for r in rows]
+    return posts_list, comments_list
+
+
+@router.post("/filter-data/")
+async def filter_data(request: Request, api_key: str = Form(...), prompt: str = Form(...), database: str = Form(None), name: str = Form(...), bypass_cache: bool = Form(False),
+                      prefilter_keywords: str = Form(None), prefilter_top_k: int = Form(None), prefilter_min_score: float = Form(None)):
+    """Filter a Postgres file schema (provided in `database`) with the LLM and save
+    the matching submissions and comments as a new filtered_data file.
+
+    Rows are sent in token-budgeted chunks, several at a time (see
+    scripts.filter_db.filter_rows_with_ai); the response reports each chunk's
+    size, latency and errors, and how many rows sat in failed chunks.
+
+    Each row's verdict is stored per schema, prompt and model (see
+    scripts.filter_db.filter_rows_incremental), so re-running a filter only
+    sends rows no earlier run judged, such as newly merged ones; the rest
+    are answered from the store. Set `bypass_cache` to ignore stored
+    verdicts and cached LLM responses and judge every row afresh.
+
+    Setting `prefilter_top_k` and/or `prefilter_min_score` (or passing
+    `prefilter_keywords`) first ranks the rows locally with BM25 against the
+    keywords, or the prompt's terms when none are given, and only sends rows
+    that match a term and pass those bounds (see scripts.lexical_prefilter).
+    """
+    schema = (database or "").strip()
+
+    if not schema or not schema.startswith('proj_'):
+        return JSONResponse({"error": "This endpoint expects a proj_<id> schema name in 'database'"}, status_code=400)
+
+    try:
+        # Full-table reads; keep them off the event loop
+        post_entries, comment_entries = await asyncio.to_thread(load_filter_entries, schema)
+
+        submissions_length = sum(len(entry) for _, entry in post_entries)
+        comments_length = sum(len(entry) for _, entry in comment_entries)
+        print(f"[filter-data] submissions length: {submissions_length}")
+        print(f"[filter-data] comments length: {comments_length}")
+
+        prefilter_stats = None
+        if prefilter_keywords or prefilter_top_k is not None or prefilter_min_score is not None:
+            if prefilter_top_k is not None and prefilter_top_k < 1:
+                return JSONResponse({"error": "prefilter_top_k must be at least 1"}, status_code=400)
+            terms = query_terms(prefilter_keywords or prompt or "")
+            if not terms:
+                return JSONResponse({"error": "No usable prefilter terms in the keywords or prompt"}, status_code=400)
+            # Scoring is CPU-bound; keep it off the event loop
+            post_entries, post_stats = await asyncio.to_thread(select_candidates, post_entries, terms, prefilter_top_k, prefilter_min_score)
+            comment_entries, comment_stats = await asyncio.to_thread(select_candidates, comment_entries, terms, prefilter_top_k, prefilter_min_score)
+            prefilter_stats = {"terms": terms, "submissions": post_stats, "comments": comment_stats}
+            print(f"[filter-data] prefilter kept {post_stats['candidates']}/{post_stats['rows']} submissions, {comment_stats['candidates']}/{comment_stats['rows']} comments")
+
+        # Posts and comments share one bound on concurrent completions
+        semaphore = asyncio.Semaphore(FILTER_CONCURRENCY)
+        started = time.monotonic()
+        posts_result, comments_result = await asyncio.gather(
+            filter_rows_incremental(prompt or "", "posts", post_entries, api_key, schema, "submissions", semaphore, use_cache=not bypass_cache),
+            filter_rows_incremental(prompt or "", "comments", comment_entries, api_key, schema, "comments", semaphore, use_cache=not bypass_cache),
+        )
+        filter_seconds = round(time.monotonic() - started, 3)
+        chunk_stats = posts_result["chunks"] + comments_result["chunks"]
+        failed_rows = posts_result["failed_rows"] + comments_result["failed_rows"]
+        verdicts_reused = posts_result["verdicts_reused"] + comments_result["verdicts_reused"]
+        rows_sent = posts_result["rows_sent"] + comments_result["rows_sent"]
+        print(f"[filter-data] {len(chunk_stats)} chunks in {filter_seconds}s, {failed_rows} rows in failed chunks")
+        print(f"[filter-data] {rows_sent} rows sent, {verdicts_reused} answered from stored verdicts")
+
+        posts_list, comments_list = await asyncio.to_thread(fetch_filtered_rows, schema, posts_result["ids"], comments_result["ids"])
+        print(f"[filter-data] Parsed posts_list length: {len(posts_list)}")
+        print(f"[filter-data] Parsed comments_list length: {len(comments_list)}")
 
         # Create a new Postgres schema and store results there; attach to authenticated user if present
         # Resolve authenticated user (optional)
@@ -1700,6 +2577,7 @@ async def filter_data(request: Request, api_key: str = Form(...), prompt: str =
                         print(f"[filter-data] Skipping invalid comment row: {ie}")
 
                 print(f"[filter-data] Inserted {inserted_comments}/{total_comments} comments")
+            invalidate_schema(new_schema)
 
             # create file row and metadata if user authenticated
             if user_id:
@@ -1721,6 +2599,7 @@ async def filter_data(request: Request, api_key: str = Form(...), prompt: str =
                             print(f"[filter-data] Failed to add comments table metadata: {e}")
                 except Exception as e:
                     print(f"[filter-data] Failed to create file metadata: {e}")
+                update_file_stats(new_schema)
 
         except Exception as e:
             print(f"[filter-data] Failed to persist filtered results to Postgres: {e}")
@@ -1728,10 +2607,16 @@ async def filter_data(request: Request, api_key: str = Form(...), prompt: str =
 
         return JSONResponse({
             "message": "Database filtered and saved",
-            "submissions_length": len(submissions_text),
-            "comments_length": len(comments_text),
+            "submissions_length": submissions_length,
+            "comments_length": comments_length,
             "posts_filtered_count": len(posts_list),
             "comments_filtered_count": len(comments_list),
+            "filter_seconds": filter_seconds,
+            "failed_rows": failed_rows,
+            "rows_sent": rows_sent,
+            "verdicts_reused": verdicts_reused,
+            "chunks": chunk_stats,
+            "prefilter": prefilter_stats,
             "file": {"id": str(file_rec.id), "schema_name": new_schema, "filename": file_rec.filename} if file_rec else None,
         })
     except Exception as exc:
@@ -1740,51 +2625,63 @@ async def filter_data(request: Request, api_key: str = Form(...), prompt: str =
         return JSONResponse({"error": str(exc)}, status_code=500)
 
 
+def assemble_file_text(schema: str, sample_spec=None, log_prefix: str = None) -> str:
+    """Submissions (title and selftext) and comments (body) of a file schema as one text."""
+    assembled = ""
+    with engine.connect() as conn:
+        # Check submissions table
+        if table_exists(schema, "submissions", conn):
+            rows = read_file_table(conn, schema, "submissions", sample_spec)
+            for r in rows:
+                try:
+                    title = r._mapping.get('title')
+                    selftext = r._mapping.get('selftext')
+                except Exception:
+                    title = r[0] if len(r) > 0 else ""
+                    selftext = r[1] if len(r) > 1 else ""
+                assembled += f"Title: {title or ''}\n{selftext or ''}\n\n"
+        elif log_prefix:
+            print(f"[DEBUG] {log_prefix}: submissions table not found in schema {schema}")
+
+        # Check comments table
+        if table_exists(schema, "comments", conn):
+            rows = read_file_table(conn, schema, "comments", sample_spec)
+            for r in rows:
+                try:
+                    body = r._mapping.get('body')
+                except Exception:
+                    body = r[0] if len(r) > 0 else ""
+                assembled += f"{body or ''}\n\n"
+        elif log_prefix:
+            print(f"[DEBUG] {log_prefix}: comments table not found in schema {schema}")
+    return assembled
+
+
+def read_content_store(schema: str) -> str:
+    """The stored text of a codebook or coding file schema, or "" when it has none."""
+    with engine.connect() as conn:
+        if not table_exists(schema, "content_store", conn):
+            return ""
+        row = conn.execute(text(f'SELECT file_text FROM "{schema}".content_store LIMIT 1')).fetchone()
+    return row[0] if row else ""
+
+
 @router.post("/generate-codebook/")
-async def generate_codebook(request: Request, database: str = Form("original"), api_key: str = Form(...), prompt: str = Form(""), name: str = Form(...), description: str = Form(None), project_id: int = Form(None)):
+async def generate_codebook(request: Request, database: str = Form("original"), api_key: str = Form(...), prompt: str = Form(""), name: str = Form(...), description: str = Form(None), project_id: int = Form(None), sample: str = Form(None), bypass_cache: bool = Form(False)):
     # Read a Postgres file schema, assemble submissions/comments into text, log it.
     schema = (database or "").strip()
 
     if not schema.startswith('proj_'):
         return JSONResponse({"error": "This endpoint currently expects a proj_<id> schema name"}, status_code=400)
 
-    try:
-        assembled = ""
-        with engine.connect() as conn:
-            # Check submissions table
-            subs_tbl = f"{schema}.submissions"
-            subs_exists = conn.execute(text("SELECT to_regclass(:tbl)"), {"tbl": subs_tbl}).scalar()
-            if subs_exists:
-                rows = conn.execute(text(f'SELECT * FROM "{schema}"."submissions"')).fetchall()
-                for r in rows:
-                    try:
-                        title = r._mapping.get('title')
-                        selftext = r._mapping.get('selftext')
-                    except Exception:
-                        title = r[0] if len(r) > 0 else ""
-                        selftext = r[1] if len(r) > 1 else ""
-                    assembled += f"Title: {title or ''}\n{selftext or ''}\n\n"
-            else:
-                print(f"[DEBUG] generate_codebook: submissions table not found in schema {schema}")
-
-            # Check comments table
-            comm_tbl = f"{schema}.comments"
-            comm_exists = conn.execute(text("SELECT to_regclass(:tbl)"), {"tbl": comm_tbl}).scalar()
-            if comm_exists:
-                rows = conn.execute(text(f'SELECT * FROM "{schema}"."comments"')).fetchall()
-                for r in rows:
-                    try:
-                        body = r._mapping.get('body')
-                    except Exception:
-                        body = r[0] if len(r) > 0 else ""
-                    assembled += f"{body or ''}\n\n"
-            else:
-                print(f"[DEBUG] generate_codebook: comments table not found in schema {schema}")
+    sample_spec = parse_sample_form(sample)
 
+    try:
+        assembled = await asyncio.to_thread(assemble_file_text, schema, sample_spec, "generate_codebook")
 
         try:
             print("[INFO] generate_codebook: calling generate_codebook function for MODEL_1")
-            raw_out = generate_codebook_function(assembled, api_key, "", "", prompt, MODEL=MODEL_1)
+            raw_out = generate_codebook_function(assembled, api_key, "", "", prompt, MODEL=MODEL_1, use_cache=not bypass_cache)
             codebook_text = await raw_out if asyncio.iscoroutine(raw_out) or inspect.isawaitable(raw_out) else raw_out
         except Exception as e:
             print(f"Error generating codebook for schema {schema}: {e}")
@@ -1809,6 +2706,7 @@ async def generate_codebook(request: Request, database: str = Form("original"),
                 conn.execute(text(f'CREATE TABLE IF NOT EXISTS "{new_schema}".content_store (file_text text)'))
                 conn.execute(text(f'TRUNCATE TABLE "{new_schema}".content_store'))
                 conn.execute(text(f'INSERT INTO "{new_schema}".content_store (file_text) VALUES (:file_text)'), {"file_text": codebook_text})
+            invalidate_schema(new_schema)
 
             # Persist provided description (do not append agreement percent)
             final_description = (description or "").strip() if description is not None else None
@@ -1861,8 +2759,16 @@ async def generate_codebook(request: Request, database: str = Form("original"),
 
 
 
+@router.get("/llm-cache/stats")
+def get_llm_cache_stats(request: Request):
+    """Hit/miss counters of the LLM response cache and its current size."""
+    if not get_user_id_from_request(request):
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    return FastJSONResponse(llm_cache_stats())
+
+
 @router.post("/compare-codebooks/")
-async def compare_codebooks(request: Request, codebook_a: str = Form(...), codebook_b: str = Form(...), api_key: str = Form(...), model: str = Form(None)):
+async def compare_codebooks(request: Request, codebook_a: str = Form(...), codebook_b: str = Form(...), api_key: str = Form(...), model: str = Form(None), bypass_cache: bool = Form(False)):
     """Compare two codebooks stored in Postgres schemas by calling the LLM and return the full message."""
     schema_a = (codebook_a or "").strip()
     schema_b = (codebook_b or "").strip()
@@ -1900,7 +2806,7 @@ async def compare_codebooks(request: Request, codebook_a: str = Form(...), codeb
         # choose model if provided, otherwise use MODEL_3 if available
         chosen_model = model or MODEL_3
 
-        resp = codebook_get_client(system_prompt, user_prompt, api_key, chosen_model)
+        resp = await codebook_get_client(system_prompt, user_prompt, api_key, chosen_model, use_cache=not bypass_cache)
         return JSONResponse({"comparison": resp})
     except Exception as exc:
         traceback.print_exc()
@@ -1909,7 +2815,7 @@ async def compare_codebooks(request: Request, codebook_a: str = Form(...), codeb
 
 
 @router.post("/compare-codings/")
-async def compare_codings(request: Request, coding_a: str = Form(...), coding_b: str = Form(...), api_key: str = Form(...), model: str = Form(None)):
+async def compare_codings(request: Request, coding_a: str = Form(...), coding_b: str = Form(...), api_key: str = Form(...), model: str = Form(None), bypass_cache: bool = Form(False)):
     """Compare two coding outputs stored in Postgres schemas by calling the LLM and return the full message."""
     schema_a = (coding_a or "").strip()
     schema_b = (coding_b or "").strip()
@@ -1945,7 +2851,7 @@ async def compare_codings(request: Request, coding_a: str = Form(...), coding_b:
 
         chosen_model = model or MODEL_3
 
-        resp = codebook_get_client(system_prompt, user_prompt, api_key, chosen_model)
+        resp = await codebook_get_client(system_prompt, user_prompt, api_key, chosen_model, use_cache=not bypass_cache)
         return JSONResponse({"comparison": resp})
     except Exception as exc:
         traceback.print_exc()
@@ -1953,7 +2859,7 @@ async def compare_codings(request: Request, coding_a: str = Form(...), coding_b:
 
 
 @router.post("/apply-codebook/")
-async def apply_codebook(request: Request, database: str = Form(...), codebook: str = Form(...), methodology: str = Form(""), report_name: str = Form(None), api_key: str = Form(...)):
+async def apply_codebook(request: Request, database: str = Form(...), codebook: str = Form(...), methodology: str = Form(""), report_name: str = Form(None), api_key: str = Form(...), sample: str = Form(None), bypass_cache: bool = Form(False)):
     """Open the Postgres schema provided by `database`, read `submissions.title`/`selftext`
     and `comments.body`, assemble them into a single string, print it to stdout and
     return a preview in the response.
@@ -1965,41 +2871,10 @@ async def apply_codebook(request: Request, database: str = Form(...), codebook:
     if not schema or not schema.startswith('proj_'):
         return JSONResponse({"error": "This endpoint expects a proj_<id> schema name"}, status_code=400)
 
-    assembled = ""
-    try:
-        with engine.connect() as conn:
-            # Submissions
-            subs_tbl = f"{schema}.submissions"
-            subs_exists = conn.execute(text("SELECT to_regclass(:tbl)"), {"tbl": subs_tbl}).scalar()
-            if subs_exists:
-                rows = conn.execute(text(f'SELECT * FROM "{schema}"."submissions"')).fetchall()
-                for r in rows:
-                    try:
-                        title = r._mapping.get('title')
-                        selftext = r._mapping.get('selftext')
-                    except Exception:
-                        title = r[0] if len(r) > 0 else ""
-                        selftext = r[1] if len(r) > 1 else ""
-                    assembled += f"Title: {title or ''}\n{selftext or ''}\n\n"
-            else:
-                # submissions table missing — proceed with whatever content was found
-                pass
-
-            # Comments
-            comm_tbl = f"{schema}.comments"
-            comm_exists = conn.execute(text("SELECT to_regclass(:tbl)"), {"tbl": comm_tbl}).scalar()
-            if comm_exists:
-                rows = conn.execute(text(f'SELECT * FROM "{schema}"."comments"')).fetchall()
-                for r in rows:
-                    try:
-                        body = r._mapping.get('body')
-                    except Exception:
-                        body = r[0] if len(r) > 0 else ""
-                    assembled += f"{body or ''}\n\n"
-            else:
-                # comments table missing — proceed
-                pass
+    sample_spec = parse_sample_form(sample)
 
+    try:
+        assembled = await asyncio.to_thread(assemble_file_text, schema, sample_spec)
 
         cb_schema_raw = (codebook or "").strip()
         codebook_text = ""
@@ -2028,16 +2903,7 @@ async def apply_codebook(request: Request, database: str = Form(...), codebook:
                     resolved_schema = None
 
             if resolved_schema:
-                with engine.connect() as conn:
-                    tbl_exists = conn.execute(text("SELECT to_regclass(:tbl)"), {"tbl": f"{resolved_schema}.content_store"}).scalar()
-                    if tbl_exists:
-                        res = conn.execute(text(f'SELECT file_text FROM "{resolved_schema}".content_store LIMIT 1'))
-                        row = res.fetchone()
-                        codebook_text = row[0] if row else ""
-                    else:
-                        pass
-            else:
-                pass
+                codebook_text = await asyncio.to_thread(read_content_store, resolved_schema)
         except Exception:
             pass
 
@@ -2045,7 +2911,7 @@ async def apply_codebook(request: Request, database: str = Form(...), codebook:
         classification_output = ""
         try:
             if codebook_text and api_key:
-                classification_output = classify_posts(codebook_text, assembled, methodology or "", api_key)
+                classification_output = await classify_posts(codebook_text, assembled, methodology or "", api_key, use_cache=not bypass_cache)
             else:
                 classification_output = "API request error"
         except Exception:
@@ -2072,6 +2938,7 @@ async def apply_codebook(request: Request, database: str = Form(...), codebook:
                         dm.session.add(file_rec)
                         dm.session.flush()
                         dm.file_tables.add_table_metadata(file_id=file_rec.id, table_name='content_store', row_count=1)
+                invalidate_schema(new_schema)
             except Exception as e:
                     print(f"Failed to persist classification project/schema: {e}")
         
@@ -2083,6 +2950,16 @@ async def apply_codebook(request: Request, database: str = Form(...), codebook:
         return JSONResponse({"error": str(exc)}, status_code=500)
 
 
+def stream_thread_comments(schema: str, submission_id: str):
+    """Yield {"comments": [...]} for one thread, read through a server-side cursor."""
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=JSON_STREAM_ROWS).execute(
+            text(f'SELECT * FROM "{schema}"."comments" WHERE link_id = :link ORDER BY created_utc ASC'),
+            {"link": submission_id},
+        )
+        yield from stream_json_rows("comments", (dict(r._mapping) for r in result))
+
+
 @router.get("/comments/{submission_id}") 
 async def get_comments_for_submission(submission_id: str, database: str = Query("original")):
     """Fetch all comments for a specific submission from a Postgres file schema.
@@ -2097,25 +2974,247 @@ async def get_comments_for_submission(submission_id: str, database: str = Query(
         return JSONResponse({"error": "This endpoint expects a proj_<id> schema name in 'database'"}, status_code=400)
 
     try:
-        with engine.connect() as conn:
-            # Verify comments table exists in the schema
-            tbl = f"{schema}.comments"
-            tbl_exists = conn.execute(text("SELECT to_regclass(:tbl)"), {"tbl": tbl}).scalar()
-            if not tbl_exists:
-                return JSONResponse({"error": f"Comments table not found in schema {schema}"}, status_code=404)
-
-            # Fetch rows where link_id matches submission_id
-            q = text(f'SELECT * FROM "{schema}"."comments" WHERE link_id = :link ORDER BY created_utc ASC')
-            rows = conn.execute(q, {"link": submission_id}).fetchall()
-            comments = [dict(r._mapping) for r in rows]
+        # Verify comments table exists in the schema
+        if not table_exists(schema, "comments"):
+            return JSONResponse({"error": f"Comments table not found in schema {schema}"}, status_code=404)
 
-            return JSONResponse({"comments": comments})
+        # Threads can hold thousands of comments; stream them instead of
+        # building the whole list and its JSON in memory
+        return StreamingResponse(stream_thread_comments(schema, submission_id), media_type="application/json")
 
     except Exception as exc:
         print(f"Error reading comments from schema {schema}: {exc}")
         traceback.print_exc()
         return JSONResponse({"error": str(exc)}, status_code=500)
 
+COMMENTS_BATCH_MAX_IDS = 500
+
+
+class CommentsBatchRequest(BaseModel):
+    database: str
+    submission_ids: list
+
+
+def ensure_thread_index(conn, schema: str):
+    """Build the (link_id, created_utc) index on file schemas created before it existed."""
+    ensure_schema_index(conn, schema, "thread", index_sql(schema, "comments", THREAD_INDEX_COLUMNS))
+
+
+@router.post("/comments/batch/")
+async def get_comments_for_submissions(payload: CommentsBatchRequest):
+    """Fetch the comments of many submissions in one indexed query.
+
+    Returns {"comments": {submission_id: [comment, ...]}} with every requested
+    id present and each thread ordered by created_utc, as /comments/{id} does.
+    """
+    schema = (payload.database or "").strip()
+    if schema.endswith(".db"):
+        schema = schema[:-3]
+    if not schema or not schema.startswith('proj_'):
+        return FastJSONResponse({"error": "This endpoint expects a proj_<id> schema name in 'database'"}, status_code=400)
+
+    submission_ids = list(dict.fromkeys(str(sid) for sid in payload.submission_ids if sid is not None and sid != ""))
+    if len(submission_ids) > COMMENTS_BATCH_MAX_IDS:
+        return FastJSONResponse({"error": f"At most {COMMENTS_BATCH_MAX_IDS} submission ids per request"}, status_code=400)
+
+    grouped = {sid: [] for sid in submission_ids}
+    if not submission_ids:
+        return FastJSONResponse({"comments": grouped})
+
+    try:
+        with engine.connect() as conn:
+            if "link_id" not in table_columns(schema, "comments", conn):
+                # No comments table, or a filtered one without thread columns
+                return FastJSONResponse({"comments": grouped})
+
+            ensure_thread_index(conn, schema)
+            rows = conn.execute(
+                text(f'SELECT * FROM "{schema}"."comments" WHERE link_id = ANY(:links) ORDER BY link_id, created_utc ASC'),
+                {"links": submission_ids},
+            ).fetchall()
+            for r in rows:
+                comment = dict(r._mapping)
+                grouped[comment["link_id"]].append(comment)
+
+        return FastJSONResponse({"comments": grouped})
+
+    except Exception as exc:
+        print(f"Error reading comments from schema {schema}: {exc}")
+        traceback.print_exc()
+        return FastJSONResponse({"error": str(exc)}, status_code=500)
+
+
+TREE_MAX_DEPTH = 10
+TREE_MAX_BREADTH = 100
+# Most comments in one tree response; levels are cut off once it is reached
+TREE_MAX_NODES = 2000
+
+
+def _is_reply_cursor(value) -> bool:
+    return (
+        isinstance(value, list) and len(value) == 2
+        and (value[0] is None or (isinstance(value[0], int) and not isinstance(value[0], bool)))
+        and isinstance(value[1], str)
+    )
+
+
+def _reply_sort_key(comment: dict):
+    # ORDER BY created_utc, id (NULLS LAST, as Postgres sorts ascending)
+    created = comment.get("created_utc")
+    return (created is None, created or 0, comment.get("id") or "")
+
+
+def _reply_cursor_token(comment: dict) -> str:
+    return encode_page_token({"comments": [comment.get("created_utc"), comment.get("id")]})
+
+
+@router.get("/comments/{submission_id}/tree")
+def get_comment_tree(
+    submission_id: str,
+    database: str = Query("original"),
+    parent_id: str = None,
+    depth: int = 3,
+    breadth: int = 10,
+    after: str = None,
+):
+    """Return the comments of a submission as a nested reply tree.
+
+    Starting from `parent_id` (default: the submission itself, `t3_<id>`;
+    pass `t1_<comment id>` to expand one comment), up to `breadth` replies
+    per comment are included, oldest first, for `depth` levels. Each comment
+    carries `replies`, `more_replies` and, when only some of its replies were
+    included, a `more_after` token; request the same parent_id with that
+    token as `after` to load the next replies ("load more replies"). A comment
+    on the last included level has `more_replies` but no token: expand it by
+    passing its id as `parent_id`. A response holds at most TREE_MAX_NODES
+    comments; once that budget is spent, comments are left unexpanded in
+    the same way and `truncated` is set.
+    """
+    schema = (database or "").strip()
+    if schema.endswith(".db"):
+        schema = schema[:-3]
+    if not schema or not schema.startswith('proj_'):
+        return FastJSONResponse({"error": "This endpoint expects a proj_<id> schema name in 'database'"}, status_code=400)
+
+    depth = min(max(1, depth), TREE_MAX_DEPTH)
+    breadth = min(max(1, breadth), TREE_MAX_BREADTH)
+    root = (parent_id or "").strip() or f"t3_{submission_id}"
+    if not root.startswith(("t1_", "t3_")):
+        root = f"t1_{root}"
+    cursor = decode_page_token(after, is_cursor=_is_reply_cursor).get("comments") if after else None
+
+    def make_node(row) -> dict:
+        node = dict(row._mapping)
+        node.update(replies=[], more_replies=False, more_after=None)
+        return node
+
+    try:
+        with engine.connect() as conn:
+            if "parent_id" not in table_columns(schema, "comments", conn):
+                return FastJSONResponse({"error": f"Comments table with reply links not found in schema {schema}"}, status_code=404)
+            ensure_schema_index(conn, schema, "reply", index_sql(schema, "comments", REPLY_INDEX_COLUMNS))
+
+            # First level: the replies to `root`, continuing after the cursor
+            params = {"parent": root, "lim": breadth + 1}
+            seek = ""
+            if cursor is not None:
+                params["after_created"], params["after_id"] = cursor
+                if params["after_created"] is None:
+                    seek = "AND created_utc IS NULL AND id > :after_id"
+                else:
+                    seek = "AND ((created_utc, id) > (:after_created, :after_id) OR created_utc IS NULL)"
+            rows = conn.execute(text(
+                f'SELECT * FROM "{schema}"."comments" WHERE parent_id = :parent {seek} '
+                f'ORDER BY created_utc, id LIMIT :lim'
+            ), params).fetchall()
+            top = [make_node(r) for r in rows[:breadth]]
+            more_after = _reply_cursor_token(top[-1]) if len(rows) > breadth else None
+
+            # Deeper levels: one query per level fetches up to breadth + 1
+            # replies for every comment of the previous level, in tree order
+            # and capped at the rest of the TREE_MAX_NODES budget, so neither
+            # the query nor the response outgrows it.
+            level = top
+            node_count = len(top)
+            unexpanded = []
+            truncated = False
+            for _ in range(depth - 1):
+                remaining = TREE_MAX_NODES - node_count
+                if not level:
+                    break
+                if remaining <= 0:
+                    truncated = True
+                    break
+                parents = {f"t1_{node['id']}": node for node in level}
+                rows = conn.execute(text(f'''
+                    SELECT c.* FROM unnest(CAST(:parents AS text[])) WITH ORDINALITY AS p(parent, pos)
+                    CROSS JOIN LATERAL (
+                        SELECT * FROM "{schema}"."comments"
+                        WHERE parent_id = p.parent
+                        ORDER BY created_utc, id
+                        LIMIT :lim
+                    ) c
+                    ORDER BY p.pos, c.created_utc, c.id
+                    LIMIT :cap
+                '''), {"parents": list(parents), "lim": breadth + 1, "cap": remaining + 1}).fetchall()
+                # Over budget: the comment whose replies were cut keeps
+                # `more_replies`, the ones after it are left unexpanded
+                cut = None
+                if len(rows) > remaining:
+                    cut = rows[remaining]._mapping["parent_id"]
+                    rows = rows[:remaining]
+                    truncated = True
+                children = {}
+                for r in rows:
+                    child = make_node(r)
+                    children.setdefault(child["parent_id"], []).append(child)
+                level = []
+                past_cut = False
+                for key, node in parents.items():
+                    if past_cut:
+                        unexpanded.append(node)
+                        continue
+                    replies = children.get(key, [])
+                    replies.sort(key=_reply_sort_key)
+                    node["replies"] = replies[:breadth]
+                    if len(replies) > breadth or key == cut:
+                        node["more_replies"] = True
+                        if node["replies"]:
+                            node["more_after"] = _reply_cursor_token(node["replies"][-1])
+                    level.extend(node["replies"])
+                    past_cut = key == cut
+                node_count += len(level)
+
+            # Comments that were not expanded: only flag which ones have replies
+            unexpanded.extend(level)
+            if unexpanded:
+                with_replies = {
+                    r[0] for r in conn.execute(text(
+                        f'SELECT p.parent FROM unnest(CAST(:parents AS text[])) AS p(parent) '
+                        f'WHERE EXISTS (SELECT 1 FROM "{schema}"."comments" c WHERE c.parent_id = p.parent)'
+                    ), {"parents": [f"t1_{node['id']}" for node in unexpanded]})
+                }
+                for node in unexpanded:
+                    node["more_replies"] = f"t1_{node['id']}" in with_replies
+
+        return FastJSONResponse({
+            "submission_id": submission_id,
+            "parent_id": root,
+            "comments": top,
+            "more_replies": more_after is not None,
+            "more_after": more_after,
+            "truncated": truncated,
+            "database": schema,
+        })
+
+    except HTTPException:
+        raise
+    except Exception as exc:
+        print(f"Error building comment tree from schema {schema}: {exc}")
+        traceback.print_exc()
+        return FastJSONResponse({"error": str(exc)}, status_code=500)
+
+
 # Defensive route re-registration:
 # If, for any reason, some route decorators did not register onto `router`,
 # scan this source file for `@router.<method>("/path")` patterns and add
@@ -0,0 +1,85 @@
+import threading
+import time
+
+from sqlalchemy import text
+
+try:
+    from app.database import engine
+except Exception as exc:
+    try:
+        from backend.app.database import engine
+    except Exception:
+        print("Failed", exc)
+        raise exc
+
+# In-process cache of the tables and columns of each file schema, so read
+# endpoints can skip their to_regclass / information_schema probes. Code that
+# creates or drops schemas, tables or columns calls invalidate_schema() once
+# its transaction has committed; the TTL bounds staleness for changes made by
+# other processes.
+CATALOG_TTL_SECONDS = 60
+
+_lock = threading.Lock()
+_entries = {}
+_generations = {}
+
+
+def _load_schema(conn, schema_name: str) -> dict:
+    tables = {}
+    for table_name, column_name in conn.execute(text(
+        "SELECT c.relname, a.attname FROM pg_class c "
+        "JOIN pg_namespace n ON n.oid = c.relnamespace "
+        "JOIN pg_attribute a ON a.attrelid = c.oid AND a.attnum > 0 AND NOT a.attisdropped "
+        "WHERE n.nspname = :schema AND c.relkind IN ('r', 'p', 'v', 'm')"
+    ), {"schema": schema_name}):
+        tables.setdefault(table_name, set()).add(column_name)
+    return {table_name: frozenset(columns) for table_name, columns in tables.items()}
+
+
+def schema_tables(schema_name: str, conn=None) -> dict:
+    """Return {table name: frozenset of column names} for a schema.
+
+    Served from the cache when fresh; `conn` is used for the lookup on a miss.
+    Schemas without tables are not cached, so a schema being created is seen
+    as soon as its tables exist. Treat the result as read-only.
+    """
+    now = time.monotonic()
+    with _lock:
+        entry = _entries.get(schema_name)
+        if entry is not None and entry[0] > now:
+            return entry[1]
+        generation = _generations.get(schema_name, 0)
+
+    if conn is None:
+        with engine.connect() as own_conn:
+            tables = _load_schema(own_conn, schema_name)
+    else:
+        tables = _load_schema(conn, schema_name)
+
+    if tables:
+        with _lock:
+            # Skip the store if the schema was invalidated while loading
+            if _generations.get(schema_name, 0) == generation:
+                _entries[schema_name] = (now + CATALOG_TTL_SECONDS, tables)
+    return tables
+
+
+def table_exists(schema_name: str, table_name: str, conn=None) -> bool:
+    return table_name in schema_tables(schema_name, conn)
+
+
+def table_columns(schema_name: str, table_name: str, conn=None) -> frozenset:
+    """Columns of a table, or an empty set when the table does not exist."""
+    return schema_tables(schema_name, conn).get(table_name, frozenset())
+
+
+def invalidate_schema(schema_name: str = None):
+    """Forget a schema's cached catalog (every schema when None)."""
+    with _lock:
+        if schema_name is None:
+            for name in set(_entries) | set(_generations):
+                _generations[name] = _generations.get(name, 0) + 1
+            _entries.clear()
+        else:
+            _generations[schema_name] = _generations.get(schema_name, 0) + 1
+            _entries.pop(schema_name, None)
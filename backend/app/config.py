@@ -4,6 +4,8 @@ from pydantic_settings import BaseSettings
 BACKEND_ROOT = Path(__file__).resolve().parent.parent  # backend folder
 DATABASE_DIR = BACKEND_ROOT / "data" / "databases"
 FILTERED_DATABASE_DIR = BACKEND_ROOT / "data" / "filtered_databases"
+# Uploaded dumps are kept here until their import completes so it can be resumed
+UPLOAD_DIR = BACKEND_ROOT / "data" / "uploads"
 
 
 class Settings(BaseSettings):
@@ -11,6 +13,7 @@ class Settings(BaseSettings):
     database_url: str = ""
     database_dir: str = str(DATABASE_DIR)
     filtered_database_dir: str = str(FILTERED_DATABASE_DIR)
+    upload_dir: str = str(UPLOAD_DIR)
     secret_key: str = "your-secret-key-here"
 
     auth_database_url: str = ""  
@@ -18,4 +21,9 @@ class Settings(BaseSettings):
     jwt_algorithm: str = "HS256"
     jwt_access_token_expire_minutes: int = 60
 
+    # LLM response cache (scripts.llm_cache); a TTL of 0 keeps entries until evicted
+    llm_cache_enabled: bool = True
+    llm_cache_max_bytes: int = 256 * 1024 * 1024
+    llm_cache_ttl_seconds: int = 0
+
 settings = Settings()
\ No newline at end of file
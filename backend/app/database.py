@@ -5,6 +5,8 @@ from sqlalchemy import (
     Column,
     String,
     Integer,
+    BigInteger,
+    Boolean,
     ForeignKey,
     DateTime,
     Table,
@@ -123,6 +125,93 @@ class Prompt(Base):
     user = relationship("User", back_populates="prompts")
 
 
+class IngestCheckpoint(Base):
+    """Committed progress of a dump import into a file schema.
+
+    Written by scripts.import_db in the same transaction as each loaded batch,
+    so an interrupted import can resume from `bytes_committed` (an offset in
+    the decompressed stream) into the same schema. `params` holds the caller's
+    JSON metadata needed to finish the import (display name, project, ...).
+    """
+    __tablename__ = "ingest_checkpoints"
+
+    schemaname = Column(String, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"))
+    file_path = Column(String, nullable=False)
+    data_type = Column(String, nullable=False)
+    subreddit_filter = Column(String)
+    params = Column(String)
+    lines_committed = Column(BigInteger, nullable=False, default=0)
+    bytes_committed = Column(BigInteger, nullable=False, default=0)
+    batches_committed = Column(Integer, nullable=False, default=0)
+    rows_committed = Column(BigInteger, nullable=False, default=0)
+    status = Column(String, nullable=False, default="queued")
+    error = Column(String)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+
+class FileStat(Base):
+    """Facet aggregates of a file schema (see app.services.refresh_file_stats).
+
+    `facets` is JSON holding, per data table, the row count, top subreddits,
+    top authors and a weekly created_utc histogram. It is recomputed after
+    ingest, merge, filter and row moves, and adjusted in place on row deletes.
+    """
+    __tablename__ = "file_stats"
+
+    schemaname = Column(String, primary_key=True)
+    facets = Column(String, nullable=False)
+    computed_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class MetadataVersion(Base):
+    """Version of a user's file/project metadata (see app.metadata_versions).
+
+    `version` is a random token replaced in the same transaction as every
+    ORM change to the user's File, FileTable or Project rows.
+    """
+    __tablename__ = "metadata_versions"
+
+    user_id = Column(Integer, primary_key=True)
+    version = Column(String, nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class LLMCacheEntry(Base):
+    """A cached LLM completion (see scripts.llm_cache).
+
+    `key` is the sha256 of the model, prompts, temperature and request
+    options; `last_used_at` orders LRU eviction.
+    """
+    __tablename__ = "llm_cache"
+
+    key = Column(String, primary_key=True)
+    model = Column(String, nullable=False)
+    response = Column(String, nullable=False)
+    size_bytes = Column(Integer, nullable=False, default=0)
+    hits = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    last_used_at = Column(DateTime(timezone=True), server_default=func.now(), index=True)
+
+
+class FilterVerdict(Base):
+    """Whether one row of a file schema matched an LLM filter (see scripts.filter_verdicts).
+
+    `prompt_hash` is the sha256 of the filter's system prompt, so any change
+    to the filter prompt gets fresh verdicts. Rows of failed chunks get none.
+    """
+    __tablename__ = "filter_verdicts"
+
+    schemaname = Column(String, primary_key=True)
+    table_name = Column(String, primary_key=True)
+    prompt_hash = Column(String, primary_key=True)
+    model = Column(String, primary_key=True)
+    row_id = Column(String, primary_key=True)
+    matched = Column(Boolean, nullable=False)
+    judged_at = Column(DateTime(timezone=True), server_default=func.now())
+
 try:
     Base.metadata.create_all(bind=engine)
 except Exception as _err:
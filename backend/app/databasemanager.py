@@ -1,4 +1,5 @@
 from typing import Optional
+from sqlalchemy.orm import selectinload
 try:
     from app.database import SessionLocal, Project, User, FileTable, File
 except Exception as exc:
@@ -53,8 +54,13 @@ class UserRepository(BaseRepository):
 
 
 class ProjectRepository(BaseRepository):
-    def get_all_for_user(self, user_id: int):
-        return self.session.query(Project).filter_by(user_id=user_id).all()
+    def get_all_for_user(self, user_id: int, with_files: bool = False):
+        """Return the user's projects; `with_files` loads every project's
+        files in one extra query instead of one lazy load per project."""
+        query = self.session.query(Project).filter_by(user_id=user_id)
+        if with_files:
+            query = query.options(selectinload(Project.files))
+        return query.all()
 
     def get_schema_name(self, project_id: int) -> Optional[str]:
         proj = self.session.get(Project, project_id)
@@ -0,0 +1,224 @@
+import secrets
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# Ingestion runs on a small dedicated pool so long imports never tie up the
+# request threadpool. Jobs live in process memory only.
+MAX_CONCURRENT_JOBS = 2
+JOB_RETENTION_SECONDS = 6 * 60 * 60
+RATE_WINDOW_SECONDS = 15
+
+_executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_JOBS, thread_name_prefix="ingest")
+_jobs = {}
+_jobs_lock = threading.Lock()
+
+
+class IngestJob:
+    """Progress, cancellation and result state for one background ingestion.
+
+    The worker thread writes the counters through `update()`; request handlers
+    read them through `snapshot()`. `cancelled` is polled by the ingest loop.
+    """
+
+    def __init__(self, user_id: int, schema_name: str, file_name: str = None, total_bytes: int = 0):
+        self.id = secrets.token_hex(8)
+        self.user_id = user_id
+        self.schema_name = schema_name
+        self.file_name = file_name
+        self.total_bytes = int(total_bytes or 0)
+        self.status = "queued"
+        self.error = None
+        self.result = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+        self.bytes_read = 0
+        self.lines_parsed = 0
+        self.rows_kept = 0
+        self.rows_inserted = 0
+
+        self._cancel = threading.Event()
+        self._samples = deque()
+        self._parts = {}
+        self._parts_lock = threading.Lock()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in ("completed", "failed", "cancelled")
+
+    def cancel(self):
+        self._cancel.set()
+        if self.status in ("queued", "running"):
+            self.status = "cancelling"
+
+    def update(self, bytes_read: int = None, lines_parsed: int = None, rows_kept: int = None, rows_inserted: int = None):
+        """Record absolute counter values reported by the ingest loop."""
+        if bytes_read is not None:
+            self.bytes_read = int(bytes_read)
+        if lines_parsed is not None:
+            self.lines_parsed = int(lines_parsed)
+        if rows_kept is not None:
+            self.rows_kept = int(rows_kept)
+        if rows_inserted is not None:
+            self.rows_inserted = int(rows_inserted)
+
+        now = time.monotonic()
+        if not self._samples or now - self._samples[-1][0] >= 1:
+            self._samples.append((now, self.rows_inserted, self.bytes_read))
+            while len(self._samples) > 2 and now - self._samples[0][0] > RATE_WINDOW_SECONDS:
+                self._samples.popleft()
+
+    def part(self, key, stop: threading.Event = None) -> "JobPart":
+        """Return a progress sink for one of several concurrent loads of this job.
+
+        Setting `stop` cancels just the loads sharing it, e.g. once a sibling failed.
+        """
+        return JobPart(self, key, stop)
+
+    def _update_part(self, key, counters: dict):
+        with self._parts_lock:
+            self._parts.setdefault(key, {}).update(
+                (name, value) for name, value in counters.items() if value is not None
+            )
+            totals = {}
+            for part in self._parts.values():
+                for name, value in part.items():
+                    totals[name] = totals.get(name, 0) + value
+            self.update(**totals)
+
+    def _rates(self):
+        """Return (rows/sec, compressed bytes/sec) over the recent sample window."""
+        if len(self._samples) < 2:
+            elapsed = (time.time() - self.started_at) if self.started_at else 0
+            if elapsed <= 0:
+                return 0.0, 0.0
+            return self.rows_inserted / elapsed, self.bytes_read / elapsed
+        t0, rows0, bytes0 = self._samples[0]
+        t1, rows1, bytes1 = self._samples[-1]
+        span = t1 - t0
+        if span <= 0:
+            return 0.0, 0.0
+        return (rows1 - rows0) / span, (bytes1 - bytes0) / span
+
+    def snapshot(self) -> dict:
+        elapsed = None
+        if self.started_at:
+            elapsed = (self.finished_at or time.time()) - self.started_at
+
+        eta = None
+        if self.finished:
+            # Report the whole-run average once the job has stopped
+            rows_per_sec = self.rows_inserted / elapsed if elapsed else 0.0
+        else:
+            rows_per_sec, bytes_per_sec = self._rates()
+            if self.total_bytes and bytes_per_sec > 0:
+                eta = max(0.0, (self.total_bytes - self.bytes_read) / bytes_per_sec)
+
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "schema_name": self.schema_name,
+            "file_name": self.file_name,
+            "bytes_total": self.total_bytes,
+            "bytes_read": self.bytes_read,
+            "lines_parsed": self.lines_parsed,
+            "rows_kept": self.rows_kept,
+            "rows_inserted": self.rows_inserted,
+            "rows_per_sec": round(rows_per_sec, 1),
+            "eta_seconds": round(eta, 1) if eta is not None else None,
+            "elapsed_seconds": round(elapsed, 1) if elapsed is not None else None,
+            "error": self.error,
+            "result": self.result,
+        }
+
+
+class JobPart:
+    """Progress object for one input of a multi-input job.
+
+    Accepts the same `update()` calls as IngestJob and reports the sum over
+    all parts to the job; cancelling the job cancels every part.
+    """
+
+    def __init__(self, job: IngestJob, key, stop: threading.Event = None):
+        self.job = job
+        self.key = key
+        self.stop = stop
+
+    @property
+    def cancelled(self) -> bool:
+        return self.job.cancelled or (self.stop is not None and self.stop.is_set())
+
+    def update(self, bytes_read: int = None, lines_parsed: int = None, rows_kept: int = None, rows_inserted: int = None):
+        self.job._update_part(self.key, {
+            "bytes_read": bytes_read,
+            "lines_parsed": lines_parsed,
+            "rows_kept": rows_kept,
+            "rows_inserted": rows_inserted,
+        })
+
+
+def _prune_finished_jobs():
+    cutoff = time.time() - JOB_RETENTION_SECONDS
+    with _jobs_lock:
+        stale = [jid for jid, job in _jobs.items() if job.finished and (job.finished_at or 0) < cutoff]
+        for jid in stale:
+            _jobs.pop(jid, None)
+
+
+def submit_job(job: IngestJob, target, on_cancel=None, on_failure=None) -> IngestJob:
+    """Register `job` and run `target(job)` on the ingest pool.
+
+    `target` returns the job result. When the job is cancelled (the target
+    raises after `job.cancel()`, or it was cancelled while queued) `on_cancel`
+    runs for cleanup; other exceptions mark the job failed and run
+    `on_failure`. Both callbacks receive the job.
+    """
+    _prune_finished_jobs()
+    with _jobs_lock:
+        _jobs[job.id] = job
+
+    def _run():
+        job.started_at = time.time()
+        try:
+            if job.cancelled:
+                raise RuntimeError("Cancelled before start")
+            job.status = "running"
+            job.result = target(job)
+            job.status = "completed"
+        except Exception as exc:
+            if job.cancelled:
+                job.status = "cancelled"
+                callback = on_cancel
+            else:
+                job.status = "failed"
+                job.error = str(exc)
+                callback = on_failure
+                print(f"[jobs] ingest job {job.id} failed: {exc}")
+            if callback is not None:
+                try:
+                    callback(job)
+                except Exception as cleanup_exc:
+                    print(f"[jobs] cleanup for job {job.id} failed: {cleanup_exc}")
+        finally:
+            job.finished_at = time.time()
+
+    _executor.submit(_run)
+    return job
+
+
+def get_job(job_id: str):
+    with _jobs_lock:
+        return _jobs.get(job_id)
+
+
+def list_jobs(user_id: int):
+    with _jobs_lock:
+        jobs = [job for job in _jobs.values() if job.user_id == user_id]
+    return sorted(jobs, key=lambda job: job.created_at, reverse=True)
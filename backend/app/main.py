@@ -1,14 +1,20 @@
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 try:
     from app.api import routes
     from app.database import engine, Base
     from app.config import settings
+    from app.responses import FastJSONResponse, CompressionMiddleware
+    from scripts.llm_client import close_shared_client
 except:
     try:
         from backend.app.api import routes
         from backend.app.database import engine, Base
         from backend.app.config import settings
+        from backend.app.responses import FastJSONResponse, CompressionMiddleware
+        from backend.scripts.llm_client import close_shared_client
     except Exception as exc:
         print("Failed", exc)
         raise exc
@@ -16,7 +22,15 @@ import os
 
 Base.metadata.create_all(bind=engine)
 
-app = FastAPI(title="Qualitative Coding API")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    # Close the shared LLM client's connection pool on shutdown
+    await close_shared_client()
+
+
+app = FastAPI(title="Qualitative Coding API", default_response_class=FastJSONResponse, lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -30,6 +44,8 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+app.add_middleware(CompressionMiddleware)
+
 app.include_router(routes.router, prefix="/api")
 
 @app.get("/")
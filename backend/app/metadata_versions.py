@@ -0,0 +1,54 @@
+from sqlalchemy import event, text
+
+try:
+    from app.database import SessionLocal, engine, File, FileTable, Project
+except Exception as exc:
+    try:
+        from backend.app.database import SessionLocal, engine, File, FileTable, Project
+    except Exception:
+        print("Failed", exc)
+        raise exc
+
+# Per-user version of the file/project metadata shown in the dashboard
+# listings, used as their ETag. Every flushed ORM change to a File, FileTable
+# or Project replaces its owner's token in the metadata_versions table within
+# the same transaction, so the version commits or rolls back with the change
+# and every worker process reads the same value.
+_BUMP_SQL = text(
+    "INSERT INTO metadata_versions (user_id, version, updated_at) "
+    "VALUES (:user_id, md5(random()::text || clock_timestamp()::text), now()) "
+    "ON CONFLICT (user_id) DO UPDATE SET version = EXCLUDED.version, updated_at = EXCLUDED.updated_at"
+)
+
+
+def metadata_version(user_id: int, conn=None) -> str:
+    """The user's current version token ('0' before their first change)."""
+    if conn is None:
+        with engine.connect() as conn:
+            return metadata_version(user_id, conn)
+    version = conn.execute(
+        text("SELECT version FROM metadata_versions WHERE user_id = :user_id"), {"user_id": int(user_id)}
+    ).scalar()
+    return version or "0"
+
+
+def _owner_of(session, obj):
+    if isinstance(obj, (File, Project)):
+        return obj.user_id
+    if isinstance(obj, FileTable) and obj.file_id is not None:
+        file_rec = session.get(File, obj.file_id)
+        return file_rec.user_id if file_rec is not None else None
+    return None
+
+
+@event.listens_for(SessionLocal, "after_flush")
+def _bump_changed_owners(session, flush_context):
+    owners = set()
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, (File, FileTable, Project)):
+            owner = _owner_of(session, obj)
+            if owner is not None:
+                owners.add(int(owner))
+    if owners:
+        # Sorted so concurrent transactions lock the rows in the same order
+        session.connection().execute(_BUMP_SQL, [{"user_id": owner} for owner in sorted(owners)])
@@ -0,0 +1,166 @@
+import json
+import zlib
+
+import zstandard as zstd
+from fastapi.responses import JSONResponse
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import orjson
+except ImportError:  # optional; the stdlib encoder is used when missing
+    orjson = None
+
+
+def _default(value):
+    # Types orjson leaves to the caller (Decimal from numeric columns, etc.)
+    return str(value)
+
+
+def dumps(content) -> bytes:
+    """Encode `content` as compact UTF-8 JSON, preferring orjson when installed."""
+    if orjson is not None:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":"), default=_default).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with orjson; output is equivalent JSON without padding."""
+
+    def render(self, content) -> bytes:
+        return dumps(content)
+
+
+JSON_STREAM_ROWS = 500
+
+
+def stream_json_rows(key: str, rows, extra: dict = None):
+    """Yield `{key: [row, ...], **extra}` as JSON, a batch of rows per chunk.
+
+    `rows` is any iterable of dicts, typically a server-side cursor, so the
+    whole result never has to be held in memory.
+    """
+    yield b'{"' + key.encode("utf-8") + b'":['
+    batch = []
+    first = True
+    for row in rows:
+        batch.append(dumps(row))
+        if len(batch) >= JSON_STREAM_ROWS:
+            yield (b"" if first else b",") + b",".join(batch)
+            first = False
+            batch = []
+    if batch:
+        yield (b"" if first else b",") + b",".join(batch)
+    tail = dumps(extra)[1:-1] if extra else b""
+    yield b"]" + (b"," + tail if tail else b"") + b"}"
+
+
+# Encodings in order of preference when the client accepts several
+COMPRESSION_ENCODINGS = ("zstd", "gzip")
+COMPRESSION_MIN_BYTES = 1024
+GZIP_LEVEL = 5
+ZSTD_LEVEL = 3
+# Bodies that are already compressed or must reach the client unbuffered
+UNCOMPRESSED_MEDIA_TYPES = ("application/zstd", "application/gzip", "application/zip", "text/event-stream", "image/", "video/", "audio/")
+
+
+def negotiate_encoding(accept_encoding: str):
+    """Pick the preferred COMPRESSION_ENCODINGS entry allowed by Accept-Encoding."""
+    accepted = {}
+    for part in (accept_encoding or "").split(","):
+        name, _, params = part.strip().partition(";")
+        name = name.strip().lower()
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if name:
+            accepted[name] = quality
+    candidates = [e for e in COMPRESSION_ENCODINGS if accepted.get(e, accepted.get("*", 0.0)) > 0]
+    if not candidates:
+        return None
+    return max(candidates, key=lambda e: accepted.get(e, accepted.get("*", 0.0)))
+
+
+class _Compressor:
+    def __init__(self, encoding: str):
+        if encoding == "zstd":
+            self._obj = zstd.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+            self._flush_block = zstd.COMPRESSOBJ_FLUSH_BLOCK
+        else:
+            # wbits 16 + MAX_WBITS writes the gzip container
+            self._obj = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+            self._flush_block = zlib.Z_SYNC_FLUSH
+        self.encoding = encoding
+
+    def compress(self, data: bytes, more: bool) -> bytes:
+        out = self._obj.compress(data)
+        # Flush each streamed chunk so clients can decode rows as they arrive
+        return out + (self._obj.flush(self._flush_block) if more else self._obj.flush())
+
+
+class CompressionMiddleware:
+    """Compress responses with zstd or gzip as negotiated by Accept-Encoding.
+
+    Bodies under `minimum_size` bytes, responses that already carry a
+    Content-Encoding and UNCOMPRESSED_MEDIA_TYPES pass through unchanged.
+    Streaming responses are compressed chunk by chunk.
+    """
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_BYTES):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        start_message = None
+        compressor = None
+        passthrough = False
+
+        async def send_compressed(message):
+            nonlocal start_message, compressor, passthrough
+            if message["type"] == "http.response.start":
+                start_message = message
+                return
+            if message["type"] != "http.response.body" or passthrough:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more = message.get("more_body", False)
+            if compressor is None:
+                headers = MutableHeaders(raw=start_message["headers"])
+                media_type = headers.get("content-type", "")
+                if (
+                    "content-encoding" in headers
+                    or media_type.startswith(UNCOMPRESSED_MEDIA_TYPES)
+                    or (not more and len(body) < self.minimum_size)
+                ):
+                    passthrough = True
+                    await send(start_message)
+                    await send(message)
+                    return
+                compressor = _Compressor(encoding)
+                headers["Content-Encoding"] = encoding
+                headers.add_vary_header("Accept-Encoding")
+                if "content-length" in headers:
+                    del headers["content-length"]
+                body = compressor.compress(body, more)
+                if not more:
+                    headers["Content-Length"] = str(len(body))
+                await send(start_message)
+                await send({"type": "http.response.body", "body": body, "more_body": more})
+                return
+
+            await send({"type": "http.response.body", "body": compressor.compress(body, more), "more_body": more})
+
+        await self.app(scope, receive, send_compressed)
@@ -1,14 +1,18 @@
+import json
 import secrets
 import sqlite3
+from datetime import datetime, timedelta, timezone
 import pandas as pd
 from sqlalchemy import text
 try:
-    from app.database import engine
+    from app.database import engine, FileStat
     from app.databasemanager import DatabaseManager
+    from app.catalog import schema_tables, invalidate_schema
 except Exception as exc:
     try:
-        from backend.app.database import engine
+        from backend.app.database import engine, FileStat
         from backend.app.databasemanager import DatabaseManager
+        from backend.app.catalog import schema_tables, invalidate_schema
     except Exception:
         print("Failed", exc)
         raise exc
@@ -70,6 +74,7 @@ def migrate_sqlite_file(user_id: int, file_path: str, display_name: str, project
             )
 
         sqlite_conn.close()
+        invalidate_schema(schema_name)
         print(f"--> Successfully migrated '{display_name}'!")
 
 def migrate_text_file(user_id: int, file_path: str, display_name: str, project_type: str):
@@ -120,5 +125,144 @@ def migrate_text_file(user_id: int, file_path: str, display_name: str, project_t
             table_name="content_store",
             row_count=1
         )
+        invalidate_schema(schema_name)
         
-        print(f"--> Success! Text saved to {schema_name}.content_store")
\ No newline at end of file
+        print(f"--> Success! Text saved to {schema_name}.content_store")
+
+
+FACET_TABLES = ("submissions", "comments")
+FACET_TOP_N = 50
+# (facet key, SQL expression, required column). Weeks start on Monday, UTC.
+FACETS = (
+    ("subreddits", "subreddit", "subreddit"),
+    ("authors", "author", "author"),
+    ("weekly", "(date_trunc('week', to_timestamp(created_utc) AT TIME ZONE 'UTC'))::date", "created_utc"),
+)
+FACET_ROW_COLUMNS = {"subreddits": "subreddit", "authors": "author"}
+
+
+def compute_file_facets(conn, schema_name: str) -> dict:
+    """Aggregate the facets of each data table of a file schema.
+
+    One scan per table: GROUPING SETS yield the per-subreddit, per-author and
+    per-week counts plus the grand total together. Returns
+    {table: {"rows": n, "subreddits": [...], "authors": [...], "weekly": [...]}}
+    with the top FACET_TOP_N subreddits/authors and every week; facets whose
+    column the table lacks (e.g. filtered files) are omitted.
+    """
+    columns = schema_tables(schema_name, conn)
+
+    facets = {}
+    for table_name in FACET_TABLES:
+        if table_name not in columns:
+            continue
+        present = [(key, expr) for key, expr, column in FACETS if column in columns[table_name]]
+        stats = {"rows": 0}
+        stats.update((key, []) for key, _ in present)
+        if not present:
+            stats["rows"] = int(conn.execute(text(f'SELECT count(*) FROM "{schema_name}"."{table_name}"')).scalar() or 0)
+            facets[table_name] = stats
+            continue
+        facet_case = " ".join(f"WHEN GROUPING({key}) = 0 THEN '{key}'" for key, _ in present)
+        value_case = " ".join(f"WHEN GROUPING({key}) = 0 THEN {key}::text" for key, _ in present)
+        select_list = ", ".join(f"{expr} AS {key}" for key, expr in present)
+        grouping_sets = "".join(f"({key}), " for key, _ in present) + "()"
+        rows = conn.execute(text(f"""
+            SELECT facet, value, n FROM (
+                SELECT facet, value, n,
+                       row_number() OVER (PARTITION BY facet ORDER BY n DESC, value) AS rn
+                FROM (
+                    SELECT CASE {facet_case} ELSE 'rows' END AS facet,
+                           CASE {value_case} ELSE NULL END AS value,
+                           count(*) AS n
+                    FROM (SELECT {select_list} FROM "{schema_name}"."{table_name}") s
+                    GROUP BY GROUPING SETS ({grouping_sets})
+                ) grouped
+            ) ranked
+            WHERE facet = 'rows' OR (value IS NOT NULL AND (facet = 'weekly' OR rn <= :top))
+        """), {"top": FACET_TOP_N}).fetchall()
+        for facet, value, n in rows:
+            if facet == "rows":
+                stats["rows"] = int(n)
+            elif facet == "weekly":
+                stats["weekly"].append({"week": value, "count": int(n)})
+            else:
+                stats[facet].append({"value": value, "count": int(n)})
+        if "weekly" in stats:
+            stats["weekly"].sort(key=lambda entry: entry["week"])
+        for key in FACET_ROW_COLUMNS:
+            if key in stats:
+                stats[key].sort(key=lambda entry: (-entry["count"], entry["value"]))
+        facets[table_name] = stats
+    return facets
+
+
+def refresh_file_stats(schema_name: str) -> dict:
+    """Recompute and store the FileStat row of a file schema; returns the facets."""
+    with engine.connect() as conn:
+        facets = compute_file_facets(conn, schema_name)
+    with DatabaseManager() as db:
+        db.session.merge(FileStat(
+            schemaname=schema_name,
+            facets=json.dumps(facets),
+            computed_at=datetime.now(timezone.utc),
+        ))
+    return facets
+
+
+def _week_start(created_utc):
+    try:
+        day = datetime.fromtimestamp(int(created_utc), tz=timezone.utc).date()
+    except (TypeError, ValueError, OverflowError, OSError):
+        return None
+    return (day - timedelta(days=day.weekday())).isoformat()
+
+
+def discount_file_stats(schema_name: str, table_name: str, removed_rows) -> bool:
+    """Subtract deleted rows from a schema's stored facets instead of rescanning.
+
+    `removed_rows` are mappings with the deleted rows' columns. Counts stay
+    exact for every listed value; a value just outside the stored top list
+    can only enter it at the next refresh. Returns False when the schema has
+    no stored facets.
+    """
+    removed_rows = list(removed_rows)
+    with DatabaseManager() as db:
+        stat = db.session.query(FileStat).filter(FileStat.schemaname == schema_name).with_for_update().first()
+        if stat is None:
+            return False
+        facets = json.loads(stat.facets)
+        stats = facets.get(table_name)
+        if stats is None or not removed_rows:
+            return True
+
+        stats["rows"] = max(0, stats.get("rows", 0) - len(removed_rows))
+        for key, column in FACET_ROW_COLUMNS.items():
+            if key not in stats:
+                continue
+            removed = {}
+            for row in removed_rows:
+                value = row.get(column)
+                if value is not None:
+                    removed[value] = removed.get(value, 0) + 1
+            stats[key] = sorted(
+                (
+                    {"value": entry["value"], "count": entry["count"] - removed.get(entry["value"], 0)}
+                    for entry in stats[key]
+                    if entry["count"] > removed.get(entry["value"], 0)
+                ),
+                key=lambda entry: (-entry["count"], entry["value"]),
+            )
+        if "weekly" in stats:
+            removed = {}
+            for row in removed_rows:
+                week = _week_start(row.get("created_utc"))
+                if week is not None:
+                    removed[week] = removed.get(week, 0) + 1
+            stats["weekly"] = [
+                {"week": entry["week"], "count": entry["count"] - removed.get(entry["week"], 0)}
+                for entry in stats["weekly"]
+                if entry["count"] > removed.get(entry["week"], 0)
+            ]
+        stat.facets = json.dumps(facets)
+    return True
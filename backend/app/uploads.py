@@ -0,0 +1,153 @@
+import codecs
+import os
+import tempfile
+from pathlib import Path
+
+from fastapi import HTTPException, UploadFile
+from starlette.datastructures import FormData, Headers
+
+try:
+    from python_multipart.exceptions import FormParserError
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ImportError:  # python-multipart < 0.0.13
+    from multipart.exceptions import FormParserError
+    from multipart.multipart import MultipartParser, parse_options_header
+
+# Limits on the non-file parts of a multipart body, as in Starlette's parser
+MAX_FORM_FIELDS = 1000
+MAX_FORM_FILES = 1000
+MAX_FIELD_BYTES = 1024 * 1024
+
+
+class DiskUpload(UploadFile):
+    """An UploadFile written straight to a named file that outlives the request."""
+
+    @property
+    def path(self) -> str:
+        return self.file.name
+
+
+def _decode(value: bytes, charset: str) -> str:
+    try:
+        return value.decode(charset)
+    except (UnicodeDecodeError, LookupError):
+        return value.decode("latin-1")
+
+
+async def receive_form_to_disk(request, directory: str = None) -> FormData:
+    """Parse a multipart body, streaming each file part to its own file on disk.
+
+    `request.form()` spools files to anonymous temporary files, so keeping an
+    upload meant copying it once more. Here every file part is written once,
+    as it arrives, to a named file in `directory` (default: the system temp
+    dir) and returned as a DiskUpload; other fields are returned as strings.
+    The caller owns the files: move them, or remove them with discard_uploads.
+    """
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    boundary = params.get(b"boundary")
+    if content_type != b"multipart/form-data" or not boundary:
+        raise HTTPException(status_code=400, detail="Expected a multipart/form-data body")
+    charset = params.get(b"charset", b"utf-8").decode("latin-1")
+    try:
+        charset = codecs.lookup(charset).name
+    except LookupError:
+        charset = "latin-1"
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    items = []
+    uploads = []
+    writes = []
+    part = {}
+    counts = {"fields": 0, "files": 0}
+
+    def on_part_begin():
+        part.clear()
+        part.update(headers=[], field=b"", value=b"", data=bytearray(), upload=None, ended=False)
+
+    def on_header_field(data, start, end):
+        part["field"] += data[start:end]
+
+    def on_header_value(data, start, end):
+        part["value"] += data[start:end]
+
+    def on_header_end():
+        part["headers"].append((part["field"].lower(), part["value"]))
+        part["field"] = part["value"] = b""
+
+    def on_headers_finished():
+        disposition = dict(part["headers"]).get(b"content-disposition", b"")
+        _, options = parse_options_header(disposition)
+        if b"name" not in options:
+            raise HTTPException(status_code=400, detail='Multipart part without a Content-Disposition "name"')
+        part["name"] = _decode(options[b"name"], charset)
+        if b"filename" in options:
+            counts["files"] += 1
+            if counts["files"] > MAX_FORM_FILES:
+                raise HTTPException(status_code=400, detail=f"Too many files; at most {MAX_FORM_FILES} are accepted")
+            filename = _decode(options[b"filename"], charset)
+            fh = tempfile.NamedTemporaryFile(suffix=Path(filename).suffix, dir=directory, delete=False)
+            part["upload"] = DiskUpload(fh, size=0, filename=filename, headers=Headers(raw=part["headers"]))
+            uploads.append(part["upload"])
+        else:
+            counts["fields"] += 1
+            if counts["fields"] > MAX_FORM_FIELDS:
+                raise HTTPException(status_code=400, detail=f"Too many fields; at most {MAX_FORM_FIELDS} are accepted")
+
+    def on_part_data(data, start, end):
+        if part["upload"] is not None:
+            writes.append((part["upload"], data[start:end]))
+        elif len(part["data"]) + end - start > MAX_FIELD_BYTES:
+            raise HTTPException(status_code=400, detail=f"Form field exceeds {MAX_FIELD_BYTES // 1024}KB")
+        else:
+            part["data"] += data[start:end]
+
+    def on_part_end():
+        part["ended"] = True
+        if part["upload"] is not None:
+            items.append((part["name"], part["upload"]))
+        else:
+            items.append((part["name"], _decode(bytes(part["data"]), charset)))
+
+    parser = MultipartParser(boundary, {
+        "on_part_begin": on_part_begin,
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end,
+    })
+    try:
+        async for chunk in request.stream():
+            parser.write(chunk)
+            # UploadFile.write runs the disk write in the threadpool
+            for upload, data in writes:
+                await upload.write(data)
+            writes.clear()
+        parser.finalize()
+        if part and not part["ended"]:
+            raise HTTPException(status_code=400, detail="Invalid multipart data: the body ends inside a part")
+        for upload in uploads:
+            await upload.seek(0)
+    except FormParserError:
+        discard_uploads(uploads)
+        raise HTTPException(status_code=400, detail="Invalid multipart data")
+    except BaseException:
+        discard_uploads(uploads)
+        raise
+    return FormData(items)
+
+
+def discard_uploads(uploads):
+    """Close and delete the DiskUpload files of a form or list; other items are ignored."""
+    if isinstance(uploads, FormData):
+        uploads = [value for _, value in uploads.multi_items()]
+    for upload in uploads:
+        if not isinstance(upload, DiskUpload):
+            continue
+        try:
+            upload.file.close()
+            os.unlink(upload.path)
+        except OSError:
+            pass
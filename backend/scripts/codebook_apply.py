@@ -1,43 +1,18 @@
-import time
-from openai import OpenAI
+try:
+    from scripts.llm_client import chat_completion
+except Exception as exc:
+    try:
+        from backend.scripts.llm_client import chat_completion
+    except Exception:
+        print("Failed", exc)
+        raise exc
 
-OPENROUTER_URL = "https://openrouter.ai/api/v1"
 FREE_MODEL = "google/gemini-2.0-flash-exp:free"
-MAX_RETRIES = 3
-INITIAL_RETRY_DELAY = 2  
 
-def get_client(system_prompt: str, user_prompt: str, api_key: str) -> str:
-    if not api_key:
-        raise ValueError("OpenRouter API key is required")
-    for attempt in range(1, MAX_RETRIES + 1):
-        try:
-            client = OpenAI(
-                api_key=api_key,
-                base_url=OPENROUTER_URL,
-            )
-            response = client.chat.completions.create(
-                model=FREE_MODEL,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt},
-                ],
-                temperature=0.05,
-                timeout=300, 
-                extra_body={"transforms": ["middle-out"]}
-            )
-            return response.choices[0].message.content
-        except KeyboardInterrupt:
-            print("\nkeyboard interrupt")
-            raise
-        except Exception as e:
-            if attempt == MAX_RETRIES:
-                raise
-            wait_time = INITIAL_RETRY_DELAY * (2 ** (attempt - 1))
-            print(f"\nAPI call failed (attempt {attempt}/{MAX_RETRIES}): {type(e).__name__}")
-            print(f"Retrying in {wait_time}s...")
-            time.sleep(wait_time)
+async def get_client(system_prompt: str, user_prompt: str, api_key: str, use_cache: bool = True) -> str:
+    return await chat_completion(FREE_MODEL, system_prompt, user_prompt, api_key, use_cache=use_cache)
 
-def classify_posts(codebook: str, posts_content: str, methodology: str, api_key: str) -> str:
+async def classify_posts(codebook: str, posts_content: str, methodology: str, api_key: str, use_cache: bool = True) -> str:
     
     system_prompt = f"""
     You are a highly meticulous qualitative data coder. Your task is to process the raw POSTS CONTENT by applying the codes defined in the CODEBOOK.
@@ -73,6 +48,6 @@ def classify_posts(codebook: str, posts_content: str, methodology: str, api_key:
     {methodology}
     """
     
-    return get_client(system_prompt, user_prompt, api_key)
+    return await get_client(system_prompt, user_prompt, api_key, use_cache=use_cache)
 
 
@@ -2,57 +2,27 @@ import time
 import ast
 import json
 import re
-from openai import OpenAI
+import asyncio
+try:
+    from scripts.llm_client import chat_completion
+    from scripts.filter_verdicts import prompt_hash, stored_verdicts, record_verdicts
+except Exception as exc:
+    try:
+        from backend.scripts.llm_client import chat_completion
+        from backend.scripts.filter_verdicts import prompt_hash, stored_verdicts, record_verdicts
+    except Exception:
+        print("Failed", exc)
+        raise exc
 
-OPENROUTER_URL = "https://openrouter.ai/api/v1"
 FREE_MODEL = "google/gemini-2.0-flash-exp:free"
-MAX_RETRIES = 3
-INITIAL_RETRY_DELAY = 2  
 
-def get_client(system_prompt: str, user_prompt: str, api_key: str) -> str:
-    if not api_key:
-        raise ValueError("OpenRouter API key is required")
-    for attempt in range(1, MAX_RETRIES + 1):
-        try:
-            client = OpenAI(
-                api_key=api_key,
-                base_url=OPENROUTER_URL,
-            )
-            response = client.chat.completions.create(
-                model=FREE_MODEL,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_prompt},
-                ],
-                temperature=0.05,
-                timeout=300, 
-                extra_body={"transforms": ["middle-out"]}
-            )
-            return response.choices[0].message.content
-        except KeyboardInterrupt:
-            print("\nkeyboard interrupt")
-            raise
-        except Exception as e:
-            if attempt == MAX_RETRIES:
-                raise
-            wait_time = INITIAL_RETRY_DELAY * (2 ** (attempt - 1))
-            print(f"\nAPI call failed (attempt {attempt}/{MAX_RETRIES}): {type(e).__name__}")
-            print(f"Retrying in {wait_time}s...")
-            time.sleep(wait_time)
-
-def filter_posts_with_ai(filter_prompt: str, posts_content: str, api_key: str) -> str:
-    """
-    Use AI to filter posts based on a given prompt and return results in Python format.
+async def get_client(system_prompt: str, user_prompt: str, api_key: str, transforms=("middle-out",), use_cache: bool = True,
+                     validate=None) -> str:
+    return await chat_completion(FREE_MODEL, system_prompt, user_prompt, api_key, transforms=transforms, use_cache=use_cache,
+                                 validate=validate)
 
-    Args:
-        filter_prompt (str): The filtering criteria/prompt
-        posts_content (str): The posts content to filter through
-        api_key (str): OpenRouter API key
-
-    Returns:
-        str: Python string with filtered posts as an array of objects: [{id, title, selftext}, ...]
-    """
-    system_prompt = f"""You are an expert content analyst. Your task is to filter posts and return ONLY a Python array of post IDs.
+def posts_system_prompt(filter_prompt: str) -> str:
+    return f"""You are an expert content analyst. Your task is to filter posts and return ONLY a Python array of post IDs.
 
 FILTERING CRITERIA: {filter_prompt}
 
@@ -70,10 +40,43 @@ EXAMPLE OUTPUT FORMAT:
 
 CRITICAL: Return ONLY the raw Python array with NO markdown, NO backticks, NO code fences, and NO additional text or commentary."""
 
+
+def comments_system_prompt(filter_prompt: str) -> str:
+    return f"""You are an expert content analyst. Your task is to filter comments and return ONLY a Python array of comment IDs.
+
+FILTERING CRITERIA: {filter_prompt}
+
+INSTRUCTIONS:
+1. Analyze each comment in the provided content.
+2. Determine which comments match the filtering criteria.
+3. RETURN ONLY a valid Python array of STRING IDs. Each ID must be a quoted string (e.g. 'c1_xyz' or "c1_xyz").
+4. If no comments match, return an empty array: []
+5. ALWAYS ensure the Python array is syntactically valid and properly closed with ].
+
+EXAMPLE OUTPUT FORMAT:
+['id1','id2','id3']
+
+CRITICAL: Return ONLY the raw Python array with NO markdown, NO backticks, NO code fences, and NO additional text or commentary."""
+
+
+async def filter_posts_with_ai(filter_prompt: str, posts_content: str, api_key: str) -> str:
+    """
+    Use AI to filter posts based on a given prompt and return results in Python format.
+
+    Args:
+        filter_prompt (str): The filtering criteria/prompt
+        posts_content (str): The posts content to filter through
+        api_key (str): OpenRouter API key
+
+    Returns:
+        str: Python string with filtered posts as an array of objects: [{id, title, selftext}, ...]
+    """
+    system_prompt = posts_system_prompt(filter_prompt)
+
     user_prompt = f"Here are the posts to filter:\n\n{posts_content}"
 
     try:
-        response = get_client(system_prompt, user_prompt, api_key)
+        response = await get_client(system_prompt, user_prompt, api_key)
         print(response[:100])
         print("...")
         print(response[-100:])
@@ -83,32 +86,18 @@ CRITICAL: Return ONLY the raw Python array with NO markdown, NO backticks, NO co
         return [{"error": f"Failed to filter posts: {str(e)}"}]
 
 
-def filter_comments_with_ai(filter_prompt: str, comments_content: str, api_key: str):
+async def filter_comments_with_ai(filter_prompt: str, comments_content: str, api_key: str):
     """
     Use AI to filter comments based on a given prompt and return results as a Python list.
 
     Returns an array of objects with ids.
     """
-    system_prompt = f"""You are an expert content analyst. Your task is to filter comments and return ONLY a Python array of comment IDs.
-
-FILTERING CRITERIA: {filter_prompt}
-
-INSTRUCTIONS:
-1. Analyze each comment in the provided content.
-2. Determine which comments match the filtering criteria.
-3. RETURN ONLY a valid Python array of STRING IDs. Each ID must be a quoted string (e.g. 'c1_xyz' or "c1_xyz").
-4. If no comments match, return an empty array: []
-5. ALWAYS ensure the Python array is syntactically valid and properly closed with ].
-
-EXAMPLE OUTPUT FORMAT:
-['id1','id2','id3']
-
-CRITICAL: Return ONLY the raw Python array with NO markdown, NO backticks, NO code fences, and NO additional text or commentary."""
+    system_prompt = comments_system_prompt(filter_prompt)
 
     user_prompt = f"Here are the comments to filter:\n\n{comments_content}"
 
     try:
-        response = get_client(system_prompt, user_prompt, api_key)
+        response = await get_client(system_prompt, user_prompt, api_key)
         print(response[:100])
         print("...")
         print(response[-100:])
@@ -126,4 +115,151 @@ def wrap_in_python_array(content: str):
         print("Warning: No IDs found in content")
         return []
 
-    return matches
\ No newline at end of file
+    return matches
+
+
+EMPTY_ARRAY_RE = re.compile(r"\[\s*\]")
+
+
+def parse_id_array(content: str):
+    """IDs in a model's array response; raises ValueError when there is no array to read.
+
+    Unlike wrap_in_python_array, an empty, missing or unparseable response is
+    an error rather than "no matches"; only an explicit [] means none.
+    """
+    if not content or not content.strip():
+        raise ValueError("Empty response from model")
+    matches = re.findall(r"['\"]([a-zA-Z0-9]+)['\"]", content)
+    if not matches and not EMPTY_ARRAY_RE.search(content):
+        raise ValueError(f"No ID array in model response: {content[:80]!r}")
+    return matches
+
+# Chunked filtering. Each completion gets at most FILTER_CHUNK_TOKENS of rows,
+# so nothing has to be cut by OpenRouter's middle-out transform, and chunks run
+# concurrently up to FILTER_CONCURRENCY requests at a time.
+FILTER_CHUNK_TOKENS = 12000
+FILTER_CONCURRENCY = 4
+# Rough size of a token in characters, for budgeting without a tokenizer
+CHARS_PER_TOKEN = 4
+FILTER_KINDS = {
+    "posts": (posts_system_prompt, "Here are the posts to filter:\n\n"),
+    "comments": (comments_system_prompt, "Here are the comments to filter:\n\n"),
+}
+
+
+def estimate_tokens(text: str) -> int:
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def format_post(row) -> str:
+    return f"ID: {row.get('id') or ''}\nTitle: {row.get('title') or ''}\n{row.get('selftext') or ''}\n\n"
+
+
+def format_comment(row) -> str:
+    return f"CommentID: {row.get('id') or ''}\n{row.get('body') or ''}\n\n"
+
+
+def chunk_rows(entries, max_tokens: int = FILTER_CHUNK_TOKENS):
+    """Group (id, text) entries into chunks of at most `max_tokens` estimated tokens.
+
+    Order is kept. A single entry larger than the budget gets a chunk of its
+    own with its text cut to fit, so every row is still sent.
+    """
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    chunks = []
+    current = []
+    current_chars = 0
+    for row_id, text in entries:
+        if len(text) > max_chars:
+            text = text[:max_chars - 5] + "...\n\n"
+        if current and current_chars + len(text) > max_chars:
+            chunks.append(current)
+            current = []
+            current_chars = 0
+        current.append((row_id, text))
+        current_chars += len(text)
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+async def filter_rows_with_ai(filter_prompt: str, kind: str, entries, api_key: str,
+                              semaphore: asyncio.Semaphore = None, max_tokens: int = FILTER_CHUNK_TOKENS,
+                              use_cache: bool = True) -> dict:
+    """Filter (id, text) entries in token-budgeted chunks sent concurrently.
+
+    `kind` is 'posts' or 'comments'. Pass a shared `semaphore` to bound
+    concurrency across several calls (default: FILTER_CONCURRENCY for this
+    call). Only ids present in a chunk are accepted from its response; a
+    chunk whose request fails or whose response holds no id array (see
+    parse_id_array) is reported as failed, never as matching nothing.
+    `use_cache=False` skips the LLM cache lookup for every chunk.
+    Returns {"ids": matching ids in input order, "chunks": per-chunk stats
+    (rows, tokens, seconds, matched, error), "failed_rows": rows in chunks
+    whose request failed, "judged": ids of the rows in successful chunks}.
+    """
+    system_prompt_for, user_prefix = FILTER_KINDS[kind]
+    system_prompt = system_prompt_for(filter_prompt)
+    semaphore = semaphore or asyncio.Semaphore(FILTER_CONCURRENCY)
+    chunks = chunk_rows(entries, max_tokens)
+
+    async def run_chunk(index, chunk):
+        content = "".join(text for _, text in chunk)
+        stats = {"chunk": index, "kind": kind, "rows": len(chunk), "tokens": estimate_tokens(content),
+                 "seconds": None, "matched": 0, "error": None}
+        async with semaphore:
+            started = time.monotonic()
+            try:
+                # Unparseable answers are kept out of the LLM cache so the chunk is really retried
+                response = await get_client(system_prompt, user_prefix + content, api_key, (), use_cache,
+                                            validate=parse_id_array)
+                response_ids = parse_id_array(response)
+            except Exception as e:
+                stats["error"] = f"{type(e).__name__}: {e}"
+                response_ids = []
+            stats["seconds"] = round(time.monotonic() - started, 3)
+        chunk_ids = {str(row_id) for row_id, _ in chunk}
+        matched = {i for i in response_ids if i in chunk_ids}
+        stats["matched"] = len(matched)
+        return stats, matched
+
+    results = await asyncio.gather(*(run_chunk(i, chunk) for i, chunk in enumerate(chunks)))
+    matched = set().union(*(ids for _, ids in results)) if results else set()
+    return {
+        "ids": [str(row_id) for row_id, _ in entries if str(row_id) in matched],
+        "chunks": [stats for stats, _ in results],
+        "failed_rows": sum(stats["rows"] for stats, _ in results if stats["error"]),
+        "judged": [str(row_id) for chunk, (stats, _) in zip(chunks, results) if not stats["error"] for row_id, _ in chunk],
+    }
+
+
+async def filter_rows_incremental(filter_prompt: str, kind: str, entries, api_key: str, schema: str, table: str,
+                                  semaphore: asyncio.Semaphore = None, use_cache: bool = True) -> dict:
+    """filter_rows_with_ai over only the entries with no stored verdict.
+
+    Verdicts are kept per row of `schema`.`table` for this filter prompt and
+    FREE_MODEL (scripts.filter_verdicts). Rows judged by an earlier run are
+    answered from the store, the rest are sent to the model and their
+    verdicts recorded; rows of failed chunks get none and are sent again
+    next run. With `use_cache=False` every entry is judged afresh
+    and replaces its stored verdict. Returns filter_rows_with_ai's result
+    with "ids" covering all entries, plus "verdicts_reused" and "rows_sent".
+    """
+    key = prompt_hash(FILTER_KINDS[kind][0](filter_prompt))
+    known = {}
+    if use_cache and entries:
+        try:
+            known = await asyncio.to_thread(stored_verdicts, schema, table, key, FREE_MODEL)
+        except Exception as e:
+            print(f"Warning: could not read stored filter verdicts: {e}")
+    pending = [entry for entry in entries if str(entry[0]) not in known]
+    result = await filter_rows_with_ai(filter_prompt, kind, pending, api_key, semaphore, use_cache=use_cache)
+    try:
+        await asyncio.to_thread(record_verdicts, schema, table, key, FREE_MODEL, result["judged"], result["ids"])
+    except Exception as e:
+        print(f"Warning: could not store filter verdicts: {e}")
+    matched = set(result["ids"]).union(row_id for row_id, is_match in known.items() if is_match)
+    result["ids"] = [str(row_id) for row_id, _ in entries if str(row_id) in matched]
+    result["verdicts_reused"] = len(entries) - len(pending)
+    result["rows_sent"] = len(pending)
+    return result
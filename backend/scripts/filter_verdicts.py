@@ -0,0 +1,55 @@
+# Per-row results of LLM filtering, stored in the filter_verdicts table. A
+# verdict records whether a row of a file schema matched a filter prompt under
+# a given model, so re-running the same filter on the same schema only sends
+# the rows judged by no earlier run (for example rows merged in since).
+import hashlib
+
+from sqlalchemy import text
+try:
+    from app.database import engine
+except Exception as exc:
+    try:
+        from backend.app.database import engine
+    except Exception:
+        print("Failed", exc)
+        raise exc
+
+
+def prompt_hash(system_prompt: str) -> str:
+    return hashlib.sha256(system_prompt.encode("utf-8")).hexdigest()
+
+
+def stored_verdicts(schema: str, table: str, key: str, model: str) -> dict:
+    """{row id: matched} of every stored verdict for this schema table, prompt hash and model."""
+    with engine.connect() as conn:
+        rows = conn.execute(text(
+            "SELECT row_id, matched FROM filter_verdicts "
+            "WHERE schemaname = :schema AND table_name = :table AND prompt_hash = :key AND model = :model"
+        ), {"schema": schema, "table": table, "key": key, "model": model}).fetchall()
+    return {row_id: matched for row_id, matched in rows}
+
+
+def record_verdicts(schema: str, table: str, key: str, model: str, judged_ids, matched_ids) -> int:
+    """Store a verdict for every judged row id, replacing earlier ones; returns the count."""
+    judged_ids = list(dict.fromkeys(str(row_id) for row_id in judged_ids))
+    if not judged_ids:
+        return 0
+    matched_ids = {str(row_id) for row_id in matched_ids}
+    with engine.begin() as conn:
+        conn.execute(text(
+            "INSERT INTO filter_verdicts (schemaname, table_name, prompt_hash, model, row_id, matched, judged_at) "
+            "SELECT :schema, :table, :key, :model, v.row_id, v.matched, now() "
+            "FROM unnest(CAST(:ids AS text[]), CAST(:matched AS boolean[])) AS v(row_id, matched) "
+            "ON CONFLICT (schemaname, table_name, prompt_hash, model, row_id) "
+            "DO UPDATE SET matched = EXCLUDED.matched, judged_at = EXCLUDED.judged_at"
+        ), {"schema": schema, "table": table, "key": key, "model": model,
+            "ids": judged_ids, "matched": [row_id in matched_ids for row_id in judged_ids]})
+    return len(judged_ids)
+
+
+def discard_verdicts(schema: str, conn=None) -> int:
+    """Delete every verdict of a schema, e.g. when the schema is dropped."""
+    if conn is None:
+        with engine.begin() as conn:
+            return discard_verdicts(schema, conn)
+    return conn.execute(text("DELETE FROM filter_verdicts WHERE schemaname = :schema"), {"schema": schema}).rowcount
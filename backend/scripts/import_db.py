@@ -1,216 +1,965 @@
+import bz2
+import gzip
 import json
+import lzma
+import os
+import queue
+import threading
+import time
+import multiprocessing
+from collections import deque
+from contextlib import contextmanager
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor
 import zstandard as zstd
 import io
 from sqlalchemy import text
 try:
     from app.database import engine
+    from app.catalog import invalidate_schema
+    from scripts.ingest_parse import (
+        TABLE_COLUMNS,
+        submission_row,
+        comment_row,
+        encode_csv_rows,
+        parse_block,
+        parse_filter_spec,
+        compile_row_filter,
+        subreddit_prefilter,
+    )
 except Exception as exc:
     try:
         from backend.app.database import engine
+        from backend.app.catalog import invalidate_schema
+        from backend.scripts.ingest_parse import (
+            TABLE_COLUMNS,
+            submission_row,
+            comment_row,
+            encode_csv_rows,
+            parse_block,
+            parse_filter_spec,
+            compile_row_filter,
+            subreddit_prefilter,
+        )
     except Exception:
         print("Failed", exc)
         raise exc
 
-def decompress_zst_file(file_path, chunk_size=16384): 
-    try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            for line in f:
-                line = line.strip()
+class CountingReader(io.RawIOBase):
+    """Binary reader that records how many bytes were consumed from `fh`.
+
+    The running total is written to `stats['bytes_read']` so callers can
+    report compressed-input progress while a decompressor pulls from it.
+    """
+
+    def __init__(self, fh, stats: dict):
+        self.fh = fh
+        self.stats = stats
+        self.stats.setdefault('bytes_read', 0)
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        n = self.fh.readinto(b)
+        if n:
+            self.stats['bytes_read'] += n
+        return n
+
+
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+GZIP_MAGIC = b"\x1f\x8b"
+BZ2_MAGIC = b"BZh"
+XZ_MAGIC = b"\xfd7zXZ\x00"
+INPUT_FORMATS = ("zstd", "gzip", "bz2", "xz", "ndjson")
+# How many leading bytes are inspected when sniffing the input format
+SNIFF_BYTES = 512
+DECOMPRESS_READ_SIZE = 2**20
+PIPELINE_BLOCK_BYTES = 4 * 1024 * 1024
+
+
+class UnsupportedInputFormat(ValueError):
+    """Raised when a dump is neither a supported compressed stream nor NDJSON."""
+
+
+def detect_input_format(head: bytes):
+    """Identify a dump from its leading bytes; returns one of INPUT_FORMATS or None.
+
+    Compressed inputs are recognised by their magic numbers. Anything else
+    counts as plain NDJSON when its first non-blank byte opens a JSON object.
+    """
+    if head.startswith(ZSTD_MAGIC):
+        return "zstd"
+    if head.startswith(GZIP_MAGIC):
+        return "gzip"
+    if head.startswith(BZ2_MAGIC):
+        return "bz2"
+    if head.startswith(XZ_MAGIC):
+        return "xz"
+    text_head = head.lstrip()
+    if text_head.startswith(b"\xef\xbb\xbf"):
+        text_head = text_head[3:].lstrip()
+    if text_head.startswith(b"{"):
+        return "ndjson"
+    return None
+
+
+def sniff_input_format(file_path) -> str:
+    """Return the input format of `file_path`, raising UnsupportedInputFormat."""
+    with open(file_path, 'rb') as fh:
+        head = fh.read(SNIFF_BYTES)
+    fmt = detect_input_format(head)
+    if fmt is None:
+        raise UnsupportedInputFormat(
+            "Unrecognised input: expected zstd, gzip, bz2 or xz compressed NDJSON, or plain NDJSON"
+        )
+    return fmt
+
+
+@contextmanager
+def open_dump(file_path, stats: dict = None, read_size: int = DECOMPRESS_READ_SIZE, start_offset: int = 0):
+    """Open a dump as a decompressed binary stream, whatever its format.
+
+    The format is taken from the magic bytes, so the data is only read once.
+    Compressed bytes consumed are recorded in `stats['bytes_read']`. With
+    `start_offset` the stream starts that many decompressed bytes in: plain
+    NDJSON seeks there, compressed input is decompressed and discarded.
+    """
+    if stats is None:
+        stats = {}
+    fmt = sniff_input_format(file_path)
+    stats['bytes_read'] = 0
+    with open(file_path, 'rb') as fh:
+        if start_offset and fmt == "ndjson":
+            fh.seek(start_offset)
+            stats['bytes_read'] = start_offset
+        source = CountingReader(fh, stats)
+        if fmt == "zstd":
+            stream = io.BufferedReader(zstd.ZstdDecompressor(max_window_size=2**31).stream_reader(
+                source, read_size=read_size, read_across_frames=True
+            ), read_size)
+        elif fmt == "gzip":
+            stream = gzip.GzipFile(fileobj=io.BufferedReader(source, read_size), mode='rb')
+        elif fmt == "bz2":
+            stream = bz2.BZ2File(io.BufferedReader(source, read_size), mode='rb')
+        elif fmt == "xz":
+            stream = lzma.LZMAFile(io.BufferedReader(source, read_size), mode='rb')
+        else:
+            stream = io.BufferedReader(source, read_size)
+        try:
+            if start_offset and fmt != "ndjson":
+                _skip_decompressed(stream, start_offset, read_size)
+            yield stream
+        finally:
+            stream.close()
+
+
+def _skip_decompressed(stream, count: int, read_size: int):
+    remaining = count
+    while remaining > 0:
+        chunk = stream.read(min(remaining, read_size))
+        if not chunk:
+            raise ValueError(f"Dump ends before the resume offset {count}")
+        remaining -= len(chunk)
+
+
+def decompress_zst_file(file_path, chunk_size=16384, stats: dict = None, start_offset: int = 0):
+    """Yield the non-blank lines of a dump as text.
+
+    Despite the name this reads every format in INPUT_FORMATS; invalid UTF-8
+    is dropped. A corrupt or truncated stream ends the iteration early.
+    `stats['offset']` tracks the decompressed offset just past the last
+    yielded line, counting from the start of the dump.
+    """
+    if stats is None:
+        stats = {}
+    offset = start_offset
+    stats['offset'] = offset
+    with open_dump(file_path, stats, read_size=chunk_size, start_offset=start_offset) as stream:
+        try:
+            for raw_line in stream:
+                offset += len(raw_line)
+                line = raw_line.decode('utf-8', errors='ignore').strip()
                 if line:
+                    stats['offset'] = offset
                     yield line
-        return
-    except UnicodeDecodeError:
-        pass  
-    
+        except (OSError, EOFError, zstd.ZstdError) as e:
+            print(f"Error decompressing {file_path}: {e}")
+            return
+
+
+# Records inspected when a dump's data type cannot be told from its name
+DETECT_SAMPLE_LINES = 50
+
+
+def detect_data_type(file_path, file_name: str = None):
+    """Tell whether a dump holds 'submissions' or 'comments'; None if unclear.
+
+    Pushshift names (RS_..., RC_...) decide first; otherwise the keys of the
+    first records are inspected.
+    """
+    name = os.path.basename(file_name or str(file_path)).upper()
+    if name.startswith("RS_"):
+        return "submissions"
+    if name.startswith("RC_"):
+        return "comments"
+
+    lines = decompress_zst_file(file_path)
     try:
-        dctx = zstd.ZstdDecompressor(max_window_size=2**31)
-        
-        with open(file_path, 'rb') as ifh:
-            reader = dctx.stream_reader(ifh, read_size=chunk_size)
-            text_buffer = io.TextIOWrapper(reader, encoding='utf-8', errors='ignore')
-            
-            for line in text_buffer:
-                line = line.strip()
-                if line:
-                    yield line
-    except Exception as e:
-        print(f"Error decompressing {file_path}: {e}")
-        return
+        for line in islice(lines, DETECT_SAMPLE_LINES):
+            try:
+                data = json.loads(line)
+            except Exception:
+                continue
+            if not isinstance(data, dict):
+                continue
+            if 'body' in data or 'parent_id' in data:
+                return "comments"
+            if 'title' in data or 'selftext' in data:
+                return "submissions"
+    finally:
+        lines.close()
+    return None
+
+
+def read_blocks(file_path, block_bytes: int = PIPELINE_BLOCK_BYTES, stats: dict = None, start_offset: int = 0):
+    """Yield decompressed chunks of roughly `block_bytes` that end on a newline.
+
+    Accepts every format in INPUT_FORMATS (see `open_dump`), starting
+    `start_offset` decompressed bytes in. Compressed bytes consumed are
+    recorded in `stats`.
+    """
+    with open_dump(file_path, stats, start_offset=start_offset) as stream:
+        tail = b""
+        while True:
+            chunk = stream.read(block_bytes)
+            if not chunk:
+                break
+            chunk = tail + chunk
+            cut = chunk.rfind(b"\n")
+            if cut < 0:
+                tail = chunk
+                continue
+            tail = chunk[cut + 1:]
+            yield chunk[:cut + 1]
+        if tail.strip():
+            yield tail
+
+
+LOADERS = ("insert", "copy")
+# How often (in input lines) progress is reported and cancellation is checked
+PROGRESS_EVERY_LINES = 5000
+
+
+class IngestCancelled(Exception):
+    """Raised inside stream_zst_to_postgres when its progress object is cancelled."""
+
+
+INSERT_BATCH_SIZE = 1000
+COPY_BATCH_SIZE = 50000
+# Staged COPY rows are merged into the file tables once this many accumulate
+COPY_MERGE_ROWS = 500000
+
+
+# Secondary indexes per file table; an entry is a column or a tuple of columns.
+# (link_id, created_utc) serves comment-thread lookups in display order and
+# (parent_id, created_utc) the reply lookups of the comment-tree builder.
+THREAD_INDEX_COLUMNS = ("link_id", "created_utc")
+REPLY_INDEX_COLUMNS = ("parent_id", "created_utc")
+FILE_TABLE_INDEXES = {
+    "submissions": ("created_utc", "subreddit", "author"),
+    "comments": (THREAD_INDEX_COLUMNS, REPLY_INDEX_COLUMNS, "created_utc", "subreddit", "author"),
+}
+FINALIZE_MAINTENANCE_WORK_MEM = "256MB"
+
+
+def index_sql(schema_name: str, table: str, columns) -> str:
+    """`CREATE INDEX IF NOT EXISTS` for one FILE_TABLE_INDEXES entry."""
+    if isinstance(columns, str):
+        columns = (columns,)
+    name = f'{table}_{"_".join(columns)}_idx'
+    return f'CREATE INDEX IF NOT EXISTS "{name}" ON "{schema_name}"."{table}" ({", ".join(columns)})'
+
+
+def create_file_tables(conn, schema_name: str, deferred: bool = False):
+    """Create the schema and its submissions/comments tables if they don't exist.
+
+    With `deferred` the tables are UNLOGGED and have no primary key, for bulk
+    loading; finalize_file_tables() later dedupes and indexes them. Otherwise
+    the comments table also gets its thread and reply indexes.
+    """
+    unlogged = "UNLOGGED " if deferred else ""
+    id_column = "id TEXT" if deferred else "id TEXT PRIMARY KEY"
+    conn.execute(text(f'CREATE SCHEMA IF NOT EXISTS "{schema_name}"'))
+    conn.execute(text(f'''
+    CREATE {unlogged}TABLE IF NOT EXISTS "{schema_name}"."submissions" (
+        {id_column},
+        subreddit TEXT,
+        title TEXT,
+        selftext TEXT,
+        author TEXT,
+        created_utc BIGINT,
+        score INTEGER,
+        num_comments INTEGER
+    )
+    '''))
+    conn.execute(text(f'''
+    CREATE {unlogged}TABLE IF NOT EXISTS "{schema_name}"."comments" (
+        {id_column},
+        subreddit TEXT,
+        body TEXT,
+        author TEXT,
+        created_utc BIGINT,
+        score INTEGER,
+        link_id TEXT,
+        parent_id TEXT
+    )
+    '''))
+    if not deferred:
+        conn.execute(text(index_sql(schema_name, "comments", THREAD_INDEX_COLUMNS)))
+        conn.execute(text(index_sql(schema_name, "comments", REPLY_INDEX_COLUMNS)))
+
+
+def finalize_file_tables(schema_name: str) -> dict:
+    """Turn deferred-load tables into regular file tables.
+
+    For each table still lacking its primary key: drop rows without an id,
+    dedupe on id keeping the last loaded row (highest ctid, as the upsert
+    loaders keep the last occurrence), switch the table to LOGGED, add the
+    primary key and the FILE_TABLE_INDEXES, and ANALYZE. SET LOGGED rewrites
+    the table and any existing indexes, so it runs before the index builds.
+    Tables that already have a primary key are left alone. Returns the row count per
+    table plus a 'seconds' entry per finalized table.
+    """
+    counts = {}
+    timings = {}
+    with engine.begin() as conn:
+        conn.execute(text(f"SET LOCAL maintenance_work_mem = '{FINALIZE_MAINTENANCE_WORK_MEM}'"))
+        for table in TABLE_COLUMNS:
+            qualified = f'"{schema_name}"."{table}"'
+            has_pkey = conn.execute(text(
+                "SELECT EXISTS (SELECT 1 FROM pg_constraint WHERE conrelid = to_regclass(:rel) AND contype = 'p')"
+            ), {'rel': qualified}).scalar()
+            if not has_pkey:
+                started = time.monotonic()
+                conn.execute(text(f'DELETE FROM {qualified} WHERE id IS NULL'))
+                conn.execute(text(f'''
+                    DELETE FROM {qualified} WHERE ctid IN (
+                        SELECT ctid FROM (
+                            SELECT ctid, row_number() OVER (PARTITION BY id ORDER BY ctid DESC) AS rn
+                            FROM {qualified}
+                        ) ranked
+                        WHERE rn > 1
+                    )
+                '''))
+                conn.execute(text(f'ALTER TABLE {qualified} SET LOGGED'))
+                conn.execute(text(f'ALTER TABLE {qualified} ADD PRIMARY KEY (id)'))
+                for columns in FILE_TABLE_INDEXES[table]:
+                    conn.execute(text(index_sql(schema_name, table, columns)))
+                conn.execute(text(f'ANALYZE {qualified}'))
+                timings[table] = round(time.monotonic() - started, 3)
+            counts[table] = int(conn.execute(text(f'SELECT count(*) FROM {qualified}')).scalar() or 0)
+    counts['seconds'] = timings
+    return counts
+
+
+# Full-text search runs on expression indexes rather than a stored tsvector
+# column: file tables keep their plain column set, which merges, row moves and
+# exports copy with SELECT *. Queries must repeat search_vector_sql() verbatim
+# for the planner to use the index.
+SEARCH_CONFIG = "english"
+SEARCH_TEXT_COLUMNS = {"submissions": ("title", "selftext"), "comments": ("body",)}
+
+
+def search_vector_sql(table: str, alias: str = None) -> str:
+    """The tsvector expression indexed for a file table's text columns."""
+    prefix = f"{alias}." if alias else ""
+    document = " || ' ' || ".join(f"coalesce({prefix}{c}, '')" for c in SEARCH_TEXT_COLUMNS[table])
+    return f"to_tsvector('{SEARCH_CONFIG}'::regconfig, {document})"
+
+
+def search_index_sql(schema_name: str, table: str) -> str:
+    return (
+        f'CREATE INDEX IF NOT EXISTS "{table}_search_idx" ON "{schema_name}"."{table}" '
+        f'USING gin ({search_vector_sql(table)})'
+    )
+
+
+def create_search_indexes(schema_name: str) -> dict:
+    """Build the full-text GIN index of each file table once it is loaded.
+
+    Building after the load is much cheaper than maintaining the index row by
+    row during ingest. Returns the seconds spent per table.
+    """
+    timings = {}
+    with engine.begin() as conn:
+        conn.execute(text(f"SET LOCAL maintenance_work_mem = '{FINALIZE_MAINTENANCE_WORK_MEM}'"))
+        for table in TABLE_COLUMNS:
+            if conn.execute(text("SELECT to_regclass(:rel)"), {'rel': f'"{schema_name}"."{table}"'}).scalar() is None:
+                continue
+            started = time.monotonic()
+            conn.execute(text(search_index_sql(schema_name, table)))
+            timings[table] = round(time.monotonic() - started, 3)
+    return timings
+
+
+def _upsert_sql(schema_name: str, table: str, source: str = None):
+    """Build the `ON CONFLICT (id) DO UPDATE` statement for a file table.
+
+    With `source` the rows are taken from that (staging) table, keeping only the
+    last occurrence of each id; otherwise the statement takes bound parameters.
+    """
+    columns = TABLE_COLUMNS[table]
+    col_list = ", ".join(columns)
+    updates = ",\n".join(f"{c} = EXCLUDED.{c}" for c in columns if c != "id")
+    if source is None:
+        values = "VALUES (" + ", ".join(f":{c}" for c in columns) + ")"
+    else:
+        values = f"SELECT DISTINCT ON (id) {col_list} FROM {source} WHERE id IS NOT NULL ORDER BY id, _seq DESC"
+    return f'''
+        INSERT INTO "{schema_name}"."{table}" ({col_list})
+        {values}
+        ON CONFLICT (id) DO UPDATE SET
+        {updates}
+    '''
+
+
+def _insert_sql(schema_name: str, table: str):
+    """Plain INSERT for deferred-load tables, which have no key to conflict on yet."""
+    columns = TABLE_COLUMNS[table]
+    return (
+        f'INSERT INTO "{schema_name}"."{table}" ({", ".join(columns)}) '
+        f'VALUES ({", ".join(":" + c for c in columns)})'
+    )
+
+
+CHECKPOINT_TABLE = "ingest_checkpoints"
+
 
-def stream_zst_to_postgres(file_path: str, schema_name: str, data_type: str, subreddit_filter=None, batch_size: int = 1000) -> dict:
-    """Stream a .zst file into a Postgres schema's submissions/comments tables.
+class Checkpointer:
+    """Record committed progress in the `ingest_checkpoints` row of a schema.
+
+    Loaders call `record()` on the connection that commits a batch, before the
+    commit, so the checkpoint never runs ahead of the loaded rows. `position`
+    is a dict whose 'lines_parsed' and 'offset' entries describe the input
+    consumed up to and including the batch being committed.
+    """
+
+    def __init__(self, schema_name: str, position: dict, lines: int = 0, offset: int = 0, rows: int = 0, batches: int = 0):
+        self.schema_name = schema_name
+        self.position = position
+        self.start_lines = lines
+        self.start_offset = offset
+        self.rows = rows
+        self.batches = batches
+
+    @classmethod
+    def begin(cls, schema_name: str, file_path: str, data_type: str, position: dict, resume: bool = False):
+        """Start checkpointing a fresh import, or pick up a previous one with `resume`."""
+        with engine.begin() as conn:
+            if resume:
+                row = conn.execute(text(
+                    f'SELECT file_path, data_type, lines_committed, bytes_committed, rows_committed, batches_committed '
+                    f'FROM {CHECKPOINT_TABLE} WHERE schemaname = :schema FOR UPDATE'
+                ), {'schema': schema_name}).first()
+                if row is None:
+                    raise ValueError(f"No checkpoint to resume for {schema_name}")
+                if row.file_path != file_path or row.data_type != data_type:
+                    raise ValueError(f"Checkpoint for {schema_name} was recorded for a different input")
+                conn.execute(text(
+                    f"UPDATE {CHECKPOINT_TABLE} SET status = 'running', error = NULL, updated_at = now() "
+                    f"WHERE schemaname = :schema"
+                ), {'schema': schema_name})
+                return cls(schema_name, position, row.lines_committed, row.bytes_committed,
+                           row.rows_committed, row.batches_committed)
+
+            conn.execute(text(f'''
+                INSERT INTO {CHECKPOINT_TABLE} (schemaname, file_path, data_type, lines_committed, bytes_committed,
+                                                batches_committed, rows_committed, status, created_at, updated_at)
+                VALUES (:schema, :file_path, :data_type, 0, 0, 0, 0, 'running', now(), now())
+                ON CONFLICT (schemaname) DO UPDATE SET
+                    file_path = EXCLUDED.file_path,
+                    data_type = EXCLUDED.data_type,
+                    lines_committed = 0,
+                    bytes_committed = 0,
+                    batches_committed = 0,
+                    rows_committed = 0,
+                    status = 'running',
+                    error = NULL,
+                    updated_at = now()
+            '''), {'schema': schema_name, 'file_path': file_path, 'data_type': data_type})
+        return cls(schema_name, position)
+
+    def record(self, execute, rows: int):
+        """Advance the checkpoint by one batch of `rows`; `execute` runs one SQL string."""
+        lines = int(self.position.get('lines_parsed', 0))
+        offset = int(self.position.get('offset', 0))
+        schema = self.schema_name.replace("'", "''")
+        execute(
+            f"UPDATE {CHECKPOINT_TABLE} SET lines_committed = {lines}, bytes_committed = {offset}, "
+            f"batches_committed = batches_committed + 1, rows_committed = rows_committed + {int(rows)}, "
+            f"updated_at = now() WHERE schemaname = '{schema}'"
+        )
+        self.rows += int(rows)
+        self.batches += 1
+
+    def finish(self, status: str, error: str = None):
+        """Mark the import completed, failed or cancelled."""
+        with engine.begin() as conn:
+            conn.execute(text(
+                f"UPDATE {CHECKPOINT_TABLE} SET status = :status, error = :error, updated_at = now() "
+                f"WHERE schemaname = :schema"
+            ), {'status': status, 'error': error, 'schema': self.schema_name})
+
+
+class InsertLoader:
+    """Load rows with batched `INSERT ... ON CONFLICT DO UPDATE` statements
+    (plain INSERTs into `deferred` tables)."""
+
+    def __init__(self, schema_name: str, batch_size: int = INSERT_BATCH_SIZE, checkpointer: Checkpointer = None, deferred: bool = False):
+        self.schema_name = schema_name
+        self.batch_size = batch_size
+        self.checkpointer = checkpointer
+        self.deferred = deferred
+        self.batches = {table: [] for table in TABLE_COLUMNS}
+        self.counts = {table: 0 for table in TABLE_COLUMNS}
+        self.rows_loaded = 0
+
+    def add(self, table: str, row: dict):
+        batch = self.batches[table]
+        batch.append(row)
+        if len(batch) >= self.batch_size:
+            self.flush(table)
+
+    def flush(self, table: str):
+        batch = self.batches[table]
+        if not batch:
+            return
+        with engine.begin() as conn:
+            sql = _insert_sql(self.schema_name, table) if self.deferred else _upsert_sql(self.schema_name, table)
+            conn.execute(text(sql), batch)
+            if self.checkpointer is not None:
+                self.checkpointer.record(conn.exec_driver_sql, len(batch))
+        self.counts[table] += len(batch)
+        self.rows_loaded += len(batch)
+        self.batches[table] = []
+
+    def finish(self) -> dict:
+        for table in TABLE_COLUMNS:
+            self.flush(table)
+        return dict(self.counts)
+
+    def close(self):
+        pass
+
+
+class CopyLoader:
+    """Stream rows into temporary staging tables with `COPY FROM STDIN`.
+
+    Staged rows are merged into the file tables with a set-based upsert per
+    table whenever `merge_rows` of them have accumulated, and once more in
+    `finish()`, keeping the last occurrence of each id like the insert path
+    does; progress thus advances during a long load while merges stay large.
+    With a checkpointer every COPY is merged right away and checkpointed in
+    the same transaction, since temporary staging tables do not outlive a
+    crashed import. `deferred` tables have no key to merge on,
+    so rows are copied straight into them. `rows_loaded` and `counts` hold
+    the rows written to the file tables (the merged rowcount, so an id merged
+    again in a later round counts again), the same figure the checkpoint
+    records.
+    """
+
+    def __init__(self, schema_name: str, batch_size: int = COPY_BATCH_SIZE, checkpointer: Checkpointer = None, deferred: bool = False,
+                 merge_rows: int = COPY_MERGE_ROWS):
+        self.schema_name = schema_name
+        self.batch_size = batch_size
+        self.merge_rows = merge_rows
+        self.checkpointer = checkpointer
+        self.deferred = deferred
+        self.batches = {table: [] for table in TABLE_COLUMNS}
+        self.staged = {table: 0 for table in TABLE_COLUMNS}
+        self.counts = {table: 0 for table in TABLE_COLUMNS}
+        self.rows_loaded = 0
+        self.raw = engine.raw_connection()
+        if deferred:
+            return
+        cur = self.raw.cursor()
+        try:
+            for table in TABLE_COLUMNS:
+                cur.execute(f'CREATE TEMP TABLE "_stage_{table}" (LIKE "{schema_name}"."{table}") ON COMMIT PRESERVE ROWS')
+                cur.execute(f'ALTER TABLE "_stage_{table}" ADD COLUMN _seq BIGSERIAL')
+                # Rows without an id are dropped by the merge, not rejected by COPY
+                cur.execute(f'ALTER TABLE "_stage_{table}" ALTER COLUMN id DROP NOT NULL')
+            self.raw.commit()
+        finally:
+            cur.close()
+
+    def add(self, table: str, row: dict):
+        batch = self.batches[table]
+        batch.append(row)
+        if len(batch) >= self.batch_size:
+            self.flush(table)
+
+    def add_csv(self, table: str, payload: str, nrows: int):
+        """COPY an already-encoded CSV payload (see encode_csv_rows) into staging."""
+        if not nrows:
+            return
+        columns = TABLE_COLUMNS[table]
+        target = f'"{self.schema_name}"."{table}"' if self.deferred else f'"_stage_{table}"'
+        cur = self.raw.cursor()
+        try:
+            cur.copy_expert(f'COPY {target} ({", ".join(columns)}) FROM STDIN WITH (FORMAT csv)', io.StringIO(payload))
+            loaded = 0
+            if self.deferred:
+                loaded = nrows
+            else:
+                self.staged[table] += nrows
+                if self.checkpointer is not None or self.staged[table] >= self.merge_rows:
+                    loaded = self._merge(cur, table)
+            if self.checkpointer is not None:
+                self.checkpointer.record(cur.execute, loaded)
+            self.raw.commit()
+        except Exception:
+            self.raw.rollback()
+            raise
+        finally:
+            cur.close()
+        self._count(table, loaded)
+
+    def _count(self, table: str, rows: int):
+        self.counts[table] += rows
+        self.rows_loaded += rows
+
+    def _merge(self, cur, table: str) -> int:
+        """Upsert the staged rows; returns the merged rowcount (ids deduplicated)."""
+        cur.execute(_upsert_sql(self.schema_name, table, source=f'"_stage_{table}"'))
+        merged = int(cur.rowcount or 0)
+        cur.execute(f'TRUNCATE "_stage_{table}"')
+        self.staged[table] = 0
+        return merged
+
+    def flush(self, table: str):
+        batch = self.batches[table]
+        if not batch:
+            return
+        self.add_csv(table, encode_csv_rows(TABLE_COLUMNS[table], batch), len(batch))
+        self.batches[table] = []
+
+    def finish(self) -> dict:
+        for table in TABLE_COLUMNS:
+            self.flush(table)
+        cur = self.raw.cursor()
+        try:
+            merged = {table: self._merge(cur, table) for table in TABLE_COLUMNS if self.staged[table]}
+            self.raw.commit()
+        finally:
+            cur.close()
+        for table, rows in merged.items():
+            self._count(table, rows)
+        return dict(self.counts)
+
+    def close(self):
+        if self.deferred:
+            self.raw.close()
+            return
+        try:
+            cur = self.raw.cursor()
+            for table in TABLE_COLUMNS:
+                cur.execute(f'DROP TABLE IF EXISTS "_stage_{table}"')
+            cur.close()
+            self.raw.commit()
+        except Exception:
+            self.raw.rollback()
+        finally:
+            self.raw.close()
+
+
+_PIPELINE_DONE = object()
+
+
+def _pipeline_load(file_path: str, data_type: str, filter_list, workers: int, sink, counters: dict, report,
+                   start_offset: int = 0, position: dict = None, filter_spec: dict = None):
+    """Load a dump through a reader thread, a parse process pool and a writer thread.
+
+    The reader decompresses newline-aligned blocks, worker processes decode,
+    filter (subreddits and `filter_spec`) and CSV-encode them with parse_block, and the writer COPYs the
+    payloads through `sink` in input order, so duplicate ids still resolve to
+    their last occurrence. Bounded queues (and a bounded window of in-flight
+    parse futures) between the stages provide backpressure. Before each COPY
+    the writer stores the block's end position in `position` for checkpoints.
+    """
+    if position is None:
+        position = {}
+    table = 'submissions' if data_type == 'submissions' else 'comments'
+    max_pending = workers * 2
+    blocks = queue.Queue(maxsize=max_pending)
+    parsed = queue.Queue(maxsize=max_pending)
+    stop = threading.Event()
+    errors = []
+
+    def put(q, item):
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def get(q):
+        while True:
+            if errors:
+                raise errors[0]
+            try:
+                return q.get(timeout=0.5)
+            except queue.Empty:
+                continue
+
+    def reader():
+        offset = start_offset
+        try:
+            for block in read_blocks(file_path, stats=counters, start_offset=start_offset):
+                offset += len(block)
+                if not put(blocks, (block, offset)):
+                    return
+        except Exception as exc:
+            errors.append(exc)
+        finally:
+            put(blocks, _PIPELINE_DONE)
+
+    def writer():
+        try:
+            while not stop.is_set():
+                try:
+                    item = parsed.get(timeout=0.5)
+                except queue.Empty:
+                    continue
+                if item is _PIPELINE_DONE:
+                    return
+                payload, nrows, lines_parsed, offset = item
+                position['lines_parsed'] = lines_parsed
+                position['offset'] = offset
+                sink.add_csv(table, payload, nrows)
+        except Exception as exc:
+            errors.append(exc)
+            stop.set()
+
+    reader_thread = threading.Thread(target=reader, name="ingest-reader", daemon=True)
+    writer_thread = threading.Thread(target=writer, name="ingest-writer", daemon=True)
+    # Spawned workers import only scripts.ingest_parse, never the app or its engine
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+    pending = deque()
+
+    def drain_oldest():
+        future, offset = pending.popleft()
+        lines_parsed, rows_kept, payload = future.result()
+        counters['lines_parsed'] += lines_parsed
+        counters['rows_kept'] += rows_kept
+        if not put(parsed, (payload, rows_kept, counters['lines_parsed'], offset)) and errors:
+            raise errors[0]
+
+    try:
+        reader_thread.start()
+        writer_thread.start()
+        while True:
+            item = get(blocks)
+            if item is _PIPELINE_DONE:
+                break
+            block, offset = item
+            pending.append((pool.submit(parse_block, block, data_type, filter_list, filter_spec), offset))
+            if len(pending) >= max_pending:
+                drain_oldest()
+                report()
+        while pending:
+            drain_oldest()
+        put(parsed, _PIPELINE_DONE)
+        writer_thread.join()
+        if errors:
+            raise errors[0]
+    finally:
+        stop.set()
+        pool.shutdown(wait=True, cancel_futures=True)
+        reader_thread.join(timeout=5)
+        writer_thread.join(timeout=5)
+
+
+def _table_is_empty(schema_name: str, table: str) -> bool:
+    with engine.connect() as conn:
+        return not conn.execute(text(f'SELECT EXISTS (SELECT 1 FROM "{schema_name}"."{table}")')).scalar()
+
+
+def stream_zst_to_postgres(file_path: str, schema_name: str, data_type: str, subreddit_filter=None, batch_size: int = None, loader: str = "insert", progress=None, workers: int = 0, checkpoint: bool = False, resume: bool = False, deferred: bool = False, finalize: bool = True, filter_spec: dict = None) -> dict:
+    """Stream a Pushshift dump into a Postgres schema's submissions/comments tables.
 
     Args:
-        file_path: path to the uploaded .zst file
+        file_path: path to the uploaded dump; zstd, gzip, bz2 or xz
+            compressed NDJSON, or plain NDJSON (detected from its magic bytes)
         schema_name: target Postgres schema (e.g., 'proj_abcd')
         data_type: 'submissions' or 'comments'
         subreddit_filter: optional list of subreddit names (lowercase) to keep
-        batch_size: number of rows per insert batch
+        batch_size: number of rows per insert batch (or per COPY for the copy loader)
+        loader: 'insert' for batched upserts, 'copy' for COPY into staging
+            tables followed by one set-based upsert per table
+        progress: optional object with an `update(bytes_read=, lines_parsed=,
+            rows_kept=, rows_inserted=)` method and a `cancelled` attribute
+            (e.g. app.jobs.IngestJob); when cancelled, IngestCancelled is raised
+        workers: when greater than 1, parse in that many worker processes
+            through the pipelined engine (requires the copy loader)
+        checkpoint: record progress in the ingest_checkpoints table with every
+            committed batch, and the final status when the import stops
+        resume: continue a checkpointed import of the same file into the same
+            schema from its last committed batch (implies `checkpoint`)
+        deferred: load into UNLOGGED tables without a primary key and build
+            the key and indexes afterwards (see finalize_file_tables)
+        finalize: with `deferred`, finalize the tables once loaded; pass False
+            when several loads share the schema and finalize after the last
+        filter_spec: optional row filters applied while parsing (created_utc
+            range, minimum score, author lists, deleted/removed text, minimum
+            text length; see scripts.ingest_parse.parse_filter_spec)
 
     Returns:
-        dict with counts: {'submissions': int, 'comments': int}
+        dict with counts: {'submissions': int, 'comments': int}, plus a
+        'stats' dict with the loader name, elapsed seconds and rows/sec.
+        A resumed import's counts include the rows committed before it, and
+        a finalized deferred import's counts are the deduplicated row counts.
     """
-    inserted_counts = {"submissions": 0, "comments": 0}
+    if loader not in LOADERS:
+        raise ValueError(f"loader must be one of: {LOADERS}")
+    workers = int(workers or 0)
+    if workers > 1 and loader != "copy":
+        raise ValueError("The multi-process pipeline requires the 'copy' loader")
 
     # Ensure filter list is normalized
     filter_list = None
     if subreddit_filter:
         filter_list = [s.lower() for s in subreddit_filter]
+    filter_spec = parse_filter_spec(filter_spec) or None
+
+    # Reject unreadable input before creating anything
+    input_format = sniff_input_format(file_path)
 
     # Create schema and tables if they don't exist
     with engine.begin() as conn:
-        conn.execute(text(f'CREATE SCHEMA IF NOT EXISTS "{schema_name}"'))
-        conn.execute(text(f'''
-        CREATE TABLE IF NOT EXISTS "{schema_name}"."submissions" (
-            id TEXT PRIMARY KEY,
-            subreddit TEXT,
-            title TEXT,
-            selftext TEXT,
-            author TEXT,
-            created_utc BIGINT,
-            score INTEGER,
-            num_comments INTEGER
-        )
-        '''))
-        conn.execute(text(f'''
-        CREATE TABLE IF NOT EXISTS "{schema_name}"."comments" (
-            id TEXT PRIMARY KEY,
-            subreddit TEXT,
-            body TEXT,
-            author TEXT,
-            created_utc BIGINT,
-            score INTEGER,
-            link_id TEXT,
-            parent_id TEXT
+        create_file_tables(conn, schema_name, deferred=deferred)
+    invalidate_schema(schema_name)
+    table = 'submissions' if data_type == 'submissions' else 'comments'
+
+    started = time.monotonic()
+    counters = {'bytes_read': 0, 'lines_parsed': 0, 'rows_kept': 0, 'offset': 0}
+    # Input consumed up to the batch being committed; the pipeline's writer
+    # keeps its own copy because parsing runs ahead of loading there
+    position = {} if workers > 1 else counters
+    checkpointer = None
+    resumed_rows = 0
+    if checkpoint or resume:
+        checkpointer = Checkpointer.begin(schema_name, file_path, data_type, position, resume=resume)
+        counters['lines_parsed'] = checkpointer.start_lines
+        counters['offset'] = checkpointer.start_offset
+        if resume and checkpointer.rows and _table_is_empty(schema_name, table):
+            # Unlogged tables come back empty after a server crash, so the
+            # committed batches are gone; start this import over
+            print(f"[import] {schema_name}.{table} lost its rows since the checkpoint; starting over")
+            checkpointer = Checkpointer.begin(schema_name, file_path, data_type, position)
+        resumed_rows = checkpointer.rows
+        if resume:
+            print(f"[import] Resuming {schema_name} at line {checkpointer.start_lines} (offset {checkpointer.start_offset})")
+
+    if loader == "copy":
+        sink = CopyLoader(schema_name, batch_size or COPY_BATCH_SIZE, checkpointer=checkpointer, deferred=deferred)
+    else:
+        sink = InsertLoader(schema_name, batch_size or INSERT_BATCH_SIZE, checkpointer=checkpointer, deferred=deferred)
+
+    def report():
+        if progress is None:
+            return
+        progress.update(
+            bytes_read=counters['bytes_read'],
+            lines_parsed=counters['lines_parsed'],
+            rows_kept=counters['rows_kept'],
+            rows_inserted=resumed_rows + sink.rows_loaded,
         )
-        '''))
+        if progress.cancelled:
+            raise IngestCancelled(f"Ingestion into {schema_name} was cancelled")
+
+    start_offset = counters['offset']
+    try:
+        if workers > 1:
+            _pipeline_load(file_path, data_type, filter_list, workers, sink, counters, report,
+                           start_offset=start_offset, position=position, filter_spec=filter_spec)
+        else:
+            may_match = subreddit_prefilter(filter_list, binary=False)
+            project = submission_row if data_type == 'submissions' else comment_row
+            row_filter = compile_row_filter(filter_spec, table)
+            for line in decompress_zst_file(file_path, stats=counters, start_offset=start_offset):
+                counters['lines_parsed'] += 1
+                if counters['lines_parsed'] % PROGRESS_EVERY_LINES == 0:
+                    report()
 
-    subs_batch = []
-    comm_batch = []
+                # Skip the JSON decode for lines that cannot match the filter
+                if may_match is not None and not may_match(line):
+                    continue
 
-    for line in decompress_zst_file(file_path):
-        try:
-            data = json.loads(line)
-        except Exception:
-            continue
+                try:
+                    data = json.loads(line)
+                except Exception:
+                    continue
 
-        if data_type == 'submissions':
-            subreddit = data.get('subreddit')
-            if filter_list and subreddit and subreddit.lower() not in filter_list:
-                continue
+                subreddit = data.get('subreddit')
+                if filter_list and subreddit and subreddit.lower() not in filter_list:
+                    continue
+                row = project(data)
+                if row_filter is not None:
+                    row = row_filter(row)
+                    if row is None:
+                        continue
+                counters['rows_kept'] += 1
+                sink.add(table, row)
 
-            submission_id = data.get('id')
-            external_url = data.get('url')
-            selftext = data.get('selftext')
-            if not selftext:
-                if not data.get('is_self') and external_url:
-                    selftext = external_url
-                else:
-                    selftext = None
-
-            subs_batch.append({
-                'id': submission_id,
-                'subreddit': subreddit,
-                'title': data.get('title'),
-                'selftext': selftext,
-                'author': data.get('author'),
-                'created_utc': data.get('created_utc'),
-                'score': data.get('score'),
-                'num_comments': data.get('num_comments'),
-            })
-
-            if len(subs_batch) >= batch_size:
-                insert_sql = text(f'''
-                    INSERT INTO "{schema_name}"."submissions"
-                    (id, subreddit, title, selftext, author, created_utc, score, num_comments)
-                    VALUES (:id, :subreddit, :title, :selftext, :author, :created_utc, :score, :num_comments)
-                    ON CONFLICT (id) DO UPDATE SET
-                        subreddit = EXCLUDED.subreddit,
-                        title = EXCLUDED.title,
-                        selftext = EXCLUDED.selftext,
-                        author = EXCLUDED.author,
-                        created_utc = EXCLUDED.created_utc,
-                        score = EXCLUDED.score,
-                        num_comments = EXCLUDED.num_comments
-                ''')
-                with engine.begin() as conn:
-                    conn.execute(insert_sql, subs_batch)
-                inserted_counts['submissions'] += len(subs_batch)
-                subs_batch = []
+        report()
+        inserted_counts = sink.finish()
+        report()
+    except Exception as exc:
+        if checkpointer is not None:
+            status = "cancelled" if isinstance(exc, IngestCancelled) else "failed"
+            try:
+                checkpointer.finish(status, str(exc))
+            except Exception as cp_exc:
+                print(f"[import] Could not record {status} checkpoint for {schema_name}: {cp_exc}")
+        raise
+    finally:
+        sink.close()
 
-        else:
-            subreddit = data.get('subreddit')
-            if filter_list and subreddit and subreddit.lower() not in filter_list:
-                continue
+    if checkpointer is not None:
+        inserted_counts[table] += resumed_rows
 
-            link_id = data.get('link_id', '').replace('t3_', '')
-            parent_id = data.get('parent_id', '')
-
-            comm_batch.append({
-                'id': data.get('id'),
-                'subreddit': subreddit,
-                'body': data.get('body'),
-                'author': data.get('author'),
-                'created_utc': data.get('created_utc'),
-                'score': data.get('score'),
-                'link_id': link_id,
-                'parent_id': parent_id,
-            })
-
-            if len(comm_batch) >= batch_size:
-                insert_sql = text(f'''
-                    INSERT INTO "{schema_name}"."comments"
-                    (id, subreddit, body, author, created_utc, score, link_id, parent_id)
-                    VALUES (:id, :subreddit, :body, :author, :created_utc, :score, :link_id, :parent_id)
-                    ON CONFLICT (id) DO UPDATE SET
-                        subreddit = EXCLUDED.subreddit,
-                        body = EXCLUDED.body,
-                        author = EXCLUDED.author,
-                        created_utc = EXCLUDED.created_utc,
-                        score = EXCLUDED.score,
-                        link_id = EXCLUDED.link_id,
-                        parent_id = EXCLUDED.parent_id
-                ''')
-                with engine.begin() as conn:
-                    conn.execute(insert_sql, comm_batch)
-                inserted_counts['comments'] += len(comm_batch)
-                comm_batch = []
-
-    # flush remaining
-    if subs_batch:
-        insert_sql = text(f'''
-            INSERT INTO "{schema_name}"."submissions"
-            (id, subreddit, title, selftext, author, created_utc, score, num_comments)
-            VALUES (:id, :subreddit, :title, :selftext, :author, :created_utc, :score, :num_comments)
-            ON CONFLICT (id) DO UPDATE SET
-                subreddit = EXCLUDED.subreddit,
-                title = EXCLUDED.title,
-                selftext = EXCLUDED.selftext,
-                author = EXCLUDED.author,
-                created_utc = EXCLUDED.created_utc,
-                score = EXCLUDED.score,
-                num_comments = EXCLUDED.num_comments
-        ''')
-        with engine.begin() as conn:
-            conn.execute(insert_sql, subs_batch)
-        inserted_counts['submissions'] += len(subs_batch)
-
-    if comm_batch:
-        insert_sql = text(f'''
-            INSERT INTO "{schema_name}"."comments"
-            (id, subreddit, body, author, created_utc, score, link_id, parent_id)
-            VALUES (:id, :subreddit, :body, :author, :created_utc, :score, :link_id, :parent_id)
-            ON CONFLICT (id) DO UPDATE SET
-                subreddit = EXCLUDED.subreddit,
-                body = EXCLUDED.body,
-                author = EXCLUDED.author,
-                created_utc = EXCLUDED.created_utc,
-                score = EXCLUDED.score,
-                link_id = EXCLUDED.link_id,
-                parent_id = EXCLUDED.parent_id
-        ''')
-        with engine.begin() as conn:
-            conn.execute(insert_sql, comm_batch)
-        inserted_counts['comments'] += len(comm_batch)
+    finalize_seconds = None
+    if deferred and finalize:
+        finalize_started = time.monotonic()
+        try:
+            finalized = finalize_file_tables(schema_name)
+        except Exception as exc:
+            # Resuming re-runs the finalize step after a no-op load
+            if checkpointer is not None:
+                checkpointer.finish("failed", str(exc))
+            raise
+        finalize_seconds = round(time.monotonic() - finalize_started, 3)
+        inserted_counts[table] = finalized[table]
+
+    if checkpointer is not None:
+        checkpointer.finish("completed")
 
+    elapsed = time.monotonic() - started
+    rows_per_sec = sink.rows_loaded / elapsed if elapsed > 0 else 0.0
+    mode = f"{loader} loader" + (f", {workers} parse workers" if workers > 1 else "")
+    print(f"[import] {mode}: {sink.rows_loaded} rows into {schema_name} in {elapsed:.1f}s ({rows_per_sec:.0f} rows/s)")
+    inserted_counts['stats'] = {
+        'loader': loader,
+        'format': input_format,
+        'workers': max(workers, 1),
+        'deferred': deferred,
+        'finalize_seconds': finalize_seconds,
+        'rows_loaded': sink.rows_loaded,
+        'elapsed_seconds': round(elapsed, 3),
+        'rows_per_sec': round(rows_per_sec, 1),
+    }
     return inserted_counts
@@ -0,0 +1,304 @@
+# Parse-stage helpers for dump ingestion. Nothing here touches the database,
+# so these functions can run in worker processes of the ingest pipeline.
+import json
+import math
+import re
+from functools import lru_cache
+
+try:
+    import orjson
+except ImportError:  # optional; the stdlib parser is used when missing
+    orjson = None
+
+SUBMISSION_COLUMNS = ("id", "subreddit", "title", "selftext", "author", "created_utc", "score", "num_comments")
+COMMENT_COLUMNS = ("id", "subreddit", "body", "author", "created_utc", "score", "link_id", "parent_id")
+TABLE_COLUMNS = {"submissions": SUBMISSION_COLUMNS, "comments": COMMENT_COLUMNS}
+INTEGER_COLUMNS = {"created_utc", "score", "num_comments"}
+
+
+def submission_row(data: dict) -> dict:
+    """Project a decoded submission line onto the `submissions` columns."""
+    external_url = data.get('url')
+    selftext = data.get('selftext')
+    if not selftext:
+        if not data.get('is_self') and external_url:
+            selftext = external_url
+        else:
+            selftext = None
+
+    return {
+        'id': data.get('id'),
+        'subreddit': data.get('subreddit'),
+        'title': data.get('title'),
+        'selftext': selftext,
+        'author': data.get('author'),
+        'created_utc': data.get('created_utc'),
+        'score': data.get('score'),
+        'num_comments': data.get('num_comments'),
+    }
+
+
+def comment_row(data: dict) -> dict:
+    """Project a decoded comment line onto the `comments` columns."""
+    return {
+        'id': data.get('id'),
+        'subreddit': data.get('subreddit'),
+        'body': data.get('body'),
+        'author': data.get('author'),
+        'created_utc': data.get('created_utc'),
+        'score': data.get('score'),
+        'link_id': data.get('link_id', '').replace('t3_', ''),
+        'parent_id': data.get('parent_id', ''),
+    }
+
+
+# Bodies Reddit substitutes for deleted or moderator-removed content
+DELETED_TEXTS = frozenset(("[deleted]", "[removed]"))
+DELETED_MODES = ("keep", "drop", "null")
+FILTER_SPEC_KEYS = (
+    "created_utc_min", "created_utc_max", "min_score",
+    "authors", "exclude_authors", "deleted", "min_text_length",
+)
+
+
+def parse_filter_spec(spec) -> dict:
+    """Validate a row filter spec and return it normalized; raises ValueError.
+
+    Keys (all optional):
+        created_utc_min / created_utc_max: inclusive epoch-second bounds
+        min_score: lowest score kept
+        authors: keep only these authors; exclude_authors: drop these
+            (both case-insensitive)
+        deleted: what to do with "[deleted]"/"[removed]" text: 'keep'
+            (default), 'drop' the row, or 'null' the text and keep the row
+        min_text_length: shortest text kept, measured on the comment body or
+            on the submission title plus selftext
+    """
+    if not spec:
+        return {}
+    if not isinstance(spec, dict):
+        raise ValueError("filters must be a JSON object")
+    unknown = sorted(set(spec) - set(FILTER_SPEC_KEYS))
+    if unknown:
+        raise ValueError(f"Unknown filter keys: {', '.join(unknown)}")
+
+    normalized = {}
+    for key in ("created_utc_min", "created_utc_max", "min_score", "min_text_length"):
+        value = spec.get(key)
+        if value is None:
+            continue
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise ValueError(f"{key} must be a number")
+        # json.loads accepts Infinity and NaN, which int() cannot convert
+        if not math.isfinite(value):
+            raise ValueError(f"{key} must be a finite number")
+        normalized[key] = int(value)
+    if normalized.get("created_utc_min", 0) > normalized.get("created_utc_max", float("inf")):
+        raise ValueError("created_utc_min is after created_utc_max")
+
+    for key in ("authors", "exclude_authors"):
+        value = spec.get(key)
+        if value is None:
+            continue
+        if not isinstance(value, list) or not all(isinstance(a, str) for a in value):
+            raise ValueError(f"{key} must be a list of author names")
+        if value:
+            normalized[key] = sorted({a.lower() for a in value})
+
+    deleted = spec.get("deleted") or "keep"
+    if deleted not in DELETED_MODES:
+        raise ValueError(f"deleted must be one of: {', '.join(DELETED_MODES)}")
+    if deleted != "keep":
+        normalized["deleted"] = deleted
+    return normalized
+
+
+def _as_int(value):
+    try:
+        return int(float(value))
+    except (TypeError, ValueError, OverflowError):
+        return None
+
+
+def compile_row_filter(spec, data_type: str):
+    """Build a function mapping a projected row to itself, an edited copy or None.
+
+    `spec` is a (normalized) filter spec, see parse_filter_spec. Returns None
+    when the spec filters nothing. Rows whose created_utc or score cannot be
+    read are dropped by the corresponding bound.
+    """
+    spec = parse_filter_spec(spec)
+    if not spec:
+        return None
+    text_columns = ("body",) if data_type == "comments" else ("title", "selftext")
+    created_min = spec.get("created_utc_min")
+    created_max = spec.get("created_utc_max")
+    min_score = spec.get("min_score")
+    authors = frozenset(spec["authors"]) if "authors" in spec else None
+    exclude_authors = frozenset(spec.get("exclude_authors", ()))
+    deleted = spec.get("deleted", "keep")
+    min_text_length = spec.get("min_text_length")
+
+    def row_filter(row):
+        if created_min is not None or created_max is not None:
+            created = _as_int(row.get("created_utc"))
+            if created is None:
+                return None
+            if created_min is not None and created < created_min:
+                return None
+            if created_max is not None and created > created_max:
+                return None
+        if min_score is not None:
+            score = _as_int(row.get("score"))
+            if score is None or score < min_score:
+                return None
+        if authors is not None or exclude_authors:
+            author = (row.get("author") or "").lower()
+            if authors is not None and author not in authors:
+                return None
+            if author in exclude_authors:
+                return None
+        if deleted != "keep":
+            for column in text_columns:
+                if row.get(column) in DELETED_TEXTS:
+                    if deleted == "drop":
+                        return None
+                    row = dict(row, **{column: None})
+        if min_text_length is not None:
+            length = sum(len(row.get(column) or "") for column in text_columns)
+            if length < min_text_length:
+                return None
+        return row
+
+    return row_filter
+
+
+def _csv_field(column: str, value) -> str:
+    if value is None:
+        return ""
+    if column in INTEGER_COLUMNS:
+        # Dumps mix ints, floats and numeric strings here; COPY is stricter than
+        # INSERT's implicit casts, so normalize and drop anything unparseable.
+        try:
+            return str(int(float(value)))
+        except (TypeError, ValueError, OverflowError):
+            return ""
+    if not isinstance(value, str):
+        value = str(value)
+    # Postgres text cannot hold NUL bytes.
+    return '"' + value.replace("\x00", "").replace('"', '""') + '"'
+
+
+def encode_csv_rows(columns, rows) -> str:
+    """Encode row dicts as Postgres CSV; NULL is unquoted empty, '' is quoted."""
+    return "".join(
+        ",".join(_csv_field(c, row.get(c)) for c in columns) + "\n"
+        for row in rows
+    )
+
+
+def loads_line(line):
+    """Decode one NDJSON line (bytes or str), preferring orjson when installed.
+
+    Invalid UTF-8 is dropped rather than rejected, matching the text reader's
+    errors='ignore' behaviour.
+    """
+    if orjson is not None:
+        try:
+            return orjson.loads(line)
+        except orjson.JSONDecodeError:
+            if isinstance(line, bytes):
+                line = line.decode('utf-8', errors='ignore')
+            return orjson.loads(line)
+    if isinstance(line, bytes):
+        line = line.decode('utf-8', errors='ignore')
+    return json.loads(line)
+
+
+@lru_cache(maxsize=32)
+def _subreddit_prefilter(names: tuple, binary: bool):
+    alternatives = "|".join(re.escape(name) for name in names)
+    # Matches any "subreddit" key whose value is one of the names, empty or
+    # null; the full parse then confirms the top-level value. Only the names
+    # are case-insensitive so the literal key prefix keeps the fast scan.
+    pattern = r'"subreddit"\s*:\s*(?:"(?i:' + alternatives + r')?"|null)'
+    key_pattern = r'"subreddit"\s*:'
+    tokens = ('"subreddit"', "\\u00", "{", "}")
+    if binary:
+        return re.compile(pattern.encode()), re.compile(key_pattern.encode()), tuple(t.encode() for t in tokens)
+    return re.compile(pattern), re.compile(key_pattern), tokens
+
+
+def subreddit_prefilter(filter_list, binary: bool = True):
+    """Return a predicate telling whether a raw line may pass the subreddit filter.
+
+    The check runs on the undecoded line (bytes, or str with binary=False).
+    It never rejects a line the full parse would keep: lines without a
+    "subreddit" key, or with an empty or null value, are candidates too,
+    because the subreddit filter keeps rows that have no subreddit. A line is
+    only rejected when the match fails on its one "subreddit" key and that
+    key is plainly the top-level one; anything less certain (several such
+    keys, one nested in an object or used as a value, or \\u00XX escapes that
+    could spell the key or a name) is left to the full parse. Returns None
+    when there is no filter.
+    """
+    if not filter_list:
+        return None
+    regex, key_regex, (key, escape, open_brace, close_brace) = _subreddit_prefilter(tuple(sorted(filter_list)), binary)
+    search = regex.search
+    key_at = key_regex.match
+
+    def may_match(line) -> bool:
+        if key not in line or search(line) is not None:
+            return True
+        at = line.find(key)
+        return (
+            line.count(key) != 1
+            or escape in line
+            or key_at(line, at) is None
+            # Braces opened before the key; 1 means it sits in the top-level object
+            or line.count(open_brace, 0, at) - line.count(close_brace, 0, at) != 1
+        )
+
+    return may_match
+
+
+def parse_block(block: bytes, data_type: str, filter_list=None, filter_spec=None):
+    """Parse a block of newline-separated dump lines into COPY-ready CSV.
+
+    Returns (lines_parsed, rows_kept, csv_payload). Lines that fail to decode
+    are skipped; `filter_list` holds lowercase subreddit names to keep and
+    `filter_spec` the row filters (see parse_filter_spec).
+    """
+    project = submission_row if data_type == 'submissions' else comment_row
+    columns = TABLE_COLUMNS['submissions' if data_type == 'submissions' else 'comments']
+    row_filter = compile_row_filter(filter_spec, 'submissions' if data_type == 'submissions' else 'comments')
+
+    may_match = subreddit_prefilter(filter_list)
+    lines_parsed = 0
+    rows = []
+    for line in block.split(b"\n"):
+        line = line.strip()
+        if not line:
+            continue
+        lines_parsed += 1
+        if may_match is not None and not may_match(line):
+            continue
+        try:
+            data = loads_line(line)
+        except Exception:
+            continue
+        if not isinstance(data, dict):
+            continue
+
+        subreddit = data.get('subreddit')
+        if filter_list and subreddit and subreddit.lower() not in filter_list:
+            continue
+        row = project(data)
+        if row_filter is not None:
+            row = row_filter(row)
+            if row is None:
+                continue
+        rows.append(row)
+
+    return lines_parsed, len(rows), encode_csv_rows(columns, rows)
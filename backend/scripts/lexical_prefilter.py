@@ -0,0 +1,90 @@
+# Local BM25 retrieval stage in front of LLM filtering. Rows are scored against
+# the filter prompt's terms (or user-supplied keywords) and only the best
+# candidates are sent to the model, so a prompt about a topic most rows never
+# mention costs a fraction of the tokens.
+import re
+import time
+
+import numpy as np
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+MAX_QUERY_TERMS = 64
+TOKEN_RE = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+# Function words and filter-prompt boilerplate that say nothing about the topic
+STOPWORDS = frozenset("""
+a about above after again against all am an and any are as at be because been before being below between both
+but by can could did do does doing down during each few for from further had has have having he her here hers
+him his how i if in into is it its itself just me more most my no nor not now of off on once only or other our
+ours out over own same she should so some such than that the their theirs them then there these they this those
+through to too under until up very was we were what when where which while who whom why will with would you your
+yours posts post comments comment reddit keep find filter filtering select only related relevant mention mentions
+mentioning discuss discussing discusses talk talking talks return show
+""".split())
+
+
+def tokenize(text: str):
+    return TOKEN_RE.findall((text or "").lower())
+
+
+def query_terms(query: str):
+    """Distinct non-stopword terms of a prompt or keyword list, in order."""
+    terms = []
+    for token in tokenize(query):
+        if token not in STOPWORDS and len(token) > 1 and token not in terms:
+            terms.append(token)
+    return terms[:MAX_QUERY_TERMS]
+
+
+def bm25_scores(texts, terms) -> np.ndarray:
+    """Okapi BM25 score of every text against the query terms.
+
+    Only query-term frequencies are counted while tokenizing; the scoring
+    itself is a (rows x terms) NumPy computation.
+    """
+    n = len(texts)
+    if n == 0 or not terms:
+        return np.zeros(n, dtype=np.float32)
+    columns = {term: i for i, term in enumerate(terms)}
+    tf = np.zeros((n, len(terms)), dtype=np.float32)
+    lengths = np.empty(n, dtype=np.float32)
+    for row, text in enumerate(texts):
+        tokens = tokenize(text)
+        lengths[row] = len(tokens)
+        for token in tokens:
+            column = columns.get(token)
+            if column is not None:
+                tf[row, column] += 1
+    df = np.count_nonzero(tf, axis=0)
+    idf = np.log1p((n - df + 0.5) / (df + 0.5)).astype(np.float32)
+    avgdl = float(lengths.mean()) or 1.0
+    norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths / avgdl)
+    return (tf * (BM25_K1 + 1) / (tf + norm[:, None])) @ idf
+
+
+def select_candidates(entries, terms, top_k: int = None, min_score: float = None):
+    """Keep the (id, text) entries worth sending to the LLM.
+
+    Entries must match at least one term; of those, the `top_k` best and/or
+    those scoring at least `min_score` are kept, in their original order.
+    Returns (kept entries, stats).
+    """
+    started = time.monotonic()
+    scores = bm25_scores([text for _, text in entries], terms)
+    keep = scores > 0
+    if min_score is not None:
+        keep &= scores >= min_score
+    if top_k is not None and np.count_nonzero(keep) > top_k:
+        ranked = np.where(keep, scores, -np.inf)
+        best = np.argpartition(-ranked, top_k - 1)[:top_k] if top_k > 0 else np.array([], dtype=int)
+        keep = np.zeros(len(entries), dtype=bool)
+        keep[best] = True
+    kept = [entry for entry, selected in zip(entries, keep) if selected]
+    stats = {
+        "rows": len(entries),
+        "candidates": len(kept),
+        "chars_before": sum(len(text) for _, text in entries),
+        "chars_after": sum(len(text) for _, text in kept),
+        "seconds": round(time.monotonic() - started, 3),
+    }
+    return kept, stats
@@ -0,0 +1,144 @@
+# Content-addressed cache of LLM completions, stored in the llm_cache table.
+# Re-running a filter, codebook or comparison on unchanged data returns the
+# stored response instead of paying for another API call. Entries are evicted
+# least recently used first once their total size exceeds
+# settings.llm_cache_max_bytes, and expire after llm_cache_ttl_seconds when set.
+import asyncio
+import hashlib
+import json
+import threading
+
+from sqlalchemy import text
+try:
+    from app.database import engine
+    from app.config import settings
+except Exception as exc:
+    try:
+        from backend.app.database import engine
+        from backend.app.config import settings
+    except Exception:
+        print("Failed", exc)
+        raise exc
+
+_counters = {"hits": 0, "misses": 0, "bypassed": 0, "stores": 0, "evicted": 0, "errors": 0}
+_lock = threading.Lock()
+
+
+def _count(name: str, n: int = 1):
+    with _lock:
+        _counters[name] += n
+
+
+def cache_key(model: str, system_prompt: str, user_prompt: str, temperature: float, options=None) -> str:
+    """sha256 over everything that shapes a completion; `options` holds extra request fields."""
+    material = json.dumps([model, system_prompt, user_prompt, temperature, options], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+def _lookup(key: str, validate=None):
+    ttl = settings.llm_cache_ttl_seconds
+    with engine.begin() as conn:
+        cached = conn.execute(text(
+            "SELECT response FROM llm_cache "
+            "WHERE key = :key AND (:ttl <= 0 OR created_at > now() - make_interval(secs => :ttl))"
+        ), {"key": key, "ttl": ttl}).scalar()
+        # A stored response the caller rejects is left as it is; the fresh
+        # response that follows replaces it.
+        if cached is None or not _usable(cached, validate):
+            return None
+        conn.execute(text("UPDATE llm_cache SET hits = hits + 1, last_used_at = now() WHERE key = :key"), {"key": key})
+    return cached
+
+
+def _store(key: str, model: str, response: str):
+    with engine.begin() as conn:
+        conn.execute(text(
+            "INSERT INTO llm_cache (key, model, response, size_bytes, hits, created_at, last_used_at) "
+            "VALUES (:key, :model, :response, :size, 0, now(), now()) "
+            "ON CONFLICT (key) DO UPDATE SET response = EXCLUDED.response, size_bytes = EXCLUDED.size_bytes, "
+            "created_at = now(), last_used_at = now()"
+        ), {"key": key, "model": model, "response": response, "size": len(response.encode("utf-8"))})
+        # Stores follow a paid API call, so a full eviction pass here is cheap
+        # in comparison and keeps the table within its bounds at all times.
+        evicted = conn.execute(text(
+            "DELETE FROM llm_cache WHERE key IN ("
+            "  SELECT key FROM ("
+            "    SELECT key, created_at, sum(size_bytes) OVER (ORDER BY last_used_at DESC, key) AS retained"
+            "    FROM llm_cache"
+            "  ) ranked"
+            "  WHERE retained > :max_bytes OR (:ttl > 0 AND created_at <= now() - make_interval(secs => :ttl))"
+            ")"
+        ), {"max_bytes": settings.llm_cache_max_bytes, "ttl": settings.llm_cache_ttl_seconds}).rowcount
+    return evicted
+
+
+def _cached_response(key: str, use_cache: bool, validate=None):
+    if not use_cache:
+        _count("bypassed")
+        return None
+    try:
+        cached = _lookup(key, validate)
+    except Exception as exc:
+        _count("errors")
+        print(f"Warning: LLM cache lookup failed: {exc}")
+        cached = None
+    _count("hits" if cached is not None else "misses")
+    return cached
+
+
+def _cache_response(key: str, model: str, response):
+    if not isinstance(response, str) or not response:
+        return
+    try:
+        _count("evicted", _store(key, model, response))
+        _count("stores")
+    except Exception as exc:
+        _count("errors")
+        print(f"Warning: could not store LLM response in cache: {exc}")
+
+
+def _usable(response, validate) -> bool:
+    if validate is None:
+        return True
+    try:
+        validate(response)
+    except Exception:
+        return False
+    return True
+
+
+async def acached_completion(model: str, system_prompt: str, user_prompt: str, temperature: float, complete,
+                             use_cache: bool = True, options=None, validate=None) -> str:
+    """Return the cached response for this request, or await `complete()` and cache it.
+
+    With `use_cache=False` the lookup is skipped but the fresh response still
+    replaces the stored one. Cache failures are logged and never fail the
+    request; empty responses are not cached, nor are responses for which
+    `validate(response)` raises (a stored one that fails it counts as a
+    miss and is not marked as used), so a bad answer is requested again
+    next time. The table is accessed from a worker thread so the event loop
+    is never blocked on it.
+    """
+    if not settings.llm_cache_enabled:
+        return await complete()
+    key = cache_key(model, system_prompt, user_prompt, temperature, options)
+    cached = await asyncio.to_thread(_cached_response, key, use_cache, validate)
+    if cached is not None:
+        return cached
+    response = await complete()
+    if _usable(response, validate):
+        await asyncio.to_thread(_cache_response, key, model, response)
+    return response
+
+
+def cache_stats() -> dict:
+    """Counters since process start plus the table's current entries and size."""
+    with _lock:
+        stats = dict(_counters)
+    lookups = stats["hits"] + stats["misses"]
+    stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else None
+    with engine.connect() as conn:
+        entries, size = conn.execute(text("SELECT count(*), coalesce(sum(size_bytes), 0) FROM llm_cache")).one()
+    stats.update(entries=int(entries), size_bytes=int(size), max_bytes=settings.llm_cache_max_bytes,
+                 ttl_seconds=settings.llm_cache_ttl_seconds)
+    return stats
@@ -0,0 +1,105 @@
+# Shared async client for the OpenRouter chat completions of the LLM scripts.
+# One AsyncOpenAI instance, and so one pool of HTTP connections, serves every
+# call; per-user API keys are applied with with_options(), which reuses the
+# same HTTP client. Callers await completions, so the event loop keeps serving
+# other requests while a slow completion is in flight.
+import asyncio
+from openai import AsyncOpenAI
+try:
+    from scripts.llm_cache import acached_completion
+except Exception as exc:
+    try:
+        from backend.scripts.llm_cache import acached_completion
+    except Exception:
+        print("Failed", exc)
+        raise exc
+
+OPENROUTER_URL = "https://openrouter.ai/api/v1"
+LLM_TIMEOUT_SECONDS = 300
+MAX_RETRIES = 3
+INITIAL_RETRY_DELAY = 2
+DEFAULT_TEMPERATURE = 0.05
+
+_client = None
+
+
+def shared_client(api_key: str) -> AsyncOpenAI:
+    """The process-wide AsyncOpenAI client, bound to `api_key`."""
+    global _client
+    if _client is None:
+        # Retries are handled in _request_completion with the scripts' backoff
+        _client = AsyncOpenAI(api_key=api_key, base_url=OPENROUTER_URL, timeout=LLM_TIMEOUT_SECONDS, max_retries=0)
+    return _client.with_options(api_key=api_key)
+
+
+async def close_shared_client():
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
+
+
+def response_text(response) -> str:
+    """Extract the message text from a chat completion response."""
+    if not response:
+        raise ValueError("Empty response from model")
+    try:
+        # openai-like object: response.choices[0].message.content
+        return response.choices[0].message.content
+    except Exception:
+        pass
+    try:
+        # dict-like: response['choices'][0]['message']['content']
+        return response["choices"][0]["message"]["content"]
+    except Exception:
+        pass
+    try:
+        # older-style: response.choices[0].text
+        return response.choices[0].text
+    except Exception:
+        pass
+    raise ValueError(f"Unexpected model response format: {repr(response)}")
+
+
+async def _request_completion(model: str, system_prompt: str, user_prompt: str, api_key: str,
+                              temperature: float, transforms) -> str:
+    client = shared_client(api_key)
+    for attempt in range(1, MAX_RETRIES + 1):
+        try:
+            response = await client.chat.completions.create(
+                model=model,
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": user_prompt},
+                ],
+                temperature=temperature,
+                extra_body={"transforms": list(transforms)},
+            )
+            return response_text(response)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            if attempt == MAX_RETRIES:
+                raise
+            wait_time = INITIAL_RETRY_DELAY * (2 ** (attempt - 1))
+            print(f"\nAPI call failed (attempt {attempt}/{MAX_RETRIES}): {type(e).__name__}")
+            print(f"Retrying in {wait_time}s...")
+            await asyncio.sleep(wait_time)
+
+
+async def chat_completion(model: str, system_prompt: str, user_prompt: str, api_key: str,
+                          temperature: float = DEFAULT_TEMPERATURE, transforms=("middle-out",),
+                          use_cache: bool = True, validate=None) -> str:
+    """Return the completion text for one system + user prompt pair.
+
+    Responses go through the LLM cache (scripts.llm_cache); `use_cache=False`
+    skips the lookup, and responses `validate` rejects are not cached.
+    Failed calls are retried MAX_RETRIES times with exponential backoff.
+    """
+    if not api_key:
+        raise ValueError("OpenRouter API key is required")
+    return await acached_completion(
+        model, system_prompt, user_prompt, temperature,
+        lambda: _request_completion(model, system_prompt, user_prompt, api_key, temperature, transforms),
+        use_cache=use_cache, options={"transforms": list(transforms)}, validate=validate,
+    )
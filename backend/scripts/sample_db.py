@@ -0,0 +1,157 @@
+# Reproducible, optionally stratified random samples of file tables. Rows are
+# ranked by an md5 of the seed and their id, so a sample depends only on the
+# seed and the table contents, never on physical row order. Strata get rows in
+# proportion to their size; TABLESAMPLE can thin very large tables first.
+from sqlalchemy import text
+try:
+    from app.database import engine
+    from app.catalog import schema_tables
+except Exception as exc:
+    try:
+        from backend.app.database import engine
+        from backend.app.catalog import schema_tables
+    except Exception:
+        print("Failed", exc)
+        raise exc
+
+SAMPLE_TABLES = ("submissions", "comments")
+# 'hash' ranks every row; 'bernoulli' and 'system' first read a TABLESAMPLE of
+# about SAMPLE_OVERSAMPLE times the requested size (faster on big tables, but
+# only reproducible while the table is unchanged)
+SAMPLE_METHODS = ("hash", "bernoulli", "system")
+SAMPLE_STRATA = ("subreddit", "time")
+TIME_BUCKETS = ("day", "week", "month", "year")
+SAMPLE_MAX_ROWS = 100000
+SAMPLE_OVERSAMPLE = 4
+SAMPLE_SPEC_KEYS = ("size", "tables", "strata", "time_bucket", "seed", "method")
+
+
+def parse_sample_spec(spec) -> dict:
+    """Validate a sample spec and return it normalized; raises ValueError.
+
+    Keys:
+        size: rows to draw per table (required, at most SAMPLE_MAX_ROWS)
+        tables: file tables to sample, default both
+        strata: any of 'subreddit' and 'time'; rows are allocated to each
+            stratum in proportion to its size
+        time_bucket: width of the 'time' strata, one of TIME_BUCKETS
+            (default 'month')
+        seed: integer; the same seed draws the same sample (default 0)
+        method: one of SAMPLE_METHODS (default 'hash')
+    """
+    if not isinstance(spec, dict):
+        raise ValueError("sample must be a JSON object")
+    unknown = sorted(set(spec) - set(SAMPLE_SPEC_KEYS))
+    if unknown:
+        raise ValueError(f"Unknown sample keys: {', '.join(unknown)}")
+
+    size = spec.get("size")
+    if isinstance(size, bool) or not isinstance(size, int) or not 0 < size <= SAMPLE_MAX_ROWS:
+        raise ValueError(f"size must be an integer between 1 and {SAMPLE_MAX_ROWS}")
+
+    tables = spec.get("tables") or list(SAMPLE_TABLES)
+    if not isinstance(tables, list) or not tables or any(t not in SAMPLE_TABLES for t in tables):
+        raise ValueError(f"tables must be a list of: {', '.join(SAMPLE_TABLES)}")
+
+    strata = spec.get("strata") or []
+    if not isinstance(strata, list) or any(s not in SAMPLE_STRATA for s in strata):
+        raise ValueError(f"strata must be a list of: {', '.join(SAMPLE_STRATA)}")
+
+    time_bucket = spec.get("time_bucket") or "month"
+    if time_bucket not in TIME_BUCKETS:
+        raise ValueError(f"time_bucket must be one of: {', '.join(TIME_BUCKETS)}")
+
+    seed = spec.get("seed", 0)
+    if isinstance(seed, bool) or not isinstance(seed, int):
+        raise ValueError("seed must be an integer")
+
+    method = spec.get("method") or "hash"
+    if method not in SAMPLE_METHODS:
+        raise ValueError(f"method must be one of: {', '.join(SAMPLE_METHODS)}")
+
+    return {
+        "size": size,
+        "tables": [t for t in SAMPLE_TABLES if t in tables],
+        "strata": [s for s in SAMPLE_STRATA if s in strata],
+        "time_bucket": time_bucket,
+        "seed": seed,
+        "method": method,
+    }
+
+
+def _estimated_rows(conn, schema_name: str, table: str) -> int:
+    estimate = conn.execute(
+        text("SELECT reltuples FROM pg_class WHERE oid = to_regclass(:rel)"),
+        {"rel": f'"{schema_name}"."{table}"'},
+    ).scalar()
+    return int(estimate) if estimate and estimate > 0 else 0
+
+
+def sample_query(conn, schema_name: str, table: str, spec: dict, columns=None):
+    """Build the (sql, params) selecting a sample of one file table.
+
+    `spec` is a normalized sample spec. Strata whose column the table lacks
+    (filtered files keep only id and text) are ignored. Rows come back with
+    `columns` (default: every column of the table) in sample order.
+    """
+    available = schema_tables(schema_name, conn).get(table, frozenset())
+    if columns is None:
+        columns = sorted(available)
+    partition = []
+    if "subreddit" in spec["strata"] and "subreddit" in available:
+        partition.append("lower(subreddit)")
+    if "time" in spec["strata"] and "created_utc" in available:
+        partition.append(f"date_trunc('{spec['time_bucket']}', to_timestamp(created_utc) AT TIME ZONE 'UTC')")
+    partition_sql = f"PARTITION BY {', '.join(partition)} " if partition else ""
+
+    params = {"seed": f"{spec['seed']}:", "size": spec["size"]}
+    tablesample = ""
+    if spec["method"] != "hash":
+        estimate = _estimated_rows(conn, schema_name, table)
+        percent = 100.0 * spec["size"] * SAMPLE_OVERSAMPLE / estimate if estimate else 100.0
+        if percent < 100.0:
+            tablesample = f" TABLESAMPLE {spec['method'].upper()} (:percent) REPEATABLE (:repeat)"
+            params.update(percent=percent, repeat=spec["seed"])
+
+    column_list = ", ".join(f'"{c}"' for c in columns)
+    # Each row's position within its stratum, scaled to 0..1, interleaves the
+    # strata so that any prefix of the order is a proportional allocation.
+    sql = f'''
+        SELECT {column_list} FROM (
+            SELECT src.*, md5(:seed || src.id) AS sample_key,
+                   row_number() OVER ({partition_sql}ORDER BY md5(:seed || src.id)) AS stratum_rank,
+                   count(*) OVER ({partition_sql.strip()}) AS stratum_rows
+            FROM "{schema_name}"."{table}" src{tablesample}
+        ) ranked
+        ORDER BY (stratum_rank - 0.5) / stratum_rows, sample_key
+        LIMIT :size
+    '''
+    return text(sql), params
+
+
+def materialize_sample(source_schema: str, target_schema: str, spec: dict) -> dict:
+    """Copy a sample of `source_schema` into the new schema `target_schema`.
+
+    The sampled tables keep the source's columns, key and indexes. Returns the
+    number of rows written per table.
+    """
+    counts = {}
+    with engine.begin() as conn:
+        tables = schema_tables(source_schema, conn)
+        conn.execute(text(f'CREATE SCHEMA "{target_schema}"'))
+        for table in spec["tables"]:
+            if table not in tables:
+                continue
+            columns = sorted(tables[table])
+            conn.execute(text(
+                f'CREATE TABLE "{target_schema}"."{table}" (LIKE "{source_schema}"."{table}" INCLUDING ALL)'
+            ))
+            select_sql, params = sample_query(conn, source_schema, table, spec, columns)
+            column_list = ", ".join(f'"{c}"' for c in columns)
+            result = conn.execute(
+                text(f'INSERT INTO "{target_schema}"."{table}" ({column_list}) {select_sql.text}'),
+                params,
+            )
+            counts[table] = result.rowcount
+            conn.execute(text(f'ANALYZE "{target_schema}"."{table}"'))
+    return counts
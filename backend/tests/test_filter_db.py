@@ -0,0 +1,27 @@
+from scripts.filter_db import CHARS_PER_TOKEN, chunk_rows, parse_id_array
+
+
+def test_chunk_rows_keeps_order_within_the_budget():
+    entries = [(str(i), "x" * 30) for i in range(10)]
+    chunks = chunk_rows(entries, max_tokens=100 // CHARS_PER_TOKEN)
+
+    assert [len(chunk) for chunk in chunks] == [3, 3, 3, 1]
+    assert [row for chunk in chunks for row in chunk] == entries
+    assert chunk_rows([]) == []
+
+
+def test_chunk_rows_cuts_an_oversized_row_into_its_own_chunk():
+    max_chars = 10 * CHARS_PER_TOKEN
+    entries = [("small", "x" * 5), ("big", "y" * (max_chars * 3)), ("after", "z" * 5)]
+    chunks = chunk_rows(entries, max_tokens=10)
+
+    assert [[row_id for row_id, _ in chunk] for chunk in chunks] == [["small"], ["big"], ["after"]]
+    big_text = chunks[1][0][1]
+    assert len(big_text) <= max_chars
+    assert big_text.startswith("yyy") and big_text.endswith("...\n\n")
+
+
+def test_parse_id_array_finds_the_ids():
+    assert parse_id_array('Matches: ["abc12", "def34"]') == ["abc12", "def34"]
+    assert parse_id_array("```\n['a1']\n```") == ["a1"]
+    assert parse_id_array("[ ]") == []
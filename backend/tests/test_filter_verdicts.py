@@ -0,0 +1,74 @@
+import asyncio
+import re
+
+import scripts.filter_db as filter_db
+
+# One row per chunk: each title alone fills most of a chunk's budget
+ROW_CHARS = filter_db.FILTER_CHUNK_TOKENS * filter_db.CHARS_PER_TOKEN * 3 // 4
+
+RESPONSES = {
+    "empty": "",
+    "none": None,
+    "prose": "None of these posts match.",
+    "error": RuntimeError("upstream timeout"),
+    "match": "['match']",
+    "nomatch": "[]",
+}
+
+
+def entries(ids):
+    return [(row_id, filter_db.format_post({"id": row_id, "title": "x" * ROW_CHARS})) for row_id in ids]
+
+
+def run_filter(monkeypatch, ids, stored=None):
+    sent = []
+    recorded = []
+
+    async def fake_client(system_prompt, user_prompt, api_key, transforms=(), use_cache=True, validate=None):
+        row_ids = re.findall(r"ID: (\w+)\n", user_prompt)
+        sent.extend(row_ids)
+        response = RESPONSES[row_ids[0]]
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    def fake_record(schema, table, key, model, judged_ids, matched_ids):
+        recorded.append((sorted(judged_ids), sorted(matched_ids)))
+        return len(judged_ids)
+
+    monkeypatch.setattr(filter_db, "get_client", fake_client)
+    monkeypatch.setattr(filter_db, "stored_verdicts", lambda schema, table, key, model: dict(stored or {}))
+    monkeypatch.setattr(filter_db, "record_verdicts", fake_record)
+    result = asyncio.run(filter_db.filter_rows_incremental("cats", "posts", entries(ids), "key", "proj_test", "submissions"))
+    return result, sorted(sent), recorded
+
+
+def test_failed_or_empty_chunks_record_no_verdicts(monkeypatch):
+    result, sent, recorded = run_filter(monkeypatch, list(RESPONSES))
+
+    assert sent == sorted(RESPONSES)
+    assert recorded == [(["match", "nomatch"], ["match"])]
+    assert result["ids"] == ["match"]
+    assert result["failed_rows"] == 4
+    assert sorted(c["error"] is not None for c in result["chunks"]) == [False, False, True, True, True, True]
+
+
+def test_rows_without_a_verdict_are_sent_again(monkeypatch):
+    result, sent, recorded = run_filter(monkeypatch, list(RESPONSES), stored={"match": True, "nomatch": False})
+
+    assert sent == ["empty", "error", "none", "prose"]
+    assert recorded == [([], [])]
+    assert result["ids"] == ["match"]
+    assert result["verdicts_reused"] == 2
+    assert result["rows_sent"] == 4
+
+
+def test_parse_id_array_rejects_unusable_responses():
+    assert filter_db.parse_id_array("['a1', \"b2\"]") == ["a1", "b2"]
+    assert filter_db.parse_id_array("[]") == []
+    for response in ("", "   ", None, "None of these posts match."):
+        try:
+            filter_db.parse_id_array(response)
+        except ValueError:
+            continue
+        raise AssertionError(f"accepted {response!r}")
@@ -0,0 +1,40 @@
+import bz2
+import gzip
+import lzma
+
+import pytest
+import zstandard
+
+from scripts.import_db import UnsupportedInputFormat, detect_input_format, sniff_input_format
+
+LINES = b'{"id":"a","subreddit":"cats"}\n{"id":"b","subreddit":"dogs"}\n'
+
+
+def test_sniff_input_format_by_content(tmp_path):
+    dumps = {
+        "zstd": zstandard.ZstdCompressor().compress(LINES),
+        "gzip": gzip.compress(LINES),
+        "bz2": bz2.compress(LINES),
+        "xz": lzma.compress(LINES),
+        "ndjson": LINES,
+    }
+    for fmt, data in dumps.items():
+        # The extension never decides the format
+        path = tmp_path / f"RC_2024-01.{fmt}.zst"
+        path.write_bytes(data)
+        assert sniff_input_format(path) == fmt
+
+
+def test_detect_input_format_plain_ndjson_heads():
+    assert detect_input_format(b'\n\n  {"id":"a"}') == "ndjson"
+    assert detect_input_format(b'\xef\xbb\xbf{"id":"a"}') == "ndjson"
+    assert detect_input_format(b"") is None
+    assert detect_input_format(b"id,subreddit\na,cats\n") is None
+    assert detect_input_format(b'[{"id":"a"}]') is None
+
+
+def test_sniff_input_format_rejects_other_files(tmp_path):
+    path = tmp_path / "RS_2024-01.zst"
+    path.write_bytes(b"PK\x03\x04 not a dump")
+    with pytest.raises(UnsupportedInputFormat):
+        sniff_input_format(path)
@@ -0,0 +1,96 @@
+import json
+
+from scripts.ingest_parse import parse_block, parse_filter_spec, subreddit_prefilter
+
+FILTER = {"cats"}
+
+# Lines the full parse keeps, some of which fool a plain search for the key
+KEPT = [
+    b'{"id":"a","subreddit":"cats"}',
+    b'{"id":"a","subreddit" :\t"Cats"}',
+    b'{"id":"a","subreddit":""}',
+    b'{"id":"a","subreddit":null}',
+    b'{"id":"a","body":"no subreddit key at all"}',
+    b'{"id":"a","body":"subreddit"}',
+    b'{"id":"a","x":{"subreddit":"dogs"}}',
+    b'{"id":"a","x":[{"subreddit":"dogs"}],"subreddit":"cats"}',
+    b'{"id":"a","subr\\u0065ddit":"cats","x":{"subreddit":"dogs"}}',
+    b'{"id":"a","subreddit":"c\\u0061ts"}',
+]
+
+# Lines whose only "subreddit" key is plainly the top-level one, with another name
+REJECTED = [
+    b'{"id":"a","subreddit":"dogs"}',
+    b'{"id":"a","gildings":{},"body":"{ unbalanced } }{","subreddit" : "catsanddogs"}',
+]
+
+
+def keeps(line):
+    subreddit = json.loads(line).get("subreddit")
+    return not subreddit or subreddit.lower() in FILTER
+
+
+def test_subreddit_prefilter_never_rejects_a_kept_line():
+    for binary in (True, False):
+        may_match = subreddit_prefilter(FILTER, binary=binary)
+        for line in KEPT:
+            assert keeps(line), line
+            assert may_match(line if binary else line.decode()), line
+
+
+def test_subreddit_prefilter_rejects_other_subreddits():
+    for binary in (True, False):
+        may_match = subreddit_prefilter(FILTER, binary=binary)
+        for line in REJECTED:
+            assert not keeps(line), line
+            assert not may_match(line if binary else line.decode()), line
+    assert subreddit_prefilter(set()) is None
+
+
+def test_parse_block_keeps_the_same_rows_as_the_full_parse():
+    block = b"\n".join(KEPT + REJECTED)
+    lines_parsed, rows_kept, _ = parse_block(block, "comments", FILTER)
+
+    assert lines_parsed == len(KEPT) + len(REJECTED)
+    assert rows_kept == len(KEPT)
+
+
+def test_parse_filter_spec_normalizes():
+    assert parse_filter_spec(None) == {}
+    assert parse_filter_spec({}) == {}
+    assert parse_filter_spec({
+        "created_utc_min": 1600000000.9,
+        "created_utc_max": 1700000000,
+        "min_score": -5,
+        "authors": ["Alice", "bob", "alice"],
+        "exclude_authors": [],
+        "deleted": "null",
+    }) == {
+        "created_utc_min": 1600000000,
+        "created_utc_max": 1700000000,
+        "min_score": -5,
+        "authors": ["alice", "bob"],
+        "deleted": "null",
+    }
+    assert parse_filter_spec({"deleted": "keep", "min_text_length": 20}) == {"min_text_length": 20}
+
+
+def test_parse_filter_spec_rejects_bad_specs():
+    bad_specs = [
+        ["min_score", 1],
+        {"subreddit": "cats"},
+        {"min_score": "10"},
+        {"min_score": True},
+        {"created_utc_min": 2, "created_utc_max": 1},
+        {"authors": "alice"},
+        {"authors": ["alice", 3]},
+        {"deleted": "hide"},
+    ]
+    # json.loads turns these into floats that int() cannot convert
+    bad_specs += [{"created_utc_min": json.loads(value)} for value in ("Infinity", "-Infinity", "NaN", "1e400")]
+    for spec in bad_specs:
+        try:
+            parse_filter_spec(spec)
+        except ValueError:
+            continue
+        raise AssertionError(f"accepted {spec!r}")
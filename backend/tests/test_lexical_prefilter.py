@@ -0,0 +1,36 @@
+from scripts.lexical_prefilter import query_terms, select_candidates
+
+ENTRIES = [
+    ("1", "My cat knocked the plant off the shelf"),
+    ("2", "Stock market outlook for next week"),
+    ("3", "Cat food recommendations? My cat is picky about cat food"),
+    ("4", "Weekend hiking photos"),
+    ("5", "Adopted a kitten and an older cat"),
+]
+
+
+def test_query_terms_drops_stopwords_and_duplicates():
+    assert query_terms("Posts about a cat, or cats, and the cat's food. Cat!") == ["cat", "cats", "cat's", "food"]
+    assert query_terms("") == []
+
+
+def test_select_candidates_keeps_matching_rows_in_order():
+    kept, stats = select_candidates(ENTRIES, ["cat"])
+
+    assert [row_id for row_id, _ in kept] == ["1", "3", "5"]
+    assert stats["rows"] == 5 and stats["candidates"] == 3
+    assert stats["chars_after"] < stats["chars_before"]
+
+
+def test_select_candidates_top_k_and_min_score():
+    kept, _ = select_candidates(ENTRIES, ["cat", "food"], top_k=1)
+    assert [row_id for row_id, _ in kept] == ["3"]
+
+    kept, _ = select_candidates(ENTRIES, ["cat"], top_k=0)
+    assert kept == []
+
+    kept, _ = select_candidates(ENTRIES, ["cat"], min_score=1e9)
+    assert kept == []
+
+    kept, stats = select_candidates([], ["cat"])
+    assert kept == [] and stats["rows"] == 0
@@ -0,0 +1,45 @@
+import pytest
+from fastapi import HTTPException
+
+from app.api.routes import _is_reply_cursor, _is_search_cursor, _reply_cursor_token, decode_page_token, encode_page_token
+
+
+def test_page_token_round_trips():
+    for cursors in (
+        {"submissions": "abc12", "comments": None},
+        {"comments": "zzé中"},
+        {"submissions": None, "comments": None},
+    ):
+        token = encode_page_token(cursors)
+        assert "=" not in token and "/" not in token and "+" not in token
+        assert decode_page_token(token) == cursors
+
+
+def test_search_and_reply_cursors_round_trip():
+    search = {"submissions": [0.0607927, "abc12"], "comments": None}
+    assert decode_page_token(encode_page_token(search), is_cursor=_is_search_cursor) == search
+
+    token = _reply_cursor_token({"id": "c1", "created_utc": 1700000000, "body": "ignored"})
+    assert decode_page_token(token, is_cursor=_is_reply_cursor) == {"comments": [1700000000, "c1"]}
+    token = _reply_cursor_token({"id": "c2", "created_utc": None})
+    assert decode_page_token(token, is_cursor=_is_reply_cursor) == {"comments": [None, "c2"]}
+
+
+def test_decode_page_token_rejects_bad_tokens():
+    bad_tokens = [
+        "",
+        "not base64!",
+        encode_page_token(["abc12"]),
+        encode_page_token({"users": "abc12"}),
+        encode_page_token({"comments": 12}),
+    ]
+    for token in bad_tokens:
+        with pytest.raises(HTTPException) as exc:
+            decode_page_token(token)
+        assert exc.value.status_code == 400
+
+    # A plain id cursor is not a valid search or reply cursor
+    with pytest.raises(HTTPException):
+        decode_page_token(encode_page_token({"comments": "abc12"}), is_cursor=_is_search_cursor)
+    with pytest.raises(HTTPException):
+        decode_page_token(encode_page_token({"comments": [True, "c1"]}), is_cursor=_is_reply_cursor)
@@ -0,0 +1,51 @@
+from scripts.sample_db import SAMPLE_MAX_ROWS, parse_sample_spec
+
+
+def test_parse_sample_spec_defaults():
+    assert parse_sample_spec({"size": 50}) == {
+        "size": 50,
+        "tables": ["submissions", "comments"],
+        "strata": [],
+        "time_bucket": "month",
+        "seed": 0,
+        "method": "hash",
+    }
+
+
+def test_parse_sample_spec_orders_tables_and_strata():
+    spec = parse_sample_spec({
+        "size": SAMPLE_MAX_ROWS,
+        "tables": ["comments", "submissions"],
+        "strata": ["time", "subreddit"],
+        "time_bucket": "week",
+        "seed": -3,
+        "method": "bernoulli",
+    })
+    assert spec["tables"] == ["submissions", "comments"]
+    assert spec["strata"] == ["subreddit", "time"]
+    assert (spec["size"], spec["time_bucket"], spec["seed"], spec["method"]) == (SAMPLE_MAX_ROWS, "week", -3, "bernoulli")
+
+
+def test_parse_sample_spec_rejects_bad_specs():
+    bad_specs = [
+        [50],
+        {},
+        {"size": 0},
+        {"size": SAMPLE_MAX_ROWS + 1},
+        {"size": 10.5},
+        {"size": True},
+        {"size": 10, "rows": 5},
+        {"size": 10, "tables": ["users"]},
+        {"size": 10, "tables": "comments"},
+        {"size": 10, "strata": ["author"]},
+        {"size": 10, "time_bucket": "hour"},
+        {"size": 10, "seed": "7"},
+        {"size": 10, "seed": False},
+        {"size": 10, "method": "random"},
+    ]
+    for spec in bad_specs:
+        try:
+            parse_sample_spec(spec)
+        except ValueError:
+            continue
+        raise AssertionError(f"accepted {spec!r}")
@@ -0,0 +1,119 @@
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+from app.uploads import DiskUpload, discard_uploads, receive_form_to_disk
+
+BOUNDARY = "qctboundary"
+
+
+class FakeRequest:
+    def __init__(self, body: bytes, chunk_size: int = None, fail_after: int = None):
+        self.headers = {"content-type": f"multipart/form-data; boundary={BOUNDARY}"}
+        self.body = body
+        self.chunk_size = chunk_size or len(body) or 1
+        self.fail_after = fail_after
+
+    async def stream(self):
+        for n, start in enumerate(range(0, len(self.body), self.chunk_size)):
+            if self.fail_after is not None and n == self.fail_after:
+                raise ConnectionError("client disconnected")
+            yield self.body[start:start + self.chunk_size]
+
+
+def multipart(parts, close=True) -> bytes:
+    body = b""
+    for name, value in parts:
+        body += f"--{BOUNDARY}\r\n".encode()
+        if isinstance(value, tuple):
+            filename, data = value
+            body += f'Content-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'.encode()
+            body += b"Content-Type: application/octet-stream\r\n\r\n" + data + b"\r\n"
+        else:
+            body += f'Content-Disposition: form-data; name="{name}"\r\n\r\n'.encode() + value.encode() + b"\r\n"
+    if close:
+        body += f"--{BOUNDARY}--\r\n".encode()
+    return body
+
+
+def receive(request, directory):
+    return asyncio.run(receive_form_to_disk(request, str(directory)))
+
+
+def read(upload: DiskUpload) -> bytes:
+    with open(upload.path, "rb") as fh:
+        return fh.read()
+
+
+def test_boundary_split_across_chunks(tmp_path):
+    data = b"0123456789" * 50
+    body = multipart([("data_type", "comments"), ("file", ("RC_test.zst", data))])
+
+    # Every chunk size splits some boundary or header line between two reads
+    for chunk_size in (1, 3, 7, len(BOUNDARY) + 1, 64):
+        form = receive(FakeRequest(body, chunk_size), tmp_path)
+        assert form["data_type"] == "comments"
+        assert form["file"].filename == "RC_test.zst"
+        assert read(form["file"]) == data
+        discard_uploads(form)
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_crlf_and_boundary_lookalikes_inside_file_data(tmp_path):
+    data = b"line one\r\nline two\r\n\r\n--" + BOUNDARY[:-1].encode() + b"\r\n--\r\n\r\n"
+    form = receive(FakeRequest(multipart([("file", ("dump.ndjson", data))]), 5), tmp_path)
+
+    assert read(form["file"]) == data
+    discard_uploads(form)
+
+
+def test_several_files_and_fields(tmp_path):
+    dumps = {"RS_2024-01.zst": b"submissions" * 100, "RC_2024-01.zst": b"comments" * 100, "RC_2024-02.zst": b""}
+    parts = [("files", (name, data)) for name, data in dumps.items()] + [("loader", "copy"), ("name", "January")]
+    form = receive(FakeRequest(multipart(parts), 16), tmp_path)
+
+    uploads = form.getlist("files")
+    assert [u.filename for u in uploads] == list(dumps)
+    assert [read(u) for u in uploads] == list(dumps.values())
+    assert all(u.path.endswith(".zst") and u.path.startswith(str(tmp_path)) for u in uploads)
+    assert form["loader"] == "copy" and form["name"] == "January"
+    assert len(list(tmp_path.iterdir())) == 3
+
+    discard_uploads(form)
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_missing_closing_boundary_is_rejected(tmp_path):
+    body = multipart([("data_type", "posts"), ("file", ("RS_test.zst", b"x" * 1000))], close=False)
+    # End the body inside the file part, as a dropped upload would
+    body = body[:-200]
+
+    with pytest.raises(HTTPException) as exc:
+        receive(FakeRequest(body, 100), tmp_path)
+    assert exc.value.status_code == 400
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_uploads_are_discarded_when_the_body_fails(tmp_path):
+    body = multipart([("files", ("RS_a.zst", b"a" * 500)), ("files", ("RC_b.zst", b"b" * 500))])
+
+    with pytest.raises(ConnectionError):
+        receive(FakeRequest(body, 100, fail_after=8), tmp_path)
+    assert list(tmp_path.iterdir()) == []
+
+    # A malformed header in the second part, after the first file was written
+    bad = multipart([("files", ("RS_a.zst", b"a" * 500))], close=False) + f"--{BOUNDARY}\r\nno colon here\r\n\r\n".encode()
+    with pytest.raises(HTTPException) as exc:
+        receive(FakeRequest(bad, 100), tmp_path)
+    assert exc.value.status_code == 400
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_non_multipart_body_is_rejected(tmp_path):
+    request = FakeRequest(b"{}")
+    request.headers = {"content-type": "application/json"}
+
+    with pytest.raises(HTTPException) as exc:
+        receive(request, tmp_path)
+    assert exc.value.status_code == 400
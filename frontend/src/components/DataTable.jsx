@@ -1,5 +1,5 @@
 import { useEffect, useState } from "react";
-import { apiFetch } from "../api";
+import { apiFetch, BASE_URL } from "../api";
 import EntryModal from "./EntryModal";
 import "../styles/DataTable.css";
 
@@ -20,6 +20,10 @@ export default function DataTable({
   const [limit, setLimit] = useState(10);
   const [searchTerm, setSearchTerm] = useState("");
   const [page, setPage] = useState(0);
+  // Keyset cursors: pageTokens[n] is the `after` token that loads page n
+  const [pageTokens, setPageTokens] = useState([null]);
+  // Comments of the submissions on the current page, keyed by submission id
+  const [threadComments, setThreadComments] = useState(null);
   const [selectedItems, setSelectedItems] = useState(new Set());
   const [projects, setProjects] = useState([]);
   const [targetDb, setTargetDb] = useState("");
@@ -40,13 +44,17 @@ export default function DataTable({
       const fetchLimit = isSearching ? MAX_SEARCH_FETCH : limit;
       const offset = page * limit;
       const offsetParam = isSearching ? 0 : offset;
+      const pageToken = isSearching ? null : pageTokens[page];
+      const pageParam = pageToken
+        ? `after=${encodeURIComponent(pageToken)}`
+        : `offset=${offsetParam}`;
       let response;
       const isProjectSchema = /^proj_[A-Za-z0-9_]+(?:\.db)?$/.test(
         String(currentDatabase) || ""
       );
       if (currentDatabase && isProjectSchema) {
         response = await apiFetch(
-          `/api/file-entries/?limit=${fetchLimit}&offset=${offsetParam}&schema=${encodeURIComponent(
+          `/api/file-entries/?limit=${fetchLimit}&${pageParam}&schema=${encodeURIComponent(
             String(currentDatabase)
           )}`
         );
@@ -61,6 +69,13 @@ export default function DataTable({
 
       const data = await response.json();
       setDbEntries(data);
+      if (!isSearching) {
+        setPageTokens((tokens) => {
+          const next = tokens.slice(0, page + 1);
+          next[page + 1] = data.next_after || null;
+          return next;
+        });
+      }
     } catch (err) {
       setError(`Error: ${err.message}`);
     } finally {
@@ -73,10 +88,49 @@ export default function DataTable({
     setPage(0);
   }, [database]);
 
+  useEffect(() => {
+    setPageTokens([null]);
+  }, [currentDatabase, limit, searchTerm]);
+
   useEffect(() => {
     fetchEntries();
   }, [currentDatabase, limit, searchTerm, page]);
 
+  // Load the comment threads of the whole page in one request so opening
+  // or stepping through posts in the modal needs no further round trips.
+  useEffect(() => {
+    setThreadComments(null);
+    const isSearching = (searchTerm || "").trim();
+    if (!dbEntries || isSearching) return;
+    const ids = (dbEntries.submissions || [])
+      .slice(0, limit)
+      .map((s) => s.id)
+      .filter(Boolean);
+    if (ids.length === 0) return;
+
+    let cancelled = false;
+    (async () => {
+      try {
+        const resp = await apiFetch(`/api/comments/batch/`, {
+          method: "POST",
+          headers: { "Content-Type": "application/json" },
+          body: JSON.stringify({
+            database: String(currentDatabase),
+            submission_ids: ids,
+          }),
+        });
+        if (!resp.ok) return;
+        const data = await resp.json();
+        if (!cancelled && data.comments) setThreadComments(data.comments);
+      } catch (err) {
+        console.error("Error prefetching comments:", err);
+      }
+    })();
+    return () => {
+      cancelled = true;
+    };
+  }, [dbEntries]);
+
   // Clear selections when view changes (new DB, page, limit, or search)
   useEffect(() => {
     setSelectedItems(new Set());
@@ -145,6 +199,18 @@ export default function DataTable({
     }
   };
 
+  // Exports stream straight from the server; the browser downloads them with
+  // the session cookie, so nothing is buffered in the page.
+  const handleExport = (value) => {
+    if (!value || !currentDatabase) return;
+    const [table, format] = value.split(":");
+    const schema = String(currentDatabase).replace(/\.db$/i, "");
+    const base = String(BASE_URL).replace(/\/+$/g, "");
+    window.location.href = `${base}/api/export/${encodeURIComponent(
+      schema
+    )}/${table}?format=${format}`;
+  };
+
   const displayDbName =
     currentDatabase && String(currentDatabase).trim()
       ? displayName || String(currentDatabase).replace(/\.db$/i, "")
@@ -488,6 +554,23 @@ export default function DataTable({
                   <option value={200}>200</option>
                 </select>
               </div>
+              <div className="limit-selector">
+                <label htmlFor="export-format">Export: </label>
+                <select
+                  id="export-format"
+                  value=""
+                  onChange={(e) => handleExport(e.target.value)}
+                  className="limit-select"
+                >
+                  <option value="">Choose...</option>
+                  <option value="submissions:ndjson">Posts (NDJSON)</option>
+                  <option value="submissions:csv">Posts (CSV)</option>
+                  <option value="submissions:zst">Posts (NDJSON.zst)</option>
+                  <option value="comments:ndjson">Comments (NDJSON)</option>
+                  <option value="comments:csv">Comments (CSV)</option>
+                  <option value="comments:zst">Comments (NDJSON.zst)</option>
+                </select>
+              </div>
             </div>
             <div style={{ display: "flex", alignItems: "center" }}>
               <input
@@ -717,10 +800,12 @@ export default function DataTable({
               className="btn btn-secondary"
               disabled={
                 !dbEntries ||
-                !(
-                  (dbEntries.total_submissions || 0) > (page + 1) * limit ||
-                  (dbEntries.total_comments || 0) > (page + 1) * limit
-                )
+                ((searchTerm || "").trim()
+                  ? !(
+                      (dbEntries.total_submissions || 0) > (page + 1) * limit ||
+                      (dbEntries.total_comments || 0) > (page + 1) * limit
+                    )
+                  : !dbEntries.next_after)
               }
             >
               Next
@@ -786,6 +871,7 @@ export default function DataTable({
         isOpen={showModal}
         onClose={closeModal}
         database={currentDatabase}
+        prefetchedComments={threadComments}
         onPrev={goToPrev}
         onNext={goToNext}
         hasPrev={currentIndex > 0}
@@ -7,6 +7,7 @@ export default function EntryModal({
   isOpen,
   onClose,
   database = "",
+  prefetchedComments = null,
   onPrev,
   onNext,
   hasPrev = false,
@@ -17,11 +18,15 @@ export default function EntryModal({
 
   useEffect(() => {
     if (isOpen && entry && entry.type === "submission") {
-      fetchComments(entry.id);
+      if (prefetchedComments && entry.id in prefetchedComments) {
+        setComments(prefetchedComments[entry.id]);
+      } else {
+        fetchComments(entry.id);
+      }
     } else {
       setComments([]);
     }
-  }, [isOpen, entry]);
+  }, [isOpen, entry, prefetchedComments]);
 
   const fetchComments = async (submissionId) => {
     try {
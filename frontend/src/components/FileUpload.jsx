@@ -2,6 +2,12 @@ import { useState, useEffect } from "react";
 import "../styles/FileUpload.css";
 import { apiFetch } from "../api";
 
+// The server detects the format from the file contents; this only guides the picker
+const DUMP_EXTENSIONS = [".zst", ".gz", ".bz2", ".xz", ".ndjson", ".jsonl", ".json"];
+const JOB_POLL_INTERVAL_MS = 2000;
+
+const sleep = (ms) => new Promise((resolve) => setTimeout(resolve, ms));
+
 export default function FileUpload({ onUploadSuccess, onView }) {
   const [file, setFile] = useState(null);
   const [loading, setLoading] = useState(false);
@@ -17,11 +23,12 @@ export default function FileUpload({ onUploadSuccess, onView }) {
 
   const handleFileChange = (e) => {
     const selectedFile = e.target.files[0];
-    if (selectedFile && selectedFile.name.endsWith(".zst")) {
+    const lowerName = selectedFile ? selectedFile.name.toLowerCase() : "";
+    if (selectedFile && DUMP_EXTENSIONS.some((ext) => lowerName.endsWith(ext))) {
       setFile(selectedFile);
       setError("");
     } else {
-      setError("Please select a .zst file");
+      setError("Please select a .zst, .gz, .bz2, .xz or NDJSON file");
       setFile(null);
     }
   };
@@ -49,6 +56,37 @@ export default function FileUpload({ onUploadSuccess, onView }) {
     setSubredditTags(subredditTags.filter((_, i) => i !== index));
   };
 
+  // Poll a background ingest job until it finishes, reporting progress as it goes
+  const waitForIngestJob = async (jobId) => {
+    while (true) {
+      await sleep(JOB_POLL_INTERVAL_MS);
+      const response = await apiFetch(`/api/ingest-jobs/${jobId}`);
+      if (!response.ok) {
+        throw new Error("Lost track of the import job");
+      }
+      const job = await response.json();
+      if (job.status === "completed") {
+        return job;
+      }
+      if (job.status === "failed") {
+        throw new Error(job.error || "Import failed");
+      }
+      if (job.status === "cancelled") {
+        throw new Error("Import was cancelled");
+      }
+      const pct = job.bytes_total
+        ? Math.floor((100 * job.bytes_read) / job.bytes_total)
+        : 0;
+      const eta =
+        job.eta_seconds != null ? `, ~${Math.ceil(job.eta_seconds)}s left` : "";
+      setMessage(
+        `📤 Importing: ${pct}% read, ${job.rows_inserted.toLocaleString()} rows inserted (${Math.round(
+          job.rows_per_sec
+        ).toLocaleString()} rows/s${eta})`
+      );
+    }
+  };
+
   const handleSubmit = async (e) => {
     e.preventDefault();
 
@@ -112,11 +150,14 @@ export default function FileUpload({ onUploadSuccess, onView }) {
       if (!text) {
         throw new Error("Empty response from server");
       }
-      const data = JSON.parse(text);
+      let data = JSON.parse(text);
       console.log("Parsed response data:", data);
 
-      if (data.status === "processing") {
+      if (data.status === "processing" && data.job_id) {
         setMessage("📤 File uploaded. Import processing in background...");
+        const job = await waitForIngestJob(data.job_id);
+        data = { ...data, ...job.result, status: "completed" };
+        setMessage("✓ Upload completed");
       } else {
         setMessage(data.message || "✓ Upload completed");
       }
@@ -181,11 +222,11 @@ export default function FileUpload({ onUploadSuccess, onView }) {
         <h2>Upload Data</h2>
         <form onSubmit={handleSubmit}>
           <div className="form-group">
-            <label htmlFor="zst-file">Upload .zst File</label>
+            <label htmlFor="zst-file">Upload Dump File</label>
             <input
               id="zst-file"
               type="file"
-              accept=".zst"
+              accept={DUMP_EXTENSIONS.join(",")}
               onChange={handleFileChange}
               disabled={loading}
             />